@@ -198,6 +198,7 @@ install -m0644 -D conf/copr-backend.sysusers.conf %{buildroot}%{_sysusersdir}/co
 
 %postun
 %systemd_postun_with_restart copr-backend-log.service
+%systemd_postun_with_restart copr-backend-createrepo.service
 %systemd_postun_with_restart copr-backend-build.service
 %systemd_postun_with_restart copr-backend-action.service
 
@@ -6,8 +6,6 @@ import time
 import traceback
 import base64
 
-from distutils.dir_util import copy_tree
-from distutils.errors import DistutilsFileError
 from urllib.request import urlretrieve
 from copr.exceptions import CoprRequestException
 from requests import RequestException
@@ -27,8 +25,8 @@ from .sign import create_user_keys, CoprKeygenRequestError
 from .exceptions import CreateRepoError, CoprSignError, FrontendClientException
 from .helpers import (get_redis_logger, silent_remove, ensure_dir_exists,
                       get_chroot_arch, format_filename,
-                      call_copr_repo, copy2_but_hardlink_rpms)
-from .sign import sign_rpms_in_dir, unsign_rpms_in_dir, get_pubkey
+                      call_copr_repo, copy2_but_hardlink_rpms, clone_tree)
+from .sign import get_pubkey, RpmSigner
 
 
 class Action(object):
@@ -206,7 +204,9 @@ class Fork(Action, GPGMixin):
                 # Put the new public key into forked build directory.
                 get_pubkey(data["user"], data["copr"], self.log, self.opts.sign_domain, pubkey_path)
 
-            chroot_paths = set()
+            chroot_dirs = {}  # new chroot path => list of the forked subdirs
+            incremental = {}  # new chroot path => createrepo --add is enough
+            forked = []  # tuples (dst_path, chroot)
             for chroot, src_dst_dir in builds_map.items():
 
                 if not chroot or not src_dst_dir:
@@ -220,7 +220,14 @@ class Fork(Action, GPGMixin):
 
                     old_chroot_path = os.path.join(old_path, chroot)
                     new_chroot_path = os.path.join(new_path, chroot)
-                    chroot_paths.add(new_chroot_path)
+                    if new_chroot_path not in incremental:
+                        # Either a fresh directory (the forked builds are all
+                        # it contains), or existing repodata we can update.
+                        incremental[new_chroot_path] = \
+                            not os.path.exists(new_chroot_path) or \
+                            os.path.exists(os.path.join(
+                                new_chroot_path, "repodata", "repomd.xml"))
+                    chroot_dirs.setdefault(new_chroot_path, [])
 
                     src_path = os.path.join(old_chroot_path, src_dir)
                     dst_path = os.path.join(new_chroot_path, dst_dir)
@@ -228,22 +235,28 @@ class Fork(Action, GPGMixin):
                     ensure_dir_exists(dst_path, self.log)
 
                     try:
-                        copy_tree(src_path, dst_path)
-                    except DistutilsFileError as e:
+                        clone_tree(src_path, dst_path)
+                    except (shutil.Error, OSError) as e:
                         self.log.error(str(e))
                         continue
 
-                    # Drop old signatures coming from original repo and re-sign.
-                    unsign_rpms_in_dir(dst_path, opts=self.opts, log=self.log)
-                    if sign:
-                        sign_rpms_in_dir(data["user"], data["copr"], dst_path,
-                                         chroot, opts=self.opts, log=self.log)
-
+                    chroot_dirs[new_chroot_path].append(dst_dir)
+                    forked.append((dst_path, chroot))
                     self.log.info("Forked build %s as %s", src_path, dst_path)
 
+            # Drop old signatures coming from original repo and re-sign.
+            errors = RpmSigner(self.opts, self.log).resign_dirs(
+                data["user"], data["copr"], forked, sign=sign)
+            if errors:
+                raise CoprSignError("Rpm re-sign failed, affected rpms: {}"
+                                    .format([err[0] for err in errors]))
+
+            # The RPM checksums changed (the results manifests are updated by
+            # RpmSigner), so the repodata need to be generated again.
             result = BackendResultEnum("success")
-            for chroot_path in chroot_paths:
-                if not call_copr_repo(chroot_path, logger=self.log):
+            for chroot_path, subdirs in chroot_dirs.items():
+                add = subdirs if incremental[chroot_path] else None
+                if not call_copr_repo(chroot_path, add=add, logger=self.log):
                     result = BackendResultEnum("failure")
 
         except (CoprSignError, CreateRepoError, CoprRequestException, IOError) as ex:
@@ -25,14 +25,18 @@ from copr_common.helpers import (
 
 from copr_backend.background_worker import BackendBackgroundWorker
 from copr_backend.cancellable_thread import CancellableThreadTask
-from copr_backend.constants import build_log_format
+from copr_backend.compress import LogCompressor
+from copr_backend.constants import (
+    PREFETCHED_TASK_REDIS_KEY,
+    build_log_format,
+)
 from copr_backend.exceptions import (
     CoprSignError,
     CoprBackendError,
     FrontendClientException,
 )
 from copr_backend.helpers import (
-    run_cmd, register_build_result, format_evr,
+    register_build_result, format_evr, write_results_manifest,
 )
 from copr_backend.job import BuildJob
 from copr_backend.msgbus import MessageSender
@@ -46,6 +50,10 @@ MAX_HOST_ATTEMPTS = 3
 MAX_SSH_ATTEMPTS = 5
 MIN_BUILDER_VERSION = "0.68.dev"
 CANCEL_CHECK_PERIOD = 5
+REPO_WAIT_TIMEOUT = 60
+# How often we check the storage directly when waiting for the repository,
+# we mostly rely on the RepoReadiness notifications.
+REPO_CHECK_PERIOD = 10
 DATETIME_FORMAT = "%Y-%m-%d %H:%M"
 
 MESSAGES = {
@@ -158,6 +166,7 @@ class BuildBackgroundWorker(BackendBackgroundWorker):
         self.canceled = False
         self.last_hostname = None
         self.storage = None
+        self.live_log_compressor = None
 
     @classmethod
     def adjust_arg_parser(cls, parser):
@@ -349,44 +358,89 @@ class BuildBackgroundWorker(BackendBackgroundWorker):
             # we don't need copr_base repodata for srpm builds
             return
 
-        waiting_since = time.time()
-        while time.time() - waiting_since < 60:
-            exists = self.storage.repository_exists(
-                self.job.project_dirname, self.job.chroot)
-            if exists:
-                return
+        readiness = self.storage.readiness
+        name = self.storage.readiness_name(self.job.project_dirname,
+                                           self.job.chroot)
+
+        with readiness.waiter(name) as waiter:
+            waiting_since = time.time()
+            checked = None
+            while True:
+                now = time.time()
+                waited = now - waiting_since
+                if waiter.wait(0):
+                    return
+
+                # The repository might have been created before we started
+                # using RepoReadiness, or the notification might get lost.
+                # Check the storage on the first, the last, and periodically
+                # in-between.
+                if checked is None or waited >= REPO_WAIT_TIMEOUT \
+                        or now - checked >= REPO_CHECK_PERIOD:
+                    checked = now
+                    exists = self.storage.repository_exists(
+                        self.job.project_dirname, self.job.chroot)
+                    if exists:
+                        readiness.mark_ready(name)
+                        return
+
+                if waited >= REPO_WAIT_TIMEOUT:
+                    break
 
-            # Either (a) the very first copr-repo run in this chroot dir
-            # is still running on background (or failed), or (b) we are
-            # hitting the race condition between
-            # 'rm -rf repodata && mv .repodata repodata' sequence that
-            # is done in createrepo_c.  Try again after some time.
-            self.log.info(MESSAGES["repo_waiting"])
-            time.sleep(2)
+                # Either (a) the very first copr-repo run in this chroot dir
+                # is still running on background (or failed), or (b) we are
+                # hitting the race condition between
+                # 'rm -rf repodata && mv .repodata repodata' sequence that
+                # is done in createrepo_c.  Block till notified, or till the
+                # next storage check.
+                self.log.info(MESSAGES["repo_waiting"])
+                if waiter.wait(min(REPO_CHECK_PERIOD,
+                                   REPO_WAIT_TIMEOUT - waited)):
+                    return
 
         # This should never happen, but if yes - we need to debug
         # properly.  Give up waiting, and fail the build.  That should
         # motivate people to report bugs.
         raise BackendError(MESSAGES["give_up_repo"])
 
+    def _get_prefetched_task(self, task_id):
+        """
+        Pick the build task record prefetched by the build dispatcher (see
+        RPMBuildWorkerManager.prepare_tasks()), if there's any.
+        """
+        if not self.has_wm:
+            return None
+        key = PREFETCHED_TASK_REDIS_KEY.format(task_id)
+        pipe = self._redis.pipeline()
+        pipe.get(key)
+        pipe.delete(key)
+        record, _ = pipe.execute()
+        if not record:
+            return None
+        self.log.info("Using the prefetched build task %s", task_id)
+        return json.loads(record)
+
     def _get_build_job(self):
         """
         Per self.args, obtain BuildJob instance.
         """
         if self.args.chroot == "srpm-builds":
-            target = "get-srpm-build-task/{}".format(self.args.build_id)
+            task_id = str(self.args.build_id)
+            target = "get-srpm-build-task/{}".format(task_id)
         else:
-            target = "get-build-task/{}-{}".format(self.args.build_id,
-                                                   self.args.chroot)
+            task_id = "{}-{}".format(self.args.build_id, self.args.chroot)
+            target = "get-build-task/{}".format(task_id)
 
-        try:
-            resp = self.frontend_client.get(target)
-        except FrontendClientException as ex:
-            self.log.error("Failed to download build info: %s", str(ex))
-            msg = "Failed to get the build task {}".format(target)
-            raise BackendError(msg) from ex
+        task = self._get_prefetched_task(task_id)
+        if not task:
+            try:
+                task = self.frontend_client.get(target).json()
+            except FrontendClientException as ex:
+                self.log.error("Failed to download build info: %s", str(ex))
+                msg = "Failed to get the build task {}".format(target)
+                raise BackendError(msg) from ex
 
-        self.job = BuildJob(resp.json(), self.opts)
+        self.job = BuildJob(task, self.opts)
         self.job.started_on = time.time()
         if not self.job.chroot:
             raise BackendError("Frontend job doesn't provide chroot")
@@ -541,15 +595,28 @@ class BuildBackgroundWorker(BackendBackgroundWorker):
             raise BackendError("copr-rpmbuild returned invalid PID "
                                "on stdout: {}".format(stdout))
 
+    def _log_compressor(self, src, follow=False):
+        return LogCompressor(src, self.log, follow=follow)
+
     def _tail_log_file(self):
         """ Return None if OK, or failure reason as str """
         live_cmd = "copr-rpmbuild-log"
         with open(self.job.builder_log, 'w') as logfile:
+            # The log file is re-written from scratch, start compressing it
+            # again (while it is being downloaded).
+            if self.live_log_compressor:
+                self.live_log_compressor.abort()
+            self.live_log_compressor = self._log_compressor(
+                self.job.builder_log, follow=True)
+            self.live_log_compressor.start()
             # We can not use 'max_retries' here because that would concatenate
             # the attempts to the same log file.
-            if self.ssh.run(live_cmd, stdout=logfile, stderr=logfile,
-                            subprocess_timeout=None):
-                return "{} shouldn't exit != 0".format(live_cmd)
+            try:
+                if self.ssh.run(live_cmd, stdout=logfile, stderr=logfile,
+                                subprocess_timeout=None):
+                    return "{} shouldn't exit != 0".format(live_cmd)
+            finally:
+                self.live_log_compressor.stop()
         return None
 
     def _retry_for_ssh_failures(self, method, *args, **kwargs):
@@ -592,8 +659,10 @@ class BuildBackgroundWorker(BackendBackgroundWorker):
 
     def _compress_logs(self):
         """
-        Compress builder-live.log, backend.log, and fedora-review.log using gzip.
-        Never raise any exception!
+        Compress builder-live.log, backend.log, and fedora-review.log using
+        gzip, in parallel threads.  The builder-live.log is already compressed
+        while it is downloaded (see _tail_log_file), so it is ready almost
+        immediately.  Never raise any exception!
         """
         logs = [
             self.job.builder_log,
@@ -629,13 +698,21 @@ class BuildBackgroundWorker(BackendBackgroundWorker):
         #     RewriteRule ^(.*)$ %{REQUEST_URI}.gz [R]
         #     </FilesMatch>
 
+        compressors = []
         for src in logs:
-            dest = src + ".gz"
-            if os.path.exists(dest):
-                # This shouldn't ever happen, but if it happened - gzip below
-                # would interactively ask whether we want to overwrite the
-                # existing file, and it would deadlock the worker.
-                self.log.error("Compressed log %s exists", dest)
+            compressor = None
+            if src == self.job.builder_log:
+                compressor = self.live_log_compressor
+                self.live_log_compressor = None
+            if not compressor:
+                compressor = self._log_compressor(src)
+
+            if os.path.exists(compressor.dest):
+                # This shouldn't ever happen, but if it happened - we don't
+                # want to overwrite the existing file.
+                self.log.error("Compressed log %s exists", compressor.dest)
+                if compressor.is_alive():
+                    compressor.abort()
                 continue
 
             if not os.path.exists(src) and src == self.job.review_log:
@@ -645,9 +722,24 @@ class BuildBackgroundWorker(BackendBackgroundWorker):
                 continue
 
             self.log.info("Compressing %s by gzip", src)
-            res = run_cmd(["gzip", src], logger=self.log)
-            if res.returncode not in [0, 2]:
-                self.log.error("Unable to compress file %s", src)
+            if not compressor.is_alive() and compressor.ident is None:
+                compressor.start()
+            compressors.append(compressor)
+
+        for compressor in compressors:
+            compressor.finish()
+
+    def _write_results_manifest(self):
+        """
+        List the final contents of the results directory (after the logs are
+        compressed) for the clients, see RESULTS_MANIFEST.
+        Never raise any exception!
+        """
+        if not os.path.isdir(self.job.results_dir):
+            return
+        count = write_results_manifest(self.job.results_dir, self.log)
+        if count is not None:
+            self.log.info("Results manifest lists %s files", count)
 
     def _download_results(self):
         """
@@ -1095,6 +1187,7 @@ class BuildBackgroundWorker(BackendBackgroundWorker):
             if self.job:
                 self._mark_finished()
                 self._compress_logs()
+                self._write_results_manifest()
             else:
                 self.log.error("No job object from Frontend")
             self.redis_set_worker_flag("status", "done")
@@ -0,0 +1,121 @@
+"""
+In-process compression of the build log files
+"""
+
+import errno
+import gzip
+import os
+import shutil
+import threading
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class LogCompressor(threading.Thread):
+    """
+    Compress the ``src`` log file into ``src + ".gz"`` (the file is created
+    under a temporary name first), in a separate thread.  With ``follow=True``,
+    the file is compressed while it is still being written to (like
+    'tail -f'), until the stop() method is called.  Call finish() to wait for
+    the compression, and to atomically replace the original file with the
+    compressed one (like the gzip binary does).
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, src, log, follow=False, poll_period=1):
+        super().__init__(daemon=True)
+        self.src = src
+        self.dest = src + ".gz"
+        self.tmp = self.dest + ".tmp"
+        self.log = log
+        self.poll_period = poll_period
+        self._stopped = threading.Event()
+        if not follow:
+            self._stopped.set()
+        self._aborted = False
+        self.error = None
+
+    def stop(self):
+        """ The source file is complete, compress the rest and end """
+        self._stopped.set()
+
+    def abort(self):
+        """ Stop compressing, and drop the partially compressed file """
+        self._aborted = True
+        self._stopped.set()
+        self.join()
+        self._remove_tmp()
+
+    def _remove_tmp(self):
+        try:
+            os.unlink(self.tmp)
+        except FileNotFoundError:
+            pass
+
+    def _wait_for_source(self):
+        while not os.path.exists(self.src):
+            if self._stopped.is_set():
+                return False
+            self._stopped.wait(self.poll_period)
+        return True
+
+    def _compress(self):
+        if not self._wait_for_source() or self._aborted:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT),
+                                    self.src)
+
+        # the same level as the gzip binary uses by default
+        with open(self.src, "rb") as src, \
+                gzip.open(self.tmp, "wb", compresslevel=6) as dest:
+            while not self._aborted:
+                # Read the stop flag _before_ reading the data, so we don't
+                # miss anything written right before stop().
+                stopped = self._stopped.is_set()
+                data = src.read(CHUNK_SIZE)
+                if data:
+                    dest.write(data)
+                    continue
+                if stopped:
+                    break
+                self._stopped.wait(self.poll_period)
+
+    def run(self):
+        try:
+            self._compress()
+        except Exception as exc:  # pylint: disable=broad-except
+            self.error = exc
+
+    def finish(self):
+        """
+        Wait till the file is compressed, and replace the original file.
+        Return True on success.  Never raise any exception!
+        """
+        self.stop()
+        if not self.is_alive() and self.ident is None:
+            self.start()
+        self.join()
+
+        if self.error:
+            self.log.error("Unable to compress file %s: %s", self.src,
+                           getattr(self.error, "strerror", None) or self.error)
+            self._remove_tmp()
+            return False
+
+        if os.path.exists(self.dest):
+            # This shouldn't ever happen, but if it happened - we don't want
+            # to overwrite the existing file.
+            self.log.error("Compressed log %s exists", self.dest)
+            self._remove_tmp()
+            return False
+
+        try:
+            shutil.copystat(self.src, self.tmp)
+            os.rename(self.tmp, self.dest)
+            os.unlink(self.src)
+        except OSError as exc:
+            self.log.error("Unable to compress file %s: %s", self.src,
+                           exc.strerror)
+            self._remove_tmp()
+            return False
+        return True
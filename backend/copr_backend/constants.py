@@ -18,6 +18,15 @@ DEF_BUILDROOT_PKGS = ""
 DEF_CONSECUTIVE_FAILURE_THRESHOLD = 10
 CONSECUTIVE_FAILURE_REDIS_KEY = "copr:sys:consecutive_build_fails"
 
+# The full build task records prefetched by the build dispatcher for the
+# workers it starts, see RPMBuildWorkerManager.prepare_tasks()
+PREFETCHED_TASK_REDIS_KEY = "copr:backend:prefetched_task::{}"
+PREFETCHED_TASK_TTL = 10 * 60
+
+# List of the files (with sizes and checksums) in the build results directory,
+# used by clients (copr download-build) instead of crawling the HTML listing.
+RESULTS_MANIFEST = "files.json"
+
 
 class BuildStatus(object):
     FAILURE = 0
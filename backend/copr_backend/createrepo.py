@@ -1,5 +1,7 @@
 import json
 import os
+import select
+import socket
 
 from copr_common.redis_helpers import get_redis_connection
 
@@ -12,6 +14,10 @@ from copr_common.redis_helpers import get_redis_connection
 # This is here mostly to not overflow the execve() stack limits.
 MAX_IN_BATCH = 100
 
+# Unix socket the copr-backend-createrepo service listens on.
+CREATEREPO_SOCKET = os.environ.get("COPR_CREATEREPO_SOCKET",
+                                   "/var/run/copr-backend/createrepo.sock")
+
 
 class BatchedCreaterepo:
     """
@@ -207,3 +213,171 @@ class BatchedCreaterepo:
         for key in self.notify_keys:
             self.log.info("Notifying %s that we succeeded", key)
             self.redis.hset(key, "status", "success")
+
+
+class CreaterepoRequest:
+    """
+    One or more merged requests for a copr-repo run in a single chroot
+    directory, as processed by the copr-backend-createrepo service.  Requests
+    are merged the same way BatchedCreaterepo.options() merges them; only the
+    requests with the same (directory, devel, appstream) triplet, see the
+    ``key`` property, can be merged together.
+    """
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, directory, add=None, delete=None, rpms_to_remove=None,
+                 devel=False, appstream=True, do_stat=False):
+        self.directory = directory
+        self.devel = devel
+        self.appstream = appstream
+        self.do_stat = do_stat
+        self.add = set(add or [])
+        self.delete = set(delete or [])
+        self.rpms_to_remove = set(rpms_to_remove or [])
+        # neither --add nor --delete means we do full createrepo run
+        self.full = not (self.add or self.delete or self.rpms_to_remove)
+        if self.full:
+            self.add = set()
+        self.merged = 1
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Create the request from the JSON sent by CreaterepoClient """
+        return cls(data["directory"], data.get("add"), data.get("delete"),
+                   data.get("rpms_to_remove"), data.get("devel", False),
+                   data.get("appstream", True), data.get("do_stat", False))
+
+    def to_dict(self):
+        """ Serialize to JSON-able dict, counterpart to from_dict() """
+        return {
+            "directory": self.directory,
+            "add": sorted(self.add),
+            "delete": sorted(self.delete),
+            "rpms_to_remove": sorted(self.rpms_to_remove),
+            "devel": self.devel,
+            "appstream": self.appstream,
+            "do_stat": self.do_stat,
+        }
+
+    @property
+    def key(self):
+        """ Only requests with the same key can be merged """
+        return (self.directory, self.devel, self.appstream)
+
+    @property
+    def removes(self):
+        """ True if the request removes something from the repository """
+        return bool(self.delete or self.rpms_to_remove)
+
+    def can_merge(self, other):
+        """
+        Check if the other request can be merged into this one.  The copr-repo
+        command line can not express a full run together with --delete or
+        --rpms-to-remove (copr-repo would do an incremental update then), so
+        such requests have to be processed separately.
+        """
+        if self.key != other.key:
+            return False
+        if self.full or other.full:
+            return not (self.removes or other.removes)
+        return True
+
+    def merge(self, other):
+        """ Merge the other request into this one, see can_merge() """
+        assert self.can_merge(other)
+        self.merged += other.merged
+        self.do_stat = self.do_stat or other.do_stat
+        # inherit "full" request from others
+        if other.full:
+            self.full = True
+            self.add = set()
+        if not self.full:
+            self.add.update(other.add)
+        self.delete.update(other.delete)
+        self.rpms_to_remove.update(other.rpms_to_remove)
+
+    def command(self):
+        """ Get the copr-repo command processing this (merged) request """
+        cmd = ["copr-repo", "--batched", self.directory]
+        for option, subdirs in [("--add", self.add),
+                                ("--delete", self.delete),
+                                ("--rpms-to-remove", self.rpms_to_remove)]:
+            for subdir in sorted(subdirs):
+                cmd += [option, subdir]
+        if not self.appstream:
+            cmd += ["--no-appstream-metadata"]
+        if self.devel:
+            cmd += ["--devel"]
+        if self.do_stat:
+            cmd += ["--do-stat"]
+        return cmd
+
+
+class CreaterepoFuture:
+    """
+    Result of the request submitted to the copr-backend-createrepo service.
+    The service replies (one JSON line) once the metadata are regenerated.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._result = None
+
+    def done(self):
+        """ Return True if the result() call wouldn't block """
+        if self._result is not None:
+            return True
+        readable, _, _ = select.select([self._sock], [], [], 0)
+        return bool(readable)
+
+    def result(self, timeout=None):
+        """
+        Wait for the service reply, and return True if the createrepo run
+        succeeded.  Raise TimeoutError if the reply doesn't come in time.
+        """
+        if self._result is not None:
+            return self._result
+
+        self._sock.settimeout(timeout)
+        try:
+            with self._sock.makefile("r", encoding="utf-8") as reader:
+                line = reader.readline()
+        except socket.timeout as exc:
+            raise TimeoutError("createrepo service didn't reply in time") \
+                from exc
+        finally:
+            self._sock.close()
+
+        try:
+            self._result = bool(json.loads(line)["success"])
+        except (ValueError, KeyError):
+            # service died, or the request was invalid
+            self._result = False
+        return self._result
+
+
+class CreaterepoClient:
+    """
+    Submit the createrepo requests to the copr-backend-createrepo service over
+    a local Unix socket.
+    """
+
+    def __init__(self, socket_path=None):
+        self.socket_path = socket_path or CREATEREPO_SOCKET
+
+    def submit(self, request):
+        """
+        Send the CreaterepoRequest to the service and return CreaterepoFuture,
+        or None if the service is not running.
+        """
+        if not os.path.exists(self.socket_path):
+            return None
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps(request.to_dict()).encode("utf-8") + b"\n")
+        except OSError:
+            sock.close()
+            return None
+        return CreaterepoFuture(sock)
@@ -2,6 +2,7 @@
 BuildDispatcher related classes.
 """
 
+from copr_common.dispatcher import TaskQueueChanges
 from copr_common.worker_manager import HashWorkerLimit
 from copr_backend.dispatcher import BackendDispatcher
 from copr_backend.rpm_builds import (
@@ -18,6 +19,9 @@ from ..exceptions import FrontendClientException
 class _PriorityCounter:
     def __init__(self):
         self._counter = {}
+        # task.id => group key, and number of tasks per group
+        self._task_groups = {}
+        self._group_sizes = {}
 
     def get_priority(self, task):
         """
@@ -68,11 +72,33 @@ class _PriorityCounter:
         owner = _get_subdict(background, task.owner)
         arch = _get_subdict(owner, task.requested_arch or "srpm")
 
+        group = (task.background, task.owner, task.requested_arch or "srpm",
+                 task.sandbox)
+        self._task_groups[task.id] = group
+        self._group_sizes[group] = self._group_sizes.get(group, 0) + 1
+
         # calculate from zero
         arch.setdefault(task.sandbox, 0)
         arch[task.sandbox] += 1
         return arch[task.sandbox]
 
+    def forget(self, task_id):
+        """
+        The task (previously given to get_priority()) disappeared from the
+        queue.  Newly added tasks still get lower priority than the remaining
+        tasks in the same group, but once the group is empty we start counting
+        from zero again (as if the whole queue was re-calculated).
+        """
+        group = self._task_groups.pop(task_id, None)
+        if group is None:
+            return
+        self._group_sizes[group] -= 1
+        if self._group_sizes[group]:
+            return
+        del self._group_sizes[group]
+        background, owner, arch, sandbox = group
+        del self._counter[background][owner][arch][sandbox]
+
 
 class BuildDispatcher(BackendDispatcher):
     """
@@ -111,6 +137,11 @@ class BuildDispatcher(BackendDispatcher):
         self.log.info("setting %s limit to %s", "userssh", limit)
         self.limits.append(userssh)
 
+        # The position in the Frontend queue we have already seen, see the
+        # get_frontend_task_changes() method.
+        self._queue_cursor = None
+        self._priority = _PriorityCounter()
+
     def get_frontend_tasks(self):
         """
         Retrieve a list of build jobs to be done.
@@ -130,6 +161,42 @@ class BuildDispatcher(BackendDispatcher):
             tasks.append(task)
         return tasks
 
+    def get_frontend_task_changes(self):
+        """
+        Retrieve only the build jobs added, changed or removed since the last
+        call.  Frontend sends the complete queue when it doesn't know our cursor
+        (e.g. after backend restart, or when the snapshot expired).
+        """
+        url = "pending-jobs/delta"
+        if self._queue_cursor:
+            url += "/" + self._queue_cursor
+        try:
+            delta = self.frontend_client.get(url).json()
+        except (FrontendClientException, ValueError) as error:
+            self.log.exception("Retrieving build jobs from %s failed with error: %s",
+                               self.opts.frontend_base_url, error)
+            return TaskQueueChanges()
+
+        self._queue_cursor = delta["cursor"]
+        if delta["full"]:
+            self._priority = _PriorityCounter()
+
+        for task_id in delta["removed"]:
+            self._priority.forget(task_id)
+
+        tasks = []
+        for raw in delta["added"]:
+            task = BuildQueueTask(raw)
+            # changed task, re-calculate
+            self._priority.forget(task.id)
+            task.backend_priority = self._priority.get_priority(task)
+            tasks.append(task)
+
+        self.log.info("Build queue changes: %s added, %s removed%s",
+                      len(tasks), len(delta["removed"]),
+                      " (full re-sync)" if delta["full"] else "")
+        return TaskQueueChanges(tasks, delta["removed"], full=delta["full"])
+
     def get_cancel_requests_ids(self):
         try:
             return self.frontend_client.get('build-tasks/cancel-requests').json()
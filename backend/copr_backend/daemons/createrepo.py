@@ -0,0 +1,191 @@
+"""
+Long-running service processing the createrepo requests for all the chroot
+directories on this backend.  The requests are sent over a local Unix socket
+by copr_backend.createrepo.CreaterepoClient (see call_copr_repo()).
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from setproctitle import setproctitle
+
+from copr_backend.createrepo import (
+    CREATEREPO_SOCKET,
+    MAX_IN_BATCH,
+    CreaterepoRequest,
+)
+from copr_backend.helpers import get_redis_logger, run_cmd
+
+
+class _Batch:
+    """ Merged requests waiting for a single copr-repo run """
+
+    def __init__(self, request, deadline):
+        self.request = request
+        self.deadline = deadline
+        self.futures = []
+
+
+class CreaterepoService:
+    """
+    Keep a work queue per chroot directory (precisely per
+    CreaterepoRequest.key), coalesce the add/delete requests that arrive within
+    the ``window`` (seconds), and run one copr-repo (metadata update) per
+    window.  Requests for different directories are processed concurrently,
+    by at most ``workers`` threads.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, window=2, workers=4, socket_path=None, log=None):
+        self.window = window
+        self.socket_path = socket_path or CREATEREPO_SOCKET
+        self.log = log or logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._running = set()
+        self._stopped = False
+
+    def submit(self, request):
+        """
+        Queue the CreaterepoRequest, and return concurrent.futures.Future
+        resolved to True/False once the metadata are (not) regenerated.
+        """
+        future = Future()
+        with self._cond:
+            batches = self._pending.setdefault(request.key, deque())
+            if not batches or batches[-1].request.merged >= MAX_IN_BATCH \
+                    or not batches[-1].request.can_merge(request):
+                batches.append(_Batch(request, time.time() + self.window))
+            else:
+                batches[-1].request.merge(request)
+            batches[-1].futures.append(future)
+            self._cond.notify()
+        return future
+
+    def _pop_due_batches(self, now):
+        """
+        Return the list of batches that should be processed right now, and
+        the time of the next deadline (or None).  Requires self._cond.
+        """
+        due = []
+        next_deadline = None
+        for key, batches in list(self._pending.items()):
+            if key in self._running:
+                # one copr-repo run per directory at a time
+                continue
+            batch = batches[0]
+            full = batch.request.merged >= MAX_IN_BATCH
+            if batch.deadline > now and not full:
+                if next_deadline is None or batch.deadline < next_deadline:
+                    next_deadline = batch.deadline
+                continue
+            batches.popleft()
+            if not batches:
+                del self._pending[key]
+            self._running.add(key)
+            due.append(batch)
+        return due, next_deadline
+
+    def _schedule(self):
+        """ Hand over the due batches to the worker threads, until stopped """
+        with self._cond:
+            while not self._stopped:
+                due, next_deadline = self._pop_due_batches(time.time())
+                for batch in due:
+                    self._executor.submit(self._process, batch)
+                timeout = None
+                if next_deadline is not None:
+                    timeout = max(next_deadline - time.time(), 0)
+                self._cond.wait(timeout)
+
+    def _process(self, batch):
+        request = batch.request
+        success = False
+        try:
+            self.log.info("Running createrepo for %s (%s merged requests)",
+                          request.directory, request.merged)
+            result = run_cmd(request.command(), logger=self.log)
+            success = not result.returncode
+            if not success:
+                self.log.error("Createrepo failed for %s", request.directory)
+        except Exception:  # pylint: disable=broad-except
+            self.log.exception("Createrepo failed for %s", request.directory)
+        finally:
+            for future in batch.futures:
+                future.set_result(success)
+            with self._cond:
+                self._running.discard(request.key)
+                self._cond.notify()
+
+    def _handle_client(self, conn):
+        with conn:
+            try:
+                with conn.makefile("r", encoding="utf-8") as reader:
+                    request = CreaterepoRequest.from_dict(
+                        json.loads(reader.readline()))
+            except (ValueError, KeyError, TypeError, OSError):
+                self.log.exception("Invalid createrepo request")
+                return
+            success = self.submit(request).result()
+            try:
+                conn.sendall(json.dumps({"success": success}).encode("utf-8")
+                             + b"\n")
+            except OSError:
+                self.log.warning("Client for %s disconnected",
+                                 request.directory)
+
+    def listen(self):
+        """ Create the listening Unix socket """
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        server.listen(128)
+        return server
+
+    def serve(self, server):
+        """ Accept the client connections, until stop() is called """
+        scheduler = threading.Thread(target=self._schedule, daemon=True)
+        scheduler.start()
+        server.settimeout(1)
+        while not self._stopped:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            threading.Thread(target=self._handle_client, args=(conn,),
+                             daemon=True).start()
+        scheduler.join()
+        server.close()
+
+    def stop(self):
+        """ Stop accepting new requests """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def run(self):
+        """ The service entrypoint """
+        setproctitle("CreaterepoService")
+        self.log.info("Listening on %s", self.socket_path)
+        self.serve(self.listen())
+
+
+def get_createrepo_service(opts):
+    """ Create CreaterepoService configured by copr-be.conf options """
+    return CreaterepoService(
+        window=opts.createrepo_batch_window,
+        workers=opts.createrepo_workers,
+        log=get_redis_logger(opts, "createrepo_service", "modifyrepo"),
+    )
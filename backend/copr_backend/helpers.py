@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 import logging.handlers
@@ -5,6 +6,7 @@ import optparse
 import os
 import sys
 import errno
+import fcntl
 import time
 import types
 import glob
@@ -30,6 +32,7 @@ from copr_common.redis_helpers import get_redis_connection
 from copr.v3 import Client
 from copr_backend.constants import DEF_BUILD_USER, DEF_BUILD_TIMEOUT, DEF_CONSECUTIVE_FAILURE_THRESHOLD, \
     CONSECUTIVE_FAILURE_REDIS_KEY, default_log_format
+from copr_backend.createrepo import CreaterepoClient, CreaterepoRequest
 from copr_backend.exceptions import CoprBackendError
 
 from . import constants
@@ -309,6 +312,12 @@ class BackendConfigReader(object):
         opts.sign_domain = _get_conf(
             cp, "backend", "sign_domain", DOMAIN)
 
+        opts.sign_workers = _get_conf(
+            cp, "backend", "sign_workers", 4, mode="int")
+
+        opts.pulp_upload_workers = _get_conf(
+            cp, "backend", "pulp_upload_workers", 8, mode="int")
+
         opts.build_groups = []
         for group_id in range(opts.build_groups_count):
             archs = _get_conf(cp, "backend",
@@ -392,6 +401,14 @@ class BackendConfigReader(object):
             cp, "backend", "prune_workers",
             default=None, mode="int")
 
+        opts.createrepo_batch_window = _get_conf(
+            cp, "backend", "createrepo_batch_window",
+            default=2, mode="float")
+
+        opts.createrepo_workers = _get_conf(
+            cp, "backend", "createrepo_workers",
+            default=4, mode="int")
+
         opts.log_dir = _get_conf(
             cp, "backend", "log_dir", "/var/log/copr-backend/")
         opts.log_level = _get_conf(
@@ -638,8 +655,29 @@ def format_filename(name, version, release, epoch, arch, zero_epoch=False):
 def call_copr_repo(directory, rpms_to_remove=None, devel=False, add=None, delete=None, timeout=None,
                    logger=None, appstream=True, do_stat=False):
     """
-    Execute 'copr-repo' tool, and return True if the command succeeded.
+    Execute 'copr-repo' tool, and return True if the command succeeded.  When
+    the copr-backend-createrepo service is running, the request is handed over
+    to it (so it can be merged with other requests for the same directory)
+    instead of starting a new copr-repo process.
     """
+    future = CreaterepoClient().submit(CreaterepoRequest(
+        directory,
+        add=[subdir for subdir in add or [] if subdir is not None],
+        delete=[subdir for subdir in delete or [] if subdir is not None],
+        rpms_to_remove=rpms_to_remove, devel=devel, appstream=appstream,
+        do_stat=do_stat,
+    ))
+    if future is not None:
+        try:
+            success = future.result(timeout)
+        except TimeoutError:
+            if logger:
+                logger.error("Createrepo request timeouted")
+            return False
+        if not success and logger:
+            logger.error("Createrepo failed")
+        return success
+
     cmd = ["copr-repo", "--batched", directory]
     def opt_multiply(option, subdirs):
         args = []
@@ -690,3 +728,121 @@ def copy2_but_hardlink_rpms(src, dest, **kwargs):
         return os.link(src, dest)
     # This is per help(shutil.copytree), copy2 is used by default.
     return shutil.copy2(src, dest, **kwargs)
+
+
+# ioctl(2) request number for cloning the whole file, from linux/fs.h
+FICLONE = 0x40049409
+
+
+def reflink_file(src, dest):
+    """
+    Create DEST as a copy-on-write clone of SRC (the data blocks are shared
+    until one of the files is modified).  Raises OSError if the filesystem
+    doesn't support reflinks (or SRC and DEST are on different filesystems).
+    DEST must not exist.
+    """
+    with open(src, "rb") as src_fd, open(dest, "xb") as dest_fd:
+        try:
+            fcntl.ioctl(dest_fd.fileno(), FICLONE, src_fd.fileno())
+        except OSError:
+            dest_fd.close()
+            os.unlink(dest)
+            raise
+    shutil.copystat(src, dest)
+    return dest
+
+
+def copy2_but_reflink(src, dest, **kwargs):
+    """
+    The copy_function for shutil.copytree(), cloning the files using reflinks
+    where the filesystem supports them.  Otherwise RPMs are copied (they are
+    modified in-place by re-signing, so they can not be hardlinked), and the
+    other files are hardlinked.  Plain copy is the last resort.
+
+    The already existing DEST file (e.g. when the fork is re-run) is never
+    opened for writing; it may be a hardlink to SRC.
+    """
+    if os.path.lexists(dest):
+        if os.path.samefile(src, dest):
+            return dest
+        os.unlink(dest)
+    try:
+        return reflink_file(src, dest)
+    except OSError:
+        pass
+    if not src.endswith(".rpm"):
+        try:
+            os.link(src, dest)
+            return dest
+        except OSError:
+            pass
+    return shutil.copy2(src, dest, **kwargs)
+
+
+def clone_tree(src, dest):
+    """
+    Copy the SRC directory into DEST (that may already exist) cheaply, see
+    copy2_but_reflink().
+    """
+    return shutil.copytree(src, dest, copy_function=copy2_but_reflink,
+                           dirs_exist_ok=True)
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    Calculate the sha256 hexdigest of the PATH file contents
+    """
+    checksum = hashlib.sha256()
+    with open(path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(chunk_size), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def update_results_manifest(results_dir, log):
+    """
+    Re-generate the RESULTS_MANIFEST in RESULTS_DIR if it exists, e.g. after
+    the RPMs there were re-signed (their checksums changed).
+    """
+    if not os.path.exists(os.path.join(results_dir,
+                                       constants.RESULTS_MANIFEST)):
+        return None
+    return write_results_manifest(results_dir, log)
+
+
+def write_results_manifest(results_dir, log):
+    """
+    Store the list of files in the RESULTS_DIR (relative paths, sizes and
+    sha256 checksums) into the RESULTS_MANIFEST file there.  The results of the
+    previous build (prev_build_backup) are not listed.  The file is replaced
+    atomically so the clients never see a partial manifest.  Return
+    the number of listed files, or None if the manifest can not be created.
+    """
+    manifest = os.path.join(results_dir, constants.RESULTS_MANIFEST)
+    files = []
+    try:
+        for root, dirs, filenames in os.walk(results_dir):
+            if root == results_dir and "prev_build_backup" in dirs:
+                dirs.remove("prev_build_backup")
+            dirs.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                relpath = os.path.relpath(path, results_dir)
+                if relpath == constants.RESULTS_MANIFEST:
+                    continue
+                if not os.path.isfile(path):
+                    continue
+                files.append({
+                    "name": relpath,
+                    "size": os.path.getsize(path),
+                    "sha256": file_sha256(path),
+                })
+
+        tmp = manifest + ".tmp"
+        with open(tmp, "w") as fd:
+            json.dump({"files": files}, fd, indent=1)
+        os.replace(tmp, manifest)
+    except OSError:
+        log.exception("Can't create the results manifest %s", manifest)
+        return None
+    return len(files)
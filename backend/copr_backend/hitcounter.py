@@ -4,7 +4,9 @@ Shared logic for hitcounter scripts
 
 import os
 import re
+from collections import Counter
 from datetime import datetime
+from functools import lru_cache
 from requests.utils import unquote
 from copr_common.request import SafeRequest
 from copr_backend.helpers import BackendConfigReader
@@ -14,6 +16,10 @@ repomd_url_regex = re.compile(base_regex + "repodata/repomd.xml", re.IGNORECASE)
 rpm_url_regex = re.compile(
     base_regex + r"(?P<build_dir>[^/]*)/(?P<rpm>[^/]*\.rpm)", re.IGNORECASE)
 
+# Default length of the time window (in seconds) the hits are aggregated for
+# and sent to frontend in one request.
+HIT_WINDOW = 3600
+
 spider_regex = re.compile(
     '.*(ahrefs|bot/[0-9]|bingbot|borg|google|googlebot|yahoo|slurp|msnbot'
     '|openbot|archiver|netresearch|lycos|scooter|altavista|teoma|gigabot'
@@ -64,105 +70,195 @@ def update_frontend(accesses, log, dry_run=False, try_indefinitely=False):
     """
     Increment frontend statistics based on these `accesses`
     """
-    result = get_hit_data(accesses, log)
-    if not result:
+    counter = HitCounter(log)
+    for access in accesses:
+        counter.add(access)
+    send_hits(counter, log, dry_run=dry_run, try_indefinitely=try_indefinitely)
+
+
+def send_hits(counter, log, dry_run=False, try_indefinitely=False, opts=None):
+    """
+    Send the hits aggregated in HitCounter to frontend, one gzip-compressed
+    request per time window.
+    """
+    payloads = list(counter.payloads())
+    if not payloads:
         log.debug("No recognizable hits among these accesses, skipping.")
         return
 
-    log.debug(
-        "Sending: %i results from %i to %i",
-        len(result["hits"]),
-        result["ts_from"],
-        result["ts_to"]
-    )
-    if len(result["hits"]) < 100:
-        log.debug("Hits: %s", result["hits"])
-    else:
-        log.debug("Not logging the whole dict: %s hits", len(result["hits"]))
-
-    opts = BackendConfigReader().read()
+    if opts is None:
+        opts = BackendConfigReader().read()
     url = os.path.join(
         opts.frontend_base_url,
         "stats_rcv",
         "from_backend",
     )
-    if not dry_run:
-        request = SafeRequest(
-            auth=opts.frontend_auth,
-            log=log,
-            try_indefinitely=try_indefinitely,
+    request = SafeRequest(
+        auth=opts.frontend_auth,
+        log=log,
+        try_indefinitely=try_indefinitely,
+        compress=True,
+    )
+
+    for result in payloads:
+        log.debug(
+            "Sending: %i results from %i to %i",
+            len(result["hits"]),
+            result["ts_from"],
+            result["ts_to"]
         )
-        request.post(url, result)
+        if len(result["hits"]) < 100:
+            log.debug("Hits: %s", result["hits"])
+        else:
+            log.debug("Not logging the whole dict: %s hits", len(result["hits"]))
 
+        if not dry_run:
+            request.post(url, result)
 
-def get_hit_data(accesses, log):
+
+@lru_cache(maxsize=4096)
+def _user_agent_verdict(user_agent):
     """
-    Prepare body for the frontend request in the same format that
-    copr_log_hitcounter.py does.
+    Return the reason why accesses with this user-agent are not counted, or
+    None.  The spider_regex is expensive, and there's only a few distinct
+    user-agents in the logs, so the verdicts are cached.
     """
-    hits = {}
-    timestamps = []
-    for access in accesses:
+    if user_agent.startswith("Mock"):
+        return "user-agent: Mock"
+
+    bot = spider_regex.match(user_agent)
+    if bot:
+        return "user-agent '{}' is a known bot".format(bot.group(1))
+    return None
+
+
+@lru_cache(maxsize=65536)
+def _url_verdict(raw_url):
+    """
+    Return (key_strings, reason) tuple for the given accessed URL, either the
+    list of statistic keys to increment, or the reason why the access is not
+    counted.
+    """
+    # Convert encoded characters from their %40 values back to @.
+    url = unquote(raw_url)
+
+    # I don't know how or why but occasionally there is an URL that is
+    # encoded twice (%2540oamg -> %40oamg - > @oamg), and yet its status
+    # code is 200. AFAIK these appear only for EPEL-7 chroots and their
+    # User-Agent is something like urlgrabber/3.10%20yum/3.4.3
+    # I wasn't able to reproduce such accesses, and we decided to not count
+    # them
+    if url != unquote(url):
+        return None, "double encoded URL"
+
+    # We don't want to count every accessed URL, only those pointing to
+    # RPM files and repo file
+    key_strings = url_to_key_strings(url)
+    if not key_strings:
+        return None, None
+
+    if any(x for x in key_strings
+           if x.startswith("chroot_rpms_dl_stat|")
+           and x.endswith("|srpm-builds")):
+        return None, "SRPM build"
+
+    return key_strings, None
+
+
+@lru_cache(maxsize=65536)
+def _timestamp(date, time):
+    datetime_format = "%Y-%m-%d %H:%M:%S"
+    datetime_string = "{0} {1}".format(date, time)
+    datetime_object = datetime.strptime(datetime_string, datetime_format)
+    return int(datetime_object.timestamp())
+
+
+class HitCounter:
+    """
+    Aggregate the accesses (dicts with the "cs-uri-stem", "sc-status",
+    "cs(User-Agent)", "date" and "time" fields, see copr-aws-s3-hitcounter) one
+    by one, so the access logs can be processed in a streaming fashion, in
+    constant memory.  The hits are counted per ``window`` (seconds) long time
+    windows, the whole log is counted as one window by default.
+    """
+
+    def __init__(self, log, window=None):
+        self.log = log
+        self.window = window
+        self._windows = {}
+
+    def add(self, access):
+        """ Count one access, if it is a recognized hit """
         url = access["cs-uri-stem"]
 
         if access["sc-status"] == "404":
-            log.debug("Skipping: %s (404 Not Found)", url)
-            continue
-
-        if access["cs(User-Agent)"].startswith("Mock"):
-            log.debug("Skipping: %s (user-agent: Mock)", url)
-            continue
-
-        bot = spider_regex.match(access["cs(User-Agent)"])
-        if bot:
-            log.debug("Skipping: %s (user-agent '%s' is a known bot)",
-                      url, bot.group(1))
-            continue
-
-        # Convert encoded characters from their %40 values back to @.
-        url = unquote(url)
-
-        # I don't know how or why but occasionally there is an URL that is
-        # encoded twice (%2540oamg -> %40oamg - > @oamg), and yet its status
-        # code is 200. AFAIK these appear only for EPEL-7 chroots and their
-        # User-Agent is something like urlgrabber/3.10%20yum/3.4.3
-        # I wasn't able to reproduce such accesses, and we decided to not count
-        # them
-        if url != unquote(url):
-            log.warning("Skipping: %s (double encoded URL, user-agent: '%s', "
-                        "status: %s)", access["cs-uri-stem"],
-                        access["cs(User-Agent)"], access["sc-status"])
-            continue
-
-        # We don't want to count every accessed URL, only those pointing to
-        # RPM files and repo file
-        key_strings = url_to_key_strings(url)
+            self.log.debug("Skipping: %s (404 Not Found)", url)
+            return
+
+        reason = _user_agent_verdict(access["cs(User-Agent)"])
+        if reason:
+            self.log.debug("Skipping: %s (%s)", url, reason)
+            return
+
+        key_strings, reason = _url_verdict(url)
         if not key_strings:
-            log.debug("Skipping: %s", url)
-            continue
+            if reason == "double encoded URL":
+                self.log.warning("Skipping: %s (double encoded URL, "
+                                 "user-agent: '%s', status: %s)", url,
+                                 access["cs(User-Agent)"], access["sc-status"])
+            elif reason:
+                self.log.debug("Skipping: %s (%s)", url, reason)
+            else:
+                self.log.debug("Skipping: %s", url)
+            return
 
-        if any(x for x in key_strings
-               if x.startswith("chroot_rpms_dl_stat|")
-               and x.endswith("|srpm-builds")):
-            log.debug("Skipping %s (SRPM build)", url)
-            continue
+        self.log.debug("Processing: %s", url)
 
-        log.debug("Processing: %s", url)
+        # Remember this access timestamp
+        timestamp = _timestamp(access["date"], access["time"])
+        window = timestamp // self.window if self.window else 0
+        if window not in self._windows:
+            self._windows[window] = [timestamp, timestamp, Counter()]
+        data = self._windows[window]
+        data[0] = min(data[0], timestamp)
+        data[1] = max(data[1], timestamp)
 
         # When counting RPM access, we want to iterate both project hits and
         # chroot hits. That way we can get multiple `key_strings` for one URL
-        for key_str in key_strings:
-            hits.setdefault(key_str, 0)
-            hits[key_str] += 1
+        data[2].update(key_strings)
 
-        # Remember this access timestamp
-        datetime_format = "%Y-%m-%d %H:%M:%S"
-        datetime_string = "{0} {1}".format(access["date"], access["time"])
-        datetime_object = datetime.strptime(datetime_string, datetime_format)
-        timestamps.append(int(datetime_object.timestamp()))
-
-    return {
-        "ts_from": min(timestamps),
-        "ts_to": max(timestamps),
-        "hits": hits,
-    } if hits else {}
+    def update(self, other):
+        """ Merge the hits counted by other HitCounter into this one """
+        for window, (ts_from, ts_to, hits) in other._windows.items():
+            if window not in self._windows:
+                self._windows[window] = [ts_from, ts_to, Counter()]
+            data = self._windows[window]
+            data[0] = min(data[0], ts_from)
+            data[1] = max(data[1], ts_to)
+            data[2].update(hits)
+
+    def payloads(self):
+        """
+        Generate the frontend request bodies (one per time window), in the same
+        format that get_hit_data() returns.
+        """
+        for window in sorted(self._windows):
+            ts_from, ts_to, hits = self._windows[window]
+            yield {
+                "ts_from": ts_from,
+                "ts_to": ts_to,
+                "hits": dict(hits),
+            }
+
+
+def get_hit_data(accesses, log):
+    """
+    Prepare body for the frontend request in the same format that
+    copr_log_hitcounter.py does.
+    """
+    counter = HitCounter(log)
+    for access in accesses:
+        counter.add(access)
+    for payload in counter.payloads():
+        return payload
+    return {}
@@ -8,6 +8,15 @@ import time
 import tomllib
 from urllib.parse import urlencode
 import requests
+from requests.adapters import HTTPAdapter
+
+# Adaptive back-off for polling the Pulp tasks, the (most common) short tasks
+# are detected quickly, the long ones don't flood Pulp with requests
+POLL_DELAY_MIN = 0.2
+POLL_DELAY_MAX = 5
+
+# Maximum number of tasks queried in one request
+TASKS_PER_QUERY = 100
 
 
 class PulpClient:
@@ -30,7 +39,7 @@ class PulpClient:
     """
 
     @classmethod
-    def create_from_config_file(cls, path=None):
+    def create_from_config_file(cls, path=None, **kwargs):
         """
         Create a Pulp client from a standard configuration file that is
         used by the `pulp` CLI tool
@@ -38,12 +47,19 @@ class PulpClient:
         path = os.path.expanduser(path or "~/.config/pulp/cli.toml")
         with open(path, "rb") as fp:
             config = tomllib.load(fp)
-        return cls(config["cli"])
+        return cls(config["cli"], **kwargs)
 
-    def __init__(self, config):
+    def __init__(self, config, pool_size=10):
         self.config = config
         self.timeout = 60
 
+        # One session (keep-alive connections) for all the requests, shared
+        # by all the threads using this client
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
     @property
     def auth(self):
         """
@@ -97,7 +113,7 @@ class PulpClient:
         """
         url = self.url("api/v3/repositories/rpm/rpm/")
         data = {"name": name}
-        return requests.post(url, json=data, **self.request_params)
+        return self.session.post(url, json=data, **self.request_params)
 
     def get_repository(self, name):
         """
@@ -108,7 +124,7 @@ class PulpClient:
         # even Pulp CLI does this workaround
         url = self.url("api/v3/repositories/rpm/rpm/?")
         url += urlencode({"name": name, "offset": 0, "limit": 1})
-        return requests.get(url, **self.request_params)
+        return self.session.get(url, **self.request_params)
 
     def get_distribution(self, name):
         """
@@ -119,7 +135,7 @@ class PulpClient:
         # even Pulp CLI does this workaround
         url = self.url("api/v3/distributions/rpm/rpm/?")
         url += urlencode({"name": name, "offset": 0, "limit": 1})
-        return requests.get(url, **self.request_params)
+        return self.session.get(url, **self.request_params)
 
     def get_task(self, task):
         """
@@ -132,7 +148,7 @@ class PulpClient:
         Get a detailed information about an object
         """
         url = self.config["base_url"] + href
-        return requests.get(url, **self.request_params)
+        return self.session.get(url, **self.request_params)
 
     def create_distribution(self, name, repository, basepath=None):
         """
@@ -145,7 +161,7 @@ class PulpClient:
             "repository": repository,
             "base_path": basepath or name,
         }
-        return requests.post(url, json=data, **self.request_params)
+        return self.session.post(url, json=data, **self.request_params)
 
     def create_publication(self, repository):
         """
@@ -154,7 +170,7 @@ class PulpClient:
         """
         url = self.url("api/v3/publications/rpm/rpm/")
         data = {"repository": repository}
-        return requests.post(url, json=data, **self.request_params)
+        return self.session.post(url, json=data, **self.request_params)
 
     def update_distribution(self, distribution, publication):
         """
@@ -170,7 +186,7 @@ class PulpClient:
             # 'repository' and 'publication' may be used simultaneously."
             "repository": None,
         }
-        return requests.patch(url, json=data, **self.request_params)
+        return self.session.patch(url, json=data, **self.request_params)
 
     def create_content(self, repository, path, labels):
         """
@@ -181,7 +197,7 @@ class PulpClient:
         with open(path, "rb") as fp:
             data = {"repository": repository, "pulp_labels": json.dumps(labels)}
             files = {"file": fp}
-            return requests.post(
+            return self.session.post(
                 url, data=data, files=files, **self.request_params)
 
     def delete_content(self, repository, artifacts):
@@ -192,7 +208,7 @@ class PulpClient:
         path = os.path.join(repository, "modify/")
         url = self.config["base_url"] + path
         data = {"remove_content_units": artifacts}
-        return requests.post(url, json=data, **self.request_params)
+        return self.session.post(url, json=data, **self.request_params)
 
     def get_content(self, build_ids):
         """
@@ -207,7 +223,7 @@ class PulpClient:
         url = self.url("api/v3/content/rpm/packages/?")
         # Setting the limit to 1000, but in the future we should use pagination
         url += urlencode({"q": query, "fields": "prn", "offset": 0, "limit": 1000})
-        return requests.get(url, **self.request_params)
+        return self.session.get(url, **self.request_params)
 
     def delete_repository(self, repository):
         """
@@ -215,7 +231,7 @@ class PulpClient:
         https://pulpproject.org/pulp_rpm/restapi/#tag/Repositories:-Rpm/operation/repositories_rpm_rpm_delete
         """
         url = self.config["base_url"] + repository
-        return requests.delete(url, **self.request_params)
+        return self.session.delete(url, **self.request_params)
 
     def delete_distribution(self, distribution):
         """
@@ -223,7 +239,20 @@ class PulpClient:
         https://pulpproject.org/pulp_rpm/restapi/#tag/Distributions:-Rpm/operation/distributions_rpm_rpm_delete
         """
         url = self.config["base_url"] + distribution
-        return requests.delete(url, **self.request_params)
+        return self.session.delete(url, **self.request_params)
+
+    def list_tasks(self, tasks):
+        """
+        Get a detailed information about multiple tasks at once
+        https://pulpproject.org/pulpcore/restapi/#tag/Tasks/operation/tasks_list
+        """
+        url = self.url("api/v3/tasks/?")
+        url += urlencode({
+            "pulp_href__in": ",".join(tasks),
+            "offset": 0,
+            "limit": len(tasks),
+        })
+        return self.session.get(url, **self.request_params)
 
     def wait_for_finished_task(self, task, timeout=86400):
         """
@@ -232,6 +261,7 @@ class PulpClient:
         what it actually did.
         """
         start = time.time()
+        delay = POLL_DELAY_MIN
         while True:
             response = self.get_task(task)
             if not response.ok:
@@ -240,9 +270,44 @@ class PulpClient:
                 break
             if time.time() > start + timeout:
                 break
-            time.sleep(5)
+            time.sleep(delay)
+            delay = min(delay * 2, POLL_DELAY_MAX)
         return response
 
+    def wait_for_finished_tasks(self, tasks, timeout=86400):
+        """
+        The same as wait_for_finished_task() but for many tasks, polled by
+        a single request per TASKS_PER_QUERY tasks.  Return a dict
+        {task_href: task_data} of the finished tasks; the tasks that didn't
+        finish in time (or we failed to query them) are not there.
+        """
+        start = time.time()
+        delay = POLL_DELAY_MIN
+        pending = list(tasks)
+        finished = {}
+        while pending:
+            still_pending = []
+            for i in range(0, len(pending), TASKS_PER_QUERY):
+                chunk = pending[i:i+TASKS_PER_QUERY]
+                response = self.list_tasks(chunk)
+                if not response.ok:
+                    return finished
+                found = {task["pulp_href"]: task
+                         for task in response.json()["results"]}
+                for href in chunk:
+                    task = found.get(href)
+                    if task and task["state"] not in ["waiting", "running"]:
+                        finished[href] = task
+                    else:
+                        still_pending.append(href)
+
+            pending = still_pending
+            if not pending or time.time() > start + timeout:
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, POLL_DELAY_MAX)
+        return finished
+
     def list_distributions(self, prefix):
         """
         Get a list of distributions whose names match a given prefix
@@ -250,7 +315,7 @@ class PulpClient:
         """
         url = self.url("api/v3/distributions/rpm/rpm/?")
         url += urlencode({"name__startswith": prefix})
-        return requests.get(url, **self.request_params)
+        return self.session.get(url, **self.request_params)
 
     def set_label(self, href, name, value):
         """
@@ -259,4 +324,4 @@ class PulpClient:
         """
         url = self.config["base_url"] + href + "set_label/"
         data = {"key": name, "value": value}
-        return requests.post(url, json=data, **self.request_params)
+        return self.session.post(url, json=data, **self.request_params)
@@ -0,0 +1,105 @@
+"""
+Shared registry of the repositories with ready (written) metadata.  The
+processes writing the repository metadata (copr-repo, PulpStorage) mark the
+repository as ready in Redis and notify the waiting build workers, so the
+workers don't have to poll the storage (stat, or HTTP HEAD for Pulp).
+"""
+
+import time
+
+from redis.exceptions import RedisError
+
+# Redis key per ready repository, and the channel announcing new ones
+READY_KEY = "repo_ready::{}"
+READY_CHANNEL = "repo_ready"
+
+# Forget the ready repositories after some time, just in case they are
+# removed without going through Storage.delete_*(), we'll check the storage
+# again later.
+READY_TTL = 24 * 3600
+
+
+class RepoReadiness:
+    """
+    Mark the repositories as ready, and wait for them.  The ``repository`` is
+    an arbitrary name, see Storage.repository_name().
+    """
+
+    def __init__(self, redis, log):
+        self.redis = redis
+        self.log = log
+
+    def mark_ready(self, repository):
+        """ The repository metadata are written, notify the waiters """
+        try:
+            self.redis.set(READY_KEY.format(repository), int(time.time()),
+                           ex=READY_TTL)
+            self.redis.publish(READY_CHANNEL, repository)
+        except RedisError as err:
+            # not fatal, the waiters check the storage from time to time
+            self.log.warning("Can't mark %s as ready: %s", repository, err)
+
+    def forget(self, repository):
+        """ The repository was removed """
+        try:
+            self.redis.delete(READY_KEY.format(repository))
+        except RedisError as err:
+            self.log.warning("Can't forget %s: %s", repository, err)
+
+    def forget_prefix(self, prefix):
+        """ All the repositories named PREFIX* were removed """
+        try:
+            for key in self.redis.scan_iter(READY_KEY.format(prefix + "*")):
+                self.redis.delete(key)
+        except RedisError as err:
+            self.log.warning("Can't forget %s*: %s", prefix, err)
+
+    def is_ready(self, repository):
+        """ Was the repository marked as ready? """
+        return bool(self.redis.exists(READY_KEY.format(repository)))
+
+    def waiter(self, repository):
+        """ Return ReadinessWaiter for the given repository """
+        return ReadinessWaiter(self, repository)
+
+
+class ReadinessWaiter:
+    """
+    Context manager subscribed to the readiness notifications, use like:
+
+        with readiness.waiter(name) as waiter:
+            while not waiter.wait(timeout):
+                ...
+    """
+
+    def __init__(self, readiness, repository):
+        self.readiness = readiness
+        self.repository = repository
+        self._pubsub = None
+
+    def __enter__(self):
+        # Subscribe _before_ the first is_ready() check, so we can not miss
+        # the notification sent in between.
+        self._pubsub = self.readiness.redis.pubsub(
+            ignore_subscribe_messages=True)
+        self._pubsub.subscribe(READY_CHANNEL)
+        return self
+
+    def __exit__(self, *args):
+        self._pubsub.close()
+
+    def wait(self, timeout):
+        """
+        Block till the repository is ready, or till timeout (seconds)
+        elapses.  Return True if the repository is ready.
+        """
+        if self.readiness.is_ready(self.repository):
+            return True
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            message = self._pubsub.get_message(timeout=max(remaining, 0))
+            if message and message["data"] == self.repository:
+                return True
+            if remaining <= 0:
+                return False
@@ -2,12 +2,21 @@
 Abstraction for RPM and SRPM builds on backend.
 """
 
+import json
+
+from redis.exceptions import RedisError
+
 from copr_common.worker_manager import (
     HashWorkerLimit,
     WorkerManager,
     PredicateWorkerLimit,
 )
 from copr_backend.worker_manager import BackendQueueTask
+from copr_backend.constants import (
+    PREFETCHED_TASK_REDIS_KEY,
+    PREFETCHED_TASK_TTL,
+)
+from copr_backend.exceptions import FrontendClientException
 from copr_backend.helpers import get_chroot_arch
 
 
@@ -192,6 +201,37 @@ class RPMBuildWorkerManager(WorkerManager):
     """
 
     worker_prefix = 'rpm_build_worker'
+    start_batch_size = 100
+
+    def prepare_tasks(self, tasks):
+        """
+        Download the full build records for all the TASKS in one request, and
+        hand them over to the workers through Redis.  The workers download the
+        record on their own if it is not prefetched.
+        """
+        if not self.frontend_client:
+            return
+        task_ids = [task.id for task in tasks]
+        try:
+            records = self.frontend_client.post("get-build-tasks",
+                                                task_ids).json()
+        except (FrontendClientException, ValueError) as error:
+            self.log.warning("Can't prefetch %s build tasks: %s",
+                             len(task_ids), error)
+            return
+
+        pipe = self.redis.pipeline()
+        for record in records:
+            pipe.set(PREFETCHED_TASK_REDIS_KEY.format(record["task_id"]),
+                     json.dumps(record), ex=PREFETCHED_TASK_TTL)
+        try:
+            pipe.execute()
+        except RedisError as error:
+            self.log.warning("Can't store %s prefetched build tasks: %s",
+                             len(records), error)
+            return
+        self.log.info("Prefetched %s of %s build tasks", len(records),
+                      len(task_ids))
 
     def start_task(self, worker_id, task):
         command = [
@@ -4,6 +4,7 @@
 Wrapper for /bin/sign from obs-sign package
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import Popen, PIPE, SubprocessError
 import os
 import time
@@ -11,13 +12,16 @@ import time
 from packaging import version
 
 from copr_common.request import SafeRequest
-from copr_backend.helpers import get_redis_logger
+from copr_backend.helpers import get_redis_logger, update_results_manifest
 from .exceptions import CoprSignError, CoprSignNoKeyError, \
     CoprKeygenRequestError
 
 
 SIGN_BINARY = "/bin/sign"
 
+# Default number of concurrent /bin/sign calls, see the sign_workers option.
+DEFAULT_SIGN_WORKERS = 4
+
 def create_gpg_email(username, projectname, domain):
     """
     Creates canonical name_email to identify gpg key
@@ -136,6 +140,136 @@ def gpg_hashtype_for_chroot(chroot, opts):
     return "sha256"
 
 
+def _list_rpms(path):
+    return [
+        os.path.join(path, filename.name)
+        for filename in os.scandir(path)
+        if filename.name.endswith(".rpm")
+    ]
+
+
+class RpmSigner:
+    """
+    Sign RPMs using obs-signd, running at most ``workers`` /bin/sign calls
+    concurrently (``opts.sign_workers`` by default).  The existence of the
+    project key-pair is checked only once per RpmSigner instance and project.
+    A missing key-pair is created by a keygen request which is re-tried until
+    it succeeds, unless ``try_indefinitely`` is False.
+    """
+
+    def __init__(self, opts, log, workers=None, try_indefinitely=True):
+        self.opts = opts
+        self.log = log
+        self.try_indefinitely = try_indefinitely
+        self.workers = workers or getattr(opts, "sign_workers", None) \
+            or DEFAULT_SIGN_WORKERS
+        self._pubkeys = {}
+
+    def ensure_pubkey(self, username, projectname):
+        """
+        Make sure the project key-pair exists on the signer host, and return
+        the public key (or None if it has just been created).
+
+        :raises CoprSignError: failed to retrieve the key
+        """
+        key = (username, projectname)
+        if key not in self._pubkeys:
+            try:
+                self._pubkeys[key] = get_pubkey(username, projectname, self.log,
+                                                self.opts.sign_domain)
+            except CoprSignNoKeyError:
+                create_user_keys(username, projectname, self.opts,
+                                 try_indefinitely=self.try_indefinitely)
+                self._pubkeys[key] = None
+        return self._pubkeys[key]
+
+    def _update_manifests(self, dirs):
+        # The RPM checksums changed, keep the results manifests up-to-date
+        for path, _ in dirs:
+            update_results_manifest(path, self.log)
+
+    def _sign(self, rpm, email, hashtype):
+        try:
+            _sign_one(rpm, email, hashtype, self.log)
+            self.log.info("signed rpm: %s", rpm)
+            return None
+        except CoprSignError as err:
+            self.log.exception("failed to sign rpm: %s", rpm)
+            return err
+
+    def sign_dirs(self, username, projectname, dirs):
+        """
+        Sign all the RPMs in the given list of (path, chroot) directories, all
+        of them belonging to the username/projectname project.  Failures
+        don't stop signing the other RPMs.
+
+        :return: list of (rpm_filepath, exception) tuples for failed RPMs
+        :raises CoprSignError: failed to retrieve the project key
+        """
+        tasks = []  # tuples (rpm_filepath, hashtype)
+        for path, chroot in dirs:
+            hashtype = gpg_hashtype_for_chroot(chroot, self.opts)
+            tasks += [(rpm, hashtype) for rpm in _list_rpms(path)]
+
+        if not tasks:
+            return []
+
+        self.ensure_pubkey(username, projectname)
+        email = create_gpg_email(username, projectname, self.opts.sign_domain)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(
+                lambda task: self._sign(task[0], email, task[1]), tasks))
+
+        self._update_manifests(dirs)
+        return [(task[0], error) for task, error in zip(tasks, results)
+                if error is not None]
+
+    def _resign(self, rpm, email, hashtype):
+        try:
+            _unsign_one(rpm)
+            self.log.info("unsigned rpm: %s", rpm)
+        except CoprSignError as err:
+            self.log.exception("failed to unsign rpm: %s", rpm)
+            return err
+        if email is None:
+            return None
+        return self._sign(rpm, email, hashtype)
+
+    def resign_dirs(self, username, projectname, dirs, sign=True):
+        """
+        Drop the old signatures from all the RPMs in the given list of (path,
+        chroot) directories, and sign them again by the username/projectname
+        key (only if SIGN).  The RPMs are processed concurrently, but each
+        one is first unsigned and then signed.
+
+        :return: list of (rpm_filepath, exception) tuples for failed RPMs
+        :raises CoprSignError: failed to retrieve the project key
+        """
+        tasks = []  # tuples (rpm_filepath, hashtype)
+        for path, chroot in dirs:
+            hashtype = gpg_hashtype_for_chroot(chroot, self.opts) \
+                if sign else None
+            tasks += [(rpm, hashtype) for rpm in _list_rpms(path)]
+
+        if not tasks:
+            return []
+
+        email = None
+        if sign:
+            self.ensure_pubkey(username, projectname)
+            email = create_gpg_email(username, projectname,
+                                     self.opts.sign_domain)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(
+                lambda task: self._resign(task[0], email, task[1]), tasks))
+
+        self._update_manifests(dirs)
+        return [(task[0], error) for task, error in zip(tasks, results)
+                if error is not None]
+
+
 def sign_rpms_in_dir(username, projectname, path, chroot, opts, log):
     """
     Signs rpms using obs-signd.
@@ -153,34 +287,8 @@ def sign_rpms_in_dir(username, projectname, path, chroot, opts, log):
 
     :raises: :py:class:`backend.exceptions.CoprSignError` failed to sign at least one package
     """
-
-    rpm_list = [
-        os.path.join(path, filename.name)
-        for filename in os.scandir(path)
-        if filename.name.endswith(".rpm")
-    ]
-
-    if not rpm_list:
-        return
-
-    hashtype = gpg_hashtype_for_chroot(chroot, opts)
-
-    try:
-        get_pubkey(username, projectname, log, opts.sign_domain)
-    except CoprSignNoKeyError:
-        create_user_keys(username, projectname, opts, try_indefinitely=True)
-
-    errors = []  # tuples (rpm_filepath, exception)
-    for rpm in rpm_list:
-        try:
-            _sign_one(rpm, create_gpg_email(username, projectname, opts.sign_domain),
-                      hashtype, log)
-            log.info("signed rpm: %s", rpm)
-
-        except CoprSignError as e:
-            log.exception("failed to sign rpm: %s", rpm)
-            errors.append((rpm, e))
-
+    errors = RpmSigner(opts, log).sign_dirs(username, projectname,
+                                            [(path, chroot)])
     if errors:
         raise CoprSignError("Rpm sign failed, affected rpms: {}"
                             .format([err[0] for err in errors]))
@@ -263,6 +371,8 @@ def unsign_rpms_in_dir(path, opts, log):
             log.exception("failed to unsign rpm: %s", rpm)
             errors.append((rpm, e))
 
+    update_results_manifest(path, log)
+
     if errors:
         raise CoprSignError("Rpm unsign failed, affected rpms: {}"
                             .format([err[0] for err in errors]))
@@ -8,9 +8,11 @@ import shutil
 from urllib.parse import urlparse
 import requests
 from copr_common.enums import StorageEnum
+from copr_common.redis_helpers import get_redis_connection
 from copr_backend.helpers import call_copr_repo, build_chroot_log_name
 from copr_backend.pulp import PulpClient
 from copr_backend.exceptions import CoprBackendError
+from copr_backend.repo_readiness import RepoReadiness
 
 
 def storage_for_job(job, opts, log):
@@ -51,6 +53,24 @@ class Storage:
         self.devel = devel
         self.opts = opts
         self.log = log
+        self._readiness = None
+
+    @property
+    def readiness(self):
+        """
+        RepoReadiness registry, the repositories are named by
+        readiness_name()
+        """
+        if not self._readiness:
+            self._readiness = RepoReadiness(get_redis_connection(self.opts),
+                                            self.log)
+        return self._readiness
+
+    def readiness_name(self, dirname, chroot):
+        """
+        Name of the repository in the RepoReadiness registry
+        """
+        return "/".join([self.owner, dirname, chroot])
 
     def init_project(self, dirname, chroot):
         """
@@ -58,7 +78,7 @@ class Storage:
         """
         raise NotImplementedError
 
-    def upload_build_results(self, chroot, results_dir, target_dir_name, max_workers=1, build_id=None):
+    def upload_build_results(self, chroot, results_dir, target_dir_name, max_workers=None, build_id=None):
         """
         Add results for a new build to the storage
         """
@@ -133,6 +153,7 @@ class BackendStorage(Storage):
             self.opts.destdir, self.owner, self.project, chroot)
 
         self.log.info("Going to delete: %s", chroot_path)
+        self.readiness.forget(self.readiness_name(self.project, chroot))
         if not os.path.isdir(chroot_path):
             self.log.error("Directory %s not found", chroot_path)
             return
@@ -140,6 +161,7 @@ class BackendStorage(Storage):
 
     def delete_project(self, dirname):
         path = os.path.join(self.opts.destdir, self.owner, dirname)
+        self.readiness.forget_prefix(self.readiness_name(dirname, ""))
         if os.path.exists(path):
             self.log.info("Removing copr dir %s", path)
             shutil.rmtree(path)
@@ -192,7 +214,10 @@ class PulpStorage(Storage):
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.client = PulpClient.create_from_config_file()
+        self.client = PulpClient.create_from_config_file(
+            pool_size=self.opts.pulp_upload_workers)
+        # {repository or distribution name: pulp_href}
+        self._hrefs = {}
 
     def init_project(self, dirname, chroot):
         repository = self._repository_name(chroot, dirname)
@@ -218,24 +243,21 @@ class PulpStorage(Storage):
 
     def upload_rpm(self, repository, path, labels):
         """
-        Add an RPM to the storage
+        Start adding an RPM to the storage, return the Pulp task href (or None
+        on failure)
         """
         response = self.client.create_content(repository, path, labels)
-
         if not response.ok:
             self.log.error("Failed to create Pulp content for: %s, %s",
                            path, response.text)
-            return response
+            return None
+        return response.json()["task"]
 
-        # This involves a lot of unnecessary waiting until every
-        # RPM content is created. Once we can reliably label Pulp
-        # content with Copr build ID, we should drop this code and stop
-        # creating the `pulp.json` file
-        task = response.json()["task"]
-        response = self.client.wait_for_finished_task(task)
-        return response
+    def upload_build_results(self, chroot, results_dir, target_dir_name, max_workers=None, build_id=None):
+        max_workers = max_workers or self.opts.pulp_upload_workers
+        repository = self._get_repository(chroot)
+        labels = {"build_id": build_id}
 
-    def upload_build_results(self, chroot, results_dir, target_dir_name, max_workers=1, build_id=None):
         futures = {}
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             for root, _, files in os.walk(results_dir):
@@ -251,29 +273,36 @@ class PulpStorage(Storage):
                         continue
 
                     path = os.path.join(root, name)
-                    repository = self._get_repository(chroot)
-                    labels = {"build_id": build_id}
                     futures[executor.submit(self.upload_rpm, repository, path, labels)] = name
 
-            failed_tasks = []
+            tasks = {}
             exceptions = []
             for future in as_completed(futures):
                 filepath = futures[future]
                 try:
-                    response = future.result()
-                    created = response.json().get("created_resources")
-                    if created:
-                        self.log.info("Uploaded to Pulp: %s", filepath)
-                    else:
-                        failed_tasks.append(response.json().get("pulp_href"))
-                except RuntimeError as exc:
+                    task = future.result()
+                except (RuntimeError, requests.RequestException) as exc:
                     exceptions.append(f"{filepath} generated an exception: {exc}")
+                    continue
+                if task:
+                    tasks[task] = filepath
+                else:
+                    exceptions.append(f"{filepath} failed to upload")
+
+        # Wait for all the content to be created at once, instead of one by one
+        finished = self.client.wait_for_finished_tasks(list(tasks))
+        failed_tasks = []
+        for task, filepath in tasks.items():
+            if finished.get(task, {}).get("created_resources"):
+                self.log.info("Uploaded to Pulp: %s", filepath)
+            else:
+                failed_tasks.append(task)
 
-            if failed_tasks:
-                raise CoprBackendError(
-                    "Pulp tasks {0} didn't create any resources".format(failed_tasks))
-            if exceptions:
-                raise CoprBackendError(f"Exceptions encountered: {exceptions}")
+        if failed_tasks:
+            raise CoprBackendError(
+                "Pulp tasks {0} didn't create any resources".format(failed_tasks))
+        if exceptions:
+            raise CoprBackendError(f"Exceptions encountered: {exceptions}")
 
     def publish_repository(self, chroot, **kwargs):
         repository = self._get_repository(chroot)
@@ -307,6 +336,7 @@ class PulpStorage(Storage):
             self.log.error("Failed to update Pulp distribution %s for because %s",
                            distribution_name, response.text)
             return False
+        self.readiness.mark_ready(self.readiness_name(self.project, chroot))
         return True
 
     def delete_repository(self, chroot):
@@ -314,6 +344,8 @@ class PulpStorage(Storage):
         distribution = self._get_distribution(chroot)
         self.client.delete_repository(repository)
         self.client.delete_distribution(distribution)
+        self._hrefs.clear()
+        self.readiness.forget(self.readiness_name(self.project, chroot))
 
     def delete_project(self, dirname):
         prefix = "{0}/{1}".format(self.owner, dirname)
@@ -323,6 +355,8 @@ class PulpStorage(Storage):
             self.client.delete_distribution(distribution["pulp_href"])
             if distribution["repository"]:
                 self.client.delete_repository(distribution["repository"])
+        self._hrefs.clear()
+        self.readiness.forget_prefix(prefix + "/")
 
     def delete_builds(self, dirname, chroot_builddirs, build_ids):
         # pylint: disable=too-many-locals
@@ -379,6 +413,9 @@ class PulpStorage(Storage):
         response = requests.head(repodata)
         return response.ok
 
+    def readiness_name(self, dirname, chroot):
+        return self._distribution_name(chroot, dirname)
+
     def _repository_name(self, chroot, dirname=None):
         return "/".join([
             self.owner,
@@ -393,11 +430,17 @@ class PulpStorage(Storage):
         return repository
 
     def _get_repository(self, chroot):
-        name = self._repository_name(chroot)
-        response = self.client.get_repository(name)
-        return response.json()["results"][0]["pulp_href"]
+        key = ("repository", self._repository_name(chroot))
+        if key not in self._hrefs:
+            response = self.client.get_repository(key[1])
+            self._hrefs[key] = response.json()["results"][0]["pulp_href"]
+        return self._hrefs[key]
 
     def _get_distribution(self, chroot):
-        name = self._distribution_name(chroot)
-        response = self.client.get_distribution(name)
-        return response.json()["results"][0]["pulp_href"]
+        # For non-devel projects the distribution name is the same as the
+        # repository name, so the cache is keyed by the object kind, too.
+        key = ("distribution", self._distribution_name(chroot))
+        if key not in self._hrefs:
+            response = self.client.get_distribution(key[1])
+            self._hrefs[key] = response.json()["results"][0]["pulp_href"]
+        return self._hrefs[key]
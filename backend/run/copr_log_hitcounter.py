@@ -13,43 +13,48 @@ import os
 import logging
 import argparse
 from datetime import datetime
+from functools import lru_cache
 from copr_common.log import setup_script_logger
-from copr_backend.hitcounter import update_frontend
+from copr_backend.hitcounter import HitCounter, HIT_WINDOW, send_hits
 
 
 log = logging.getLogger(__name__)
 setup_script_logger(log, "/var/log/copr-backend/hitcounter.log")
 
+# The fields before referer never contain spaces, so we don't let the regex
+# engine backtrack through the whole line for each of them.
 logline_regex = re.compile(
-    r'(?P<ip_address>.*)\s+(?P<hostname>.*)\s+-\s+\[(?P<timestamp>.*)\]\s+'
-    r'"GET (?P<url>.*)\s+(?P<protocol>.*)"\s+(?P<code>.*)\s+(?P<bytes_sent>.*)\s+'
+    r'(?P<ip_address>\S*)\s+(?P<hostname>\S*)\s+-\s+\[(?P<timestamp>[^\]]*)\]\s+'
+    r'"GET (?P<url>\S*)\s+(?P<protocol>[^"\s]*)"\s+(?P<code>\S*)\s+(?P<bytes_sent>\S*)\s+'
     r'"(?P<referer>.*)"\s+"(?P<agent>.*)"', re.IGNORECASE)
 
 
 def parse_access_file(path):
     """
-    Take a raw access file and return its contents as a list of dicts.
+    Take a raw access file and generate its contents as dicts, line by line.
     """
     with open(path, 'r') as logfile:
-        content = logfile.readlines()
-    assert content[0].startswith("=== start:")
-
-    accesses = []
-    for line in content[1:]:
-        m = logline_regex.match(line)
-        if not m:
-            continue
-        # Rename dict keys to match `copr-aws-s3-hitcounter`
-        access = m.groupdict()
-        access["cs-uri-stem"] = access.pop("url")
-        access["sc-status"] = access.pop("code")
-        access["cs(User-Agent)"] = access.pop("agent")
-        timestamp = datetime.strptime(access.pop("timestamp"),
-                                      "%d/%b/%Y:%H:%M:%S %z")
-        access["time"] = timestamp.strftime("%H:%M:%S")
-        access["date"] = timestamp.strftime("%Y-%m-%d")
-        accesses.append(access)
-    return accesses
+        assert logfile.readline().startswith("=== start:")
+
+        for line in logfile:
+            m = logline_regex.match(line)
+            if not m:
+                continue
+            # Rename dict keys to match `copr-aws-s3-hitcounter`
+            access = m.groupdict()
+            access["cs-uri-stem"] = access.pop("url")
+            access["sc-status"] = access.pop("code")
+            access["cs(User-Agent)"] = access.pop("agent")
+            date, time = _parse_timestamp(access.pop("timestamp"))
+            access["time"] = time
+            access["date"] = date
+            yield access
+
+
+@lru_cache(maxsize=65536)
+def _parse_timestamp(timestamp):
+    timestamp = datetime.strptime(timestamp, "%d/%b/%Y:%H:%M:%S %z")
+    return timestamp.strftime("%Y-%m-%d"), timestamp.strftime("%H:%M:%S")
 
 
 def get_arg_parser():
@@ -72,6 +77,13 @@ def get_arg_parser():
         "--verbose",
         action="store_true",
         help=("Print verbose information about what is going on"))
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=HIT_WINDOW,
+        metavar="SECONDS",
+        help=("Aggregate the hits per SECONDS long time windows, and send "
+              "one request to frontend per window"))
     return parser
 
 
@@ -83,17 +95,16 @@ def main():
     if args.verbose:
         log.setLevel(logging.DEBUG)
 
-    # If the access.log gets too big, sending it all at once to frontend will
-    # timeout. Let's send it in chunks.
+    # The hits are pre-aggregated per time window, so each request to frontend
+    # is small enough even for a big access.log.
     # The issue is, there is no transaction mechanism, so theoretically some
-    # chunks may succeed, some fail and never be counted. But we try to send
+    # requests may succeed, some fail and never be counted. But we try to send
     # each request repeatedly and losing some access hits from time to time
     # isn't a mission critical issue and I would just roll with it.
-    accesses = parse_access_file(args.logfile)
-    size = 1000
-    chunks = [accesses[x:x+size] for x in range(0, len(accesses), size)]
-    for chunk in chunks:
-        update_frontend(chunk, log=log, dry_run=args.dry_run)
+    counter = HitCounter(log, window=args.window)
+    for access in parse_access_file(args.logfile):
+        counter.add(access)
+    send_hits(counter, log=log, dry_run=args.dry_run)
 
 
 if __name__ == "__main__":
@@ -12,8 +12,7 @@ import pwd
 
 from copr_backend.helpers import (BackendConfigReader, create_file_logger,
                              uses_devel_repo, call_copr_repo)
-from copr_backend.sign import get_pubkey, sign_rpms_in_dir, create_user_keys
-from copr_backend.exceptions import CoprSignNoKeyError
+from copr_backend.sign import get_pubkey, RpmSigner
 
 
 logging.basicConfig(
@@ -23,26 +22,10 @@ logging.basicConfig(
 log = logging.getLogger(__name__)
 
 
-def check_signed_rpms_in_pkg_dir(pkg_dir, user, project, opts, chroot_dir, devel):
-    success = True
-
-    logger = create_file_logger("run.check_signed_rpms_in_pkg_dir",
-                                "/tmp/copr_check_signed_rpms.log")
-    try:
-        sign_rpms_in_dir(user, project, pkg_dir, chroot_dir, opts, log=logger)
-        log.info("running createrepo for %s", pkg_dir)
-        call_copr_repo(directory=chroot_dir, devel=devel, logger=log)
-    except Exception as err:
-        success = False
-        log.error(">>> Failed to check/sign rpm in dir pkg_dir")
-        log.exception(err)
-
-    return success
-
-
-def check_signed_rpms(project_dir, user, project, opts, devel):
+def check_signed_rpms(project_dir, user, project, signer, devel):
     """
-    Ensure that all rpm files are signed
+    Ensure that all rpm files are signed.  All the packages in the project are
+    signed in one batch (concurrently), and createrepo is run once per chroot.
     """
     success = True
     for chroot_entry in os.scandir(project_dir):
@@ -56,6 +39,7 @@ def check_signed_rpms(project_dir, user, project, opts, devel):
 
         log.debug("> Checking chroot `%s` in dir `%s`", chroot, project_dir)
 
+        pkg_dirs = []
         for mb_pkg_entry in os.scandir(chroot_path):
             mb_pkg = mb_pkg_entry.name
             if mb_pkg in ["repodata", "devel"]:
@@ -64,12 +48,23 @@ def check_signed_rpms(project_dir, user, project, opts, devel):
             if not mb_pkg_entry.is_dir():
                 continue
 
-            log.debug(">> Stepping into package: %s", mb_pkg_path)
+            log.debug(">> Adding package to batch: %s", mb_pkg_path)
+            pkg_dirs.append((mb_pkg_path, chroot))
 
-            if not check_signed_rpms_in_pkg_dir(mb_pkg_path, user, project,
-                                                opts, chroot_path,
-                                                devel):
-                success = False
+        try:
+            errors = signer.sign_dirs(user, project, pkg_dirs)
+            log.info("running createrepo for %s", chroot_path)
+            call_copr_repo(directory=chroot_path, devel=devel, logger=log)
+        except Exception as err:
+            success = False
+            log.error(">>> Failed to check/sign rpms in chroot %s", chroot_path)
+            log.exception(err)
+            continue
+
+        if errors:
+            success = False
+            log.error(">>> Failed to sign rpms: %s",
+                      ", ".join(rpm for rpm, _ in errors))
 
     return success
 
@@ -104,6 +99,11 @@ def main():
     opts = BackendConfigReader().read()
     log.info("Starting pubkey fill, destdir: %s", opts.destdir)
 
+    # don't hang on a keygen outage, the project is marked as failed instead
+    signer = RpmSigner(opts, create_file_logger(
+        "run.check_signed_rpms", "/tmp/copr_check_signed_rpms.log"),
+        try_indefinitely=False)
+
     log.debug("list dir: %s", (d.name for d in os.scandir(opts.destdir)))
     for user_name_entry in os.scandir(opts.destdir):
         user_name = user_name_entry.name
@@ -120,11 +120,10 @@ def main():
             log.info("Checking project dir: %s", project_name)
 
             try:
-                get_pubkey(user_name, project_name, log, opts.sign_domain)
-                log.info("Key-pair exists for %s/%s", user_name, project_name)
-            except CoprSignNoKeyError:
-                create_user_keys(user_name, project_name, opts)
-                log.info("Created new key-pair for %s/%s", user_name, project_name)
+                if signer.ensure_pubkey(user_name, project_name) is None:
+                    log.info("Created new key-pair for %s/%s", user_name, project_name)
+                else:
+                    log.info("Key-pair exists for %s/%s", user_name, project_name)
             except Exception as err:
                 log.error("Failed to get pubkey for {}/{}, mark as failed, skipping")
                 log.exception(err)
@@ -141,8 +140,8 @@ def main():
 
             project_dir = os.path.join(user_dir, project_name)
             pubkey_path = os.path.join(project_dir, "pubkey.gpg")
-            if not check_signed_rpms(project_dir, user_name, project_name, opts,
-                                     devel):
+            if not check_signed_rpms(project_dir, user_name, project_name,
+                                     signer, devel):
                 failed = False
 
             if not check_pubkey(pubkey_path, user_name, project_name, opts):
@@ -17,6 +17,7 @@ sys.path.append(os.path.join(WORKDIR, '..'))
 
 # pylint: disable=wrong-import-position
 from copr_common.redis_helpers import get_redis_connection
+from copr_common.worker_manager import worker_events_key
 
 REDIS_OPTS = Munch(
     redis_db=9,
@@ -45,13 +46,16 @@ def do_the_useful_stuff(process_counter, task_id, worker_id, sleep):
         raise Exception("sorry")
 
     redis = get_redis_connection(REDIS_OPTS)
+    events = worker_events_key(worker_id.rsplit(':', 1)[0])
 
     redis.hset(worker_id, 'started', 1)
+    redis.rpush(events, worker_id)
 
     if 'FAIL_STARTED_PID' in os.environ:
         return 0
 
     redis.hset(worker_id, 'PID', os.getpid())
+    redis.rpush(events, worker_id)
 
     if 'FAIL_STARTED' in os.environ:
         raise Exception("sorry")
@@ -61,6 +65,7 @@ def do_the_useful_stuff(process_counter, task_id, worker_id, sleep):
 
     result = 1 if process_counter % 8 else 2
     redis.hset(worker_id, 'status', str(result))
+    redis.rpush(events, worker_id)
     return 0
 
 
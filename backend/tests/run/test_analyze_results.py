@@ -0,0 +1,113 @@
+"""
+Test the ./run/copr-backend-analyze-results scanner
+"""
+
+import importlib.machinery
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+from unittest import mock
+
+from munch import Munch
+
+from testlib import minimal_be_config
+
+
+def _load_script():
+    config_dir = tempfile.mkdtemp(prefix="copr-test-analyze-results-")
+    config_file = minimal_be_config(config_dir)
+    loader = importlib.machinery.SourceFileLoader(
+        "analyze_results", "run/copr-backend-analyze-results")
+    spec = importlib.util.spec_from_loader("analyze_results", loader)
+    module = importlib.util.module_from_spec(spec)
+    # the multiprocessing pool needs to pickle the module functions
+    sys.modules["analyze_results"] = module
+    with mock.patch.dict(os.environ, {"BACKEND_CONFIG": config_file}):
+        loader.exec_module(module)
+    shutil.rmtree(config_dir)
+    return module
+
+
+SCRIPT = _load_script()
+
+
+def _write(path, size=16384):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fd:
+        fd.write(os.urandom(size))
+
+
+def _bytes(path):
+    return os.stat(path).st_blocks * 512
+
+
+class TestAnalyzeResults:
+    # pylint: disable=attribute-defined-outside-init
+
+    def setup_method(self, _method):
+        self.workdir = tempfile.mkdtemp(prefix="copr-test-analyze-results-")
+        self.resultdir = os.path.join(self.workdir, "results")
+        self.owner = os.path.join(self.resultdir, "owner")
+        for project in ["p1", "p2"]:
+            _write(os.path.join(self.owner, project, "fedora-39-x86_64",
+                                "00001-foo", "builder-live.log.gz"))
+        self.rpm = os.path.join(self.owner, "p1", "fedora-39-x86_64",
+                                "00001-foo", "foo-1-1.x86_64.rpm")
+        _write(self.rpm)
+        # forked build, hardlinked RPM
+        os.link(self.rpm, os.path.join(self.owner, "p2", "fedora-39-x86_64",
+                                       "00001-foo", "foo-1-1.x86_64.rpm"))
+
+    def teardown_method(self, _method):
+        shutil.rmtree(self.workdir)
+
+    def _analyze(self, full_rescan=False):
+        stats = [SCRIPT.Stats(name) for name in [
+            "chroots", "arches", "owners", "projects", "distros",
+            "project_chroots"]]
+        arguments = Munch(full_rescan=full_rescan, workers=2,
+                          log_progress_delay=30)
+        SCRIPT.analyze_resultdir(self.resultdir, stats, arguments,
+                                 os.path.join(self.workdir, "cache.json"))
+        return {stat.name: stat.data for stat in stats}
+
+    def test_hardlinked_rpm_counted_once(self):
+        data = self._analyze()
+        projects = data["projects"]
+        # the projects differ only by the RPM, counted in the first one
+        assert projects["owner/p1"] - projects["owner/p2"] == \
+            _bytes(self.rpm) // 1024
+        assert data["owners"]["owner"] == \
+            projects["owner/p1"] + projects["owner/p2"] + \
+            _bytes(self.owner) // 1024
+        assert data["chroots"]["fedora-39-x86_64"] == \
+            data["project_chroots"]["owner/p1/fedora-39-x86_64"] + \
+            data["project_chroots"]["owner/p2/fedora-39-x86_64"]
+
+        # the same results with the cache
+        assert self._analyze() == data
+
+    def test_cache_reused_until_fingerprint_changes(self):
+        device = os.stat(self.resultdir).st_dev
+        result = SCRIPT.scan_owner((self.owner, device, {}))
+        assert result["rescanned"] == 2
+        cache = result["projects"]
+
+        result = SCRIPT.scan_owner((self.owner, device, cache))
+        assert result["rescanned"] == 0
+        assert result["projects"] == cache
+
+        # new build in p2, the chroot directory mtime changes
+        chroot = os.path.join(self.owner, "p2", "fedora-39-x86_64")
+        _write(os.path.join(chroot, "00002-bar", "bar-1-1.x86_64.rpm"))
+        fingerprint = cache["p2"]["fingerprint"]
+        os.utime(chroot, ns=(fingerprint + 10**9, fingerprint + 10**9))
+
+        result = SCRIPT.scan_owner((self.owner, device, cache))
+        assert result["rescanned"] == 1
+        assert result["projects"]["p1"] == cache["p1"]
+        assert result["projects"]["p2"]["fingerprint"] != fingerprint
+        assert result["projects"]["p2"]["entries"]["fedora-39-x86_64"]["size"] > \
+            cache["p2"]["entries"]["fedora-39-x86_64"]["size"]
@@ -138,14 +138,15 @@ class TestAction(object):
         self.dummy = str(test_action)
 
     @mock.patch("copr_backend.actions.os.makedirs")
-    @mock.patch("copr_backend.actions.copy_tree")
+    @mock.patch("copr_backend.actions.clone_tree")
     @mock.patch("copr_backend.actions.os.path.exists")
-    @mock.patch("copr_backend.actions.unsign_rpms_in_dir")
+    @mock.patch("copr_backend.actions.RpmSigner")
     @mock.patch("copr_backend.helpers.subprocess.Popen")
-    def test_action_handle_forks(self, mc_popen, mc_unsign_rpms_in_dir,
+    def test_action_handle_forks(self, mc_popen, mc_signer,
                                  mc_exists, mc_copy_tree, _mc_os_makedirs,
                                  mc_time):
         mc_popen.return_value.communicate.return_value = ("", "")
+        mc_signer.return_value.resign_dirs.return_value = []
         mc_time.time.return_value = self.test_time
         mc_exists = True
         test_action = Action.create_from(
@@ -195,6 +196,14 @@ class TestAction(object):
             "/var/lib/copr/public_html/results/thrnciar/source-copr/fedora-17-i386/00000005-pkg2",
             "/var/lib/copr/public_html/results/thrnciar/destination-copr/fedora-17-i386/00000010-pkg2")
 
+        # all the RPMs are re-signed at once
+        resign_calls = mc_signer.return_value.resign_dirs.call_args_list
+        assert len(resign_calls) == 1
+        assert len(resign_calls[0][0][2]) == 6
+        assert resign_calls[0][0][2][2] == (
+            "/var/lib/copr/public_html/results/thrnciar/destination-copr/fedora-17-x86_64/00000009-pkg1",
+            "fedora-17-x86_64")
+
         # TODO: calling createrepo for srpm-builds is useless
         assert len(mc_popen.call_args_list) == 3
 
@@ -203,6 +212,8 @@ class TestAction(object):
             args = call[0][0]
             assert args[0] == 'copr-repo'
             dirs.add(args[2])
+            # only the forked builds are added to the repo
+            assert args[3::2] == ["--add", "--add"]
 
         for chroot in ['srpm-builds', 'fedora-17-i386', 'fedora-17-x86_64']:
             dir = '/var/lib/copr/public_html/results/thrnciar/destination-copr/' + chroot
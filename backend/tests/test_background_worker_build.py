@@ -13,16 +13,18 @@ import shutil
 import subprocess
 import time
 import tempfile
+import threading
 from unittest import mock
 
 from munch import Munch
 import pytest
 
-from copr_backend.constants import LOG_REDIS_FIFO
+from copr_backend.constants import LOG_REDIS_FIFO, PREFETCHED_TASK_REDIS_KEY
 from copr_backend.background_worker_build import (
     BuildBackgroundWorker, MESSAGES, BackendError, _average_step,
 )
 from copr_backend.job import BuildJob
+from copr_backend.repo_readiness import READY_KEY
 from copr_backend.exceptions import CoprSignError, FrontendClientException
 from copr_backend.vm_alloc import ResallocHost, RemoteHostAllocationTerminated
 from copr_backend.background_worker_build import COMMANDS, MIN_BUILDER_VERSION
@@ -126,6 +128,10 @@ def f_build_something():
     config.bw = _reset_build_worker()
     config.bw.redis_set_worker_flag("allocated", "true")
 
+    # the repositories marked as ready by previous tests
+    for key in config.bw._redis.scan_iter(READY_KEY.format("*")):
+        config.bw._redis.delete(key)
+
     # Don't waste time with mocking.  We don't want to log anywhere, and we want
     # to let BuildBackgroundWorker adjust the handlers.
     config.bw.log.handlers = []
@@ -234,6 +240,7 @@ def f_build_rpm_sign_on(f_build_rpm_case):
     config.bw = _reset_build_worker()
     return config
 
+@_patch_bwbuild_object("REPO_CHECK_PERIOD", 0)
 @_patch_bwbuild_object("time")
 def test_waiting_for_repo_fail(mc_time, f_build_rpm_case_no_repodata, caplog):
     """ check that worker loops in _wait_for_repo """
@@ -247,6 +254,7 @@ def test_waiting_for_repo_fail(mc_time, f_build_rpm_case_no_repodata, caplog):
     for exp in expected:
         assert exp in [(r[1], r[2]) for r in caplog.record_tuples]
 
+@_patch_bwbuild_object("REPO_CHECK_PERIOD", 0)
 @_patch_bwbuild_object("time")
 def test_waiting_for_repo_success(mc_time, f_build_rpm_case_no_repodata, caplog):
     """ check that worker loops in _wait_for_repo """
@@ -271,6 +279,39 @@ def test_waiting_for_repo_success(mc_time, f_build_rpm_case_no_repodata, caplog)
     assert (logging.INFO, MESSAGES["repo_waiting"]) \
         in [(r[1], r[2]) for r in caplog.record_tuples]
 
+@mock.patch("copr_backend.storage.BackendStorage.repository_exists")
+def test_waiting_for_repo_notified(mc_exists, f_build_rpm_case_no_repodata,
+                                   caplog):
+    """ check that _wait_for_repo() is woken up by RepoReadiness """
+    worker = f_build_rpm_case_no_repodata.bw
+    mc_exists.return_value = False
+
+    def _notify():
+        for _ in range(100):
+            if (logging.INFO, MESSAGES["repo_waiting"]) in \
+                    [(r[1], r[2]) for r in caplog.record_tuples]:
+                break
+            time.sleep(0.05)
+        name = worker.storage.readiness_name(worker.job.project_dirname,
+                                             worker.job.chroot)
+        worker.storage.readiness.mark_ready(name)
+
+    # shutdown ASAP after _wait_for_repo() call
+    worker._alloc_host = mock.MagicMock()
+    worker._alloc_host.side_effect = Exception("duh")
+
+    thread = threading.Thread(target=_notify)
+    thread.start()
+    start = time.time()
+    worker.process()
+    thread.join()
+
+    # _wait_for_repo() succeeded, and we continued to _alloc_host()
+    assert len(worker._alloc_host.call_args_list) == 1
+    assert time.time() - start < 5
+    # the storage was checked only once, we were woken up by the notification
+    assert len(mc_exists.call_args_list) == 1
+
 def test_full_rpm_build_no_sign(f_build_rpm_case, caplog):
     """
     Go through the whole (successful) build of a binary RPM
@@ -282,6 +323,10 @@ def test_full_rpm_build_no_sign(f_build_rpm_case, caplog):
     assert os.path.exists(os.path.join(results, "builder-live.log.gz"))
     assert os.path.exists(os.path.join(results, "backend.log.gz"))
 
+    with open(os.path.join(results, "files.json"), "r") as fd:
+        listed = {entry["name"] for entry in json.load(fd)["files"]}
+    assert {"builder-live.log.gz", "backend.log.gz"} <= listed
+
     found_success_log_entry = False
     for record in caplog.record_tuples:
         _, level, msg = record
@@ -649,6 +694,18 @@ def test_fe_failed_start(f_build_rpm_sign_on, caplog):
     # check that worker manager is notified
     assert worker.redis_get_worker_flag("status") == "done"
 
+def test_prefetched_build_task(f_build_rpm_case):
+    config = f_build_rpm_case
+    worker = config.bw
+    key = PREFETCHED_TASK_REDIS_KEY.format("848963-fedora-30-x86_64")
+    worker._redis.set(key, json.dumps(_get_rpm_job_object_dict()))
+    config.fe_client.return_value.get.side_effect = \
+        FrontendClientException("should not be called")
+    worker._get_build_job()
+    assert worker.job.task_id == "848963-fedora-30-x86_64"
+    assert not worker._redis.exists(key)
+    assert not config.fe_client.return_value.get.called
+
 @_patch_bwbuild_object("CANCEL_CHECK_PERIOD", 0.5)
 @mock.patch("copr_backend.sign.SIGN_BINARY", "tests/fake-bin-sign")
 def test_cancel_script_failure(f_build_rpm_sign_on, caplog):
@@ -109,3 +109,26 @@ def test_sandbox_priority():
         "background": True,
         "sandbox": "cecil/baz--submitter",
     })) == 1  # the same arch, but different sandbox
+
+
+def test_priority_forget():
+    prio = _PriorityCounter()
+    tasks = [BuildQueueTask({
+        "build_id": str(build_id),
+        "task_id": "{}-fedora-rawhide-x86_64".format(build_id),
+        "chroot": "fedora-rawhide-x86_64",
+        "project_owner": "cecil",
+    }) for build_id in [1, 2, 3]]
+    assert [prio.get_priority(task) for task in tasks[:2]] == [1, 2]
+
+    # the remaining tasks in the group keep the priority order
+    prio.forget(tasks[0].id)
+    assert prio.get_priority(tasks[2]) == 3
+
+    # unknown task IDs are ignored
+    prio.forget("666-fedora-rawhide-x86_64")
+
+    # empty group starts from zero
+    prio.forget(tasks[1].id)
+    prio.forget(tasks[2].id)
+    assert prio.get_priority(tasks[0]) == 1
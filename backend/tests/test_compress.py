@@ -0,0 +1,69 @@
+"""
+Test the in-process log compression
+"""
+
+import gzip
+import logging
+import os
+import time
+
+from copr_backend.compress import LogCompressor
+
+LOG = logging.getLogger()
+
+
+def test_compress_file(tmp_path):
+    src = os.path.join(str(tmp_path), "backend.log")
+    with open(src, "w") as fd:
+        fd.write("line\n" * 1000)
+    os.utime(src, (1000000000, 1000000000))
+    compressor = LogCompressor(src, LOG)
+    assert compressor.finish()
+    assert not os.path.exists(src)
+    assert not os.path.exists(src + ".gz.tmp")
+    assert os.stat(src + ".gz").st_mtime == 1000000000
+    with gzip.open(src + ".gz", "rt") as fd:
+        assert fd.read() == "line\n" * 1000
+
+
+def test_compress_followed_file(tmp_path):
+    src = os.path.join(str(tmp_path), "builder-live.log")
+    compressor = LogCompressor(src, LOG, follow=True, poll_period=0.01)
+    compressor.start()
+    time.sleep(0.05)
+    with open(src, "w") as fd:
+        for i in range(50):
+            fd.write("line {}\n".format(i))
+            fd.flush()
+            time.sleep(0.002)
+    compressor.stop()
+    assert compressor.finish()
+    with gzip.open(src + ".gz", "rt") as fd:
+        assert fd.read() == "".join("line {}\n".format(i) for i in range(50))
+
+
+def test_compress_aborted(tmp_path):
+    src = os.path.join(str(tmp_path), "builder-live.log")
+    with open(src, "w") as fd:
+        fd.write("first attempt\n")
+    compressor = LogCompressor(src, LOG, follow=True, poll_period=0.01)
+    compressor.start()
+    compressor.abort()
+    assert os.listdir(str(tmp_path)) == ["builder-live.log"]
+
+
+def test_compress_errors(tmp_path, caplog):
+    src = os.path.join(str(tmp_path), "builder-live.log")
+    assert not LogCompressor(src, LOG).finish()
+    with open(src, "w") as fd:
+        fd.write("data\n")
+    with open(src + ".gz", "w") as fd:
+        fd.write("precreated\n")
+    assert not LogCompressor(src, LOG).finish()
+    assert os.path.exists(src)
+    assert sorted(os.listdir(str(tmp_path))) == ["builder-live.log",
+                                                "builder-live.log.gz"]
+    messages = [record[2] for record in caplog.record_tuples]
+    assert "Unable to compress file {}".format(src) in messages[0]
+    assert messages[1] == "Compressed log {}.gz exists".format(src)
+
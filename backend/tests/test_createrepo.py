@@ -2,7 +2,11 @@ import os
 import json
 import logging
 import tempfile
+import threading
 import shutil
+from unittest import mock
+
+import munch
 
 import testlib
 from testlib import assert_logs_exist, AsyncCreaterepoRequestFactory
@@ -10,10 +14,13 @@ from testlib import assert_logs_exist, AsyncCreaterepoRequestFactory
 from copr_common.redis_helpers import get_redis_connection
 from copr_backend.createrepo import (
     BatchedCreaterepo,
+    CreaterepoClient,
+    CreaterepoRequest,
     MAX_IN_BATCH,
 )
+from copr_backend.daemons.createrepo import CreaterepoService
 
-from copr_backend.helpers import BackendConfigReader
+from copr_backend.helpers import BackendConfigReader, call_copr_repo
 
 # pylint: disable=attribute-defined-outside-init
 
@@ -257,3 +264,100 @@ class TestBatchedCreaterepo:
                     without_status.add(add_dir)
         assert "add_2" in without_status
         assert len(without_status) == 3
+
+
+def test_createrepo_request_merge():
+    request = CreaterepoRequest("/some/dir", add=["add_1"], delete=["del_1"])
+    assert not request.full
+    request.merge(CreaterepoRequest("/some/dir", add=["add_2"],
+                                    rpms_to_remove=["x.rpm"]))
+    assert request.command() == [
+        "copr-repo", "--batched", "/some/dir", "--add", "add_1", "--add",
+        "add_2", "--delete", "del_1", "--rpms-to-remove", "x.rpm"]
+
+    # full createrepo can not be merged with delete requests
+    full = CreaterepoRequest("/some/dir", do_stat=True)
+    assert not request.can_merge(full)
+    assert not full.can_merge(request)
+
+    # full createrepo request inherited from others
+    request = CreaterepoRequest("/some/dir", add=["add_1"])
+    request.merge(CreaterepoRequest("/some/dir", add=["add_2"]))
+    request.merge(full)
+    assert request.full
+    assert request.merged == 3
+    assert request.command() == [
+        "copr-repo", "--batched", "/some/dir", "--do-stat"]
+    request.merge(CreaterepoRequest("/some/dir", add=["add_3"]))
+    assert request.command() == [
+        "copr-repo", "--batched", "/some/dir", "--do-stat"]
+    assert not request.can_merge(
+        CreaterepoRequest("/some/dir", rpms_to_remove=["x.rpm"]))
+
+    devel = CreaterepoRequest("/some/dir", add=["add_3"], devel=True)
+    assert devel.key != request.key
+    assert CreaterepoRequest.from_dict(devel.to_dict()).command() == [
+        "copr-repo", "--batched", "/some/dir", "--add", "add_3", "--devel"]
+
+
+class TestCreaterepoService:
+    def setup_method(self):
+        self.workdir = tempfile.mkdtemp(prefix="copr-createrepo-service-")
+        self.socket_path = os.path.join(self.workdir, "createrepo.sock")
+        self.service = CreaterepoService(window=0.5, workers=2,
+                                         socket_path=self.socket_path)
+        self.thread = threading.Thread(target=self.service.serve,
+                                       args=(self.service.listen(),))
+        self.thread.start()
+
+    def teardown_method(self):
+        self.service.stop()
+        self.thread.join()
+        shutil.rmtree(self.workdir)
+
+    @mock.patch("copr_backend.daemons.createrepo.run_cmd")
+    def test_requests_coalesced(self, run_cmd):
+        run_cmd.return_value = munch.Munch(returncode=0)
+        client = CreaterepoClient(self.socket_path)
+        futures = [
+            client.submit(CreaterepoRequest("/some/dir", add=["add_1"])),
+            client.submit(CreaterepoRequest("/some/dir", add=["add_2"])),
+            client.submit(CreaterepoRequest("/some/dir", delete=["del_1"])),
+            client.submit(CreaterepoRequest("/other/dir", add=["add_1"])),
+        ]
+        assert [future.result(timeout=10) for future in futures] == [True] * 4
+        assert sorted(call[0][0] for call in run_cmd.call_args_list) == [
+            ["copr-repo", "--batched", "/other/dir", "--add", "add_1"],
+            ["copr-repo", "--batched", "/some/dir", "--add", "add_1",
+             "--add", "add_2", "--delete", "del_1"],
+        ]
+
+    @mock.patch("copr_backend.daemons.createrepo.run_cmd")
+    def test_full_request_not_merged_with_delete(self, run_cmd):
+        run_cmd.return_value = munch.Munch(returncode=0)
+        client = CreaterepoClient(self.socket_path)
+        futures = [
+            client.submit(CreaterepoRequest("/some/dir", delete=["del_1"])),
+            client.submit(CreaterepoRequest("/some/dir")),
+        ]
+        assert [future.result(timeout=10) for future in futures] == [True] * 2
+        # the requests may arrive in any order, but the full run is separate
+        assert sorted(call[0][0] for call in run_cmd.call_args_list) == [
+            ["copr-repo", "--batched", "/some/dir"],
+            ["copr-repo", "--batched", "/some/dir", "--delete", "del_1"],
+        ]
+
+    @mock.patch("copr_backend.daemons.createrepo.run_cmd")
+    def test_call_copr_repo_uses_service(self, run_cmd):
+        run_cmd.return_value = munch.Munch(returncode=1)
+        with mock.patch("copr_backend.createrepo.CREATEREPO_SOCKET",
+                        self.socket_path), \
+                mock.patch("copr_backend.helpers.run_cmd") as helpers_run_cmd:
+            assert call_copr_repo("/some/dir", add=["add_1", None]) is False
+        assert not helpers_run_cmd.called
+        assert run_cmd.call_args[0][0] == [
+            "copr-repo", "--batched", "/some/dir", "--add", "add_1"]
+
+    def test_service_not_running(self):
+        assert CreaterepoClient(self.socket_path + ".missing").submit(
+            CreaterepoRequest("/some/dir")) is None
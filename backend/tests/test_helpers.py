@@ -5,16 +5,21 @@ import json
 import logging
 import tempfile
 import shutil
+from unittest import mock
+import pytest
 from munch import Munch
 
 from copr_common.tree import walk_limited
 from copr_common.redis_helpers import get_redis_connection
 from copr_backend.background_worker_build import BackendError
 from copr_backend.helpers import (
+    clone_tree,
     copy2_but_hardlink_rpms,
+    reflink_file,
     get_chroot_arch,
     get_redis_logger,
     format_filename,
+    write_results_manifest,
 )
 from copr_backend.constants import LOG_REDIS_FIFO
 
@@ -148,3 +153,100 @@ class TestHelpers(object):
             assert _read(rpmfile_dst) == "rpmfile re-signed"
             # copied file is not affected
             assert _read(textfile_dst) == "text"
+
+    @mock.patch("copr_backend.helpers.reflink_file")
+    def test_clone_tree(self, mc_reflink):
+        mc_reflink.side_effect = OSError("reflinks not supported")
+
+        def _write(filename, contents):
+            with open(filename, "w", encoding="utf-8") as fd:
+                fd.write(contents)
+
+        def _read(filename):
+            with open(filename, "r", encoding="utf-8") as fd:
+                return fd.read()
+
+        with tempfile.TemporaryDirectory(prefix="copr-test-clone") as workdir:
+            src = os.path.join(workdir, "src")
+            dst = os.path.join(workdir, "dst")
+            os.makedirs(os.path.join(src, "subdir"))
+            # the destination directory may already exist
+            os.mkdir(dst)
+
+            _write(os.path.join(src, "subdir", "test.txt"), "text")
+            _write(os.path.join(src, "test.rpm"), "rpmfile")
+
+            clone_tree(src, dst)
+            assert len(mc_reflink.call_args_list) == 2
+
+            # RPMs are re-signed in-place, those must be copied
+            _write(os.path.join(src, "test.rpm"), "rpmfile re-signed")
+            assert _read(os.path.join(dst, "test.rpm")) == "rpmfile"
+            # other files are hardlinked
+            assert os.path.samefile(os.path.join(src, "subdir", "test.txt"),
+                                    os.path.join(dst, "subdir", "test.txt"))
+
+    @mock.patch("copr_backend.helpers.reflink_file")
+    def test_clone_tree_rerun(self, mc_reflink):
+        mc_reflink.side_effect = OSError("reflinks not supported")
+        with tempfile.TemporaryDirectory(prefix="copr-test-clone") as workdir:
+            src = os.path.join(workdir, "src")
+            dst = os.path.join(workdir, "dst")
+            os.mkdir(src)
+            for name in ["builder-live.log.gz", "test.rpm"]:
+                with open(os.path.join(src, name), "w", encoding="utf-8") as fd:
+                    fd.write("contents")
+
+            clone_tree(src, dst)
+            # the destination RPM was re-signed meanwhile
+            with open(os.path.join(dst, "test.rpm"), "w", encoding="utf-8") as fd:
+                fd.write("re-signed")
+            clone_tree(src, dst)
+
+            for name in ["builder-live.log.gz", "test.rpm"]:
+                for directory in [src, dst]:
+                    with open(os.path.join(directory, name), "r",
+                              encoding="utf-8") as fd:
+                        assert fd.read() == "contents"
+
+    def test_reflink_file_existing_dest(self):
+        with tempfile.TemporaryDirectory(prefix="copr-test-clone") as workdir:
+            src = os.path.join(workdir, "src")
+            dst = os.path.join(workdir, "dst")
+            with open(src, "w", encoding="utf-8") as fd:
+                fd.write("contents")
+            os.link(src, dst)
+            with pytest.raises(OSError):
+                reflink_file(src, dst)
+            assert os.path.getsize(src) == 8
+
+    def test_write_results_manifest(self):
+        log = logging.getLogger(__name__)
+        with tempfile.TemporaryDirectory(prefix="copr-test-manifest") as workdir:
+            os.makedirs(os.path.join(workdir, "fedora-review"))
+            os.makedirs(os.path.join(workdir, "prev_build_backup"))
+            for name, contents in [("foo-1-1.x86_64.rpm", "rpm"),
+                                   ("fedora-review/review.txt", "review"),
+                                   ("prev_build_backup/backend.log.gz", "old")]:
+                with open(os.path.join(workdir, name), "w",
+                          encoding="utf-8") as fd:
+                    fd.write(contents)
+
+            assert write_results_manifest(workdir, log) == 2
+            # re-generating the manifest doesn't list the manifest itself
+            assert write_results_manifest(workdir, log) == 2
+
+            with open(os.path.join(workdir, "files.json"), "r",
+                      encoding="utf-8") as fd:
+                manifest = json.load(fd)
+            assert manifest["files"] == [{
+                "name": "foo-1-1.x86_64.rpm",
+                "size": 3,
+                "sha256": "9e7ab438597fee20e16e8e441bed0ce9"
+                          "66bd59e0fb993fa7c94be31fb1384d88",
+            }, {
+                "name": "fedora-review/review.txt",
+                "size": 6,
+                "sha256": "c97ace4c8fef2cee8fa0f3c9f52aab18"
+                          "dbd4f42438afe362ffb8f75ce4c04b84",
+            }]
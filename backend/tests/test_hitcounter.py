@@ -0,0 +1,85 @@
+"""
+Test the shared hitcounter logic
+"""
+
+import logging
+from unittest import mock
+
+from munch import Munch
+
+from copr_backend.hitcounter import HitCounter, get_hit_data, send_hits
+
+LOG = logging.getLogger()
+
+
+def _access(url, date="2023-10-01", time="10:00:00", status="200",
+            agent="libdnf (Fedora Linux 38; generic; Linux.x86_64)"):
+    return {
+        "cs-uri-stem": url,
+        "sc-status": status,
+        "cs(User-Agent)": agent,
+        "date": date,
+        "time": time,
+    }
+
+
+RPM = "/results/@copr/copr-dev/fedora-38-x86_64/00001-foo/foo-1.0-1.fc38.rpm"
+REPOMD = "/results/%40copr/copr-dev/fedora-38-x86_64/repodata/repomd.xml"
+
+ACCESSES = [
+    _access(RPM),
+    _access(RPM, time="10:30:00"),
+    _access(REPOMD, time="11:15:00"),
+    _access(RPM, status="404"),
+    _access(RPM, agent="Mock (Fedora 38; x86_64)"),
+    _access(RPM, agent="Mozilla/5.0 (compatible; Googlebot/2.1)"),
+    _access("/results/%2540copr/copr-dev/fedora-38-x86_64/repodata/repomd.xml"),
+    _access("/results/@copr/copr-dev/srpm-builds/00001/foo-1.0-1.src.rpm"),
+    _access("/results/@copr/copr-dev/pubkey.gpg"),
+]
+
+
+def test_get_hit_data():
+    data = get_hit_data(ACCESSES, LOG)
+    assert data["ts_to"] - data["ts_from"] == 75 * 60
+    assert data["hits"] == {
+        "chroot_rpms_dl_stat|@copr|copr-dev|fedora-38-x86_64": 2,
+        "project_rpms_dl_stat|@copr|copr-dev": 2,
+        "chroot_repo_metadata_dl_stat|@copr|copr-dev|fedora-38-x86_64": 1,
+    }
+    assert get_hit_data(ACCESSES[3:], LOG) == {}
+
+
+def test_hit_counter_windows():
+    counter = HitCounter(LOG, window=3600)
+    for access in ACCESSES[:2]:
+        counter.add(access)
+    other = HitCounter(LOG, window=3600)
+    for access in ACCESSES[2:]:
+        other.add(access)
+    counter.update(other)
+
+    payloads = list(counter.payloads())
+    assert len(payloads) == 2
+    assert payloads[0]["ts_to"] - payloads[0]["ts_from"] == 30 * 60
+    assert payloads[0]["hits"] == {
+        "chroot_rpms_dl_stat|@copr|copr-dev|fedora-38-x86_64": 2,
+        "project_rpms_dl_stat|@copr|copr-dev": 2,
+    }
+    assert payloads[1]["ts_from"] == payloads[1]["ts_to"]
+    assert payloads[1]["hits"] == {
+        "chroot_repo_metadata_dl_stat|@copr|copr-dev|fedora-38-x86_64": 1,
+    }
+
+
+@mock.patch("copr_backend.hitcounter.SafeRequest")
+def test_send_hits(request):
+    counter = HitCounter(LOG, window=3600)
+    for access in ACCESSES:
+        counter.add(access)
+    opts = Munch(frontend_base_url="http://frontend", frontend_auth="pwd")
+    send_hits(counter, LOG, opts=opts)
+    assert request.call_args[1]["compress"]
+    assert request.call_count == 1
+    assert [call[0][0] for call in request.return_value.post.call_args_list] \
+        == ["http://frontend/stats_rcv/from_backend"] * 2
@@ -4,7 +4,22 @@ Test Pulp client
 
 # pylint: disable=attribute-defined-outside-init
 
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from munch import Munch
+import pytest
+
+from copr_backend.exceptions import CoprBackendError
 from copr_backend.pulp import PulpClient
+from copr_backend.storage import PulpStorage
 
 
 class TestPulp:
@@ -37,3 +52,157 @@ class TestPulp:
         self.config["domain"] = "copr"
         assert client.url("api/v3/artifacts/")\
             == "http://pulp.fpo:24817/pulp/copr/api/v3/artifacts/"
+
+
+class MockPulpHandler(BaseHTTPRequestHandler):
+    """
+    Just enough of the Pulp API for uploading RPMs, the tasks are finished
+    after they are polled for the first time
+    """
+    # pylint: disable=invalid-name
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def _reply(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        pulp = self.server.pulp
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with pulp["lock"]:
+            pulp["requests"].append(url.path)
+            if url.path in ["/pulp/api/v3/repositories/rpm/rpm/",
+                            "/pulp/api/v3/distributions/rpm/rpm/"]:
+                href = "{0}{1}/".format(
+                    url.path, query["name"][0].replace("/", "-"))
+                return self._reply({"count": 1,
+                                    "results": [{"pulp_href": href}]})
+            if url.path == "/pulp/api/v3/tasks/":
+                results = []
+                for href in query["pulp_href__in"][0].split(","):
+                    task = pulp["tasks"][href]
+                    results.append(dict(task))
+                    task["state"] = "completed"
+                return self._reply({"count": len(results),
+                                    "results": results})
+        return self._reply({}, status=404)
+
+    def do_POST(self):
+        pulp = self.server.pulp
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with pulp["lock"]:
+            pulp["requests"].append(self.path)
+            href = "/pulp/api/v3/tasks/{0}/".format(len(pulp["tasks"]))
+            created = []
+            if b'filename="fail.rpm"' not in body:
+                created = ["/pulp/api/v3/content/rpm/packages/1/"]
+            pulp["tasks"][href] = {"pulp_href": href, "state": "running",
+                                   "created_resources": created}
+        return self._reply({"task": href}, status=202)
+
+
+class TestPulpStorage:
+
+    def setup_method(self, _method):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MockPulpHandler)
+        self.server.pulp = {"lock": threading.Lock(), "requests": [],
+                            "tasks": {}}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.config = {
+            "api_root": "/pulp/",
+            "base_url": "http://127.0.0.1:{0}".format(self.server.server_port),
+            "cert": "",
+            "key": "",
+            "domain": "default",
+            "username": "admin",
+            "password": "1234",
+        }
+        self.tmpdir = tempfile.mkdtemp(prefix="copr-test-pulp-")
+
+    def teardown_method(self, _method):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def _storage(self):
+        opts = Munch(pulp_upload_workers=8)
+        client = PulpClient(self.config, pool_size=8)
+        with mock.patch("copr_backend.storage.PulpClient"
+                        ".create_from_config_file", return_value=client):
+            return PulpStorage("owner", "project", None, False, opts,
+                               logging.getLogger())
+
+    def _results(self, names):
+        for name in names:
+            with open(os.path.join(self.tmpdir, name), "w") as fd:
+                fd.write("rpm")
+        with open(os.path.join(self.tmpdir, "builder-live.log"), "w") as fd:
+            fd.write("log")
+
+    def test_upload_build_results(self, caplog):
+        caplog.set_level(logging.INFO)
+        names = ["foo-{0}.x86_64.rpm".format(i) for i in range(20)]
+        self._results(names)
+        storage = self._storage()
+        with mock.patch("copr_backend.pulp.POLL_DELAY_MIN", 0.01):
+            storage.upload_build_results("fedora-rawhide-x86_64",
+                                         self.tmpdir, None, build_id=123)
+
+        uploaded = [r.getMessage() for r in caplog.records
+                    if r.getMessage().startswith("Uploaded to Pulp")]
+        assert sorted(uploaded) == sorted(
+            "Uploaded to Pulp: {0}".format(name) for name in names)
+
+        requests = self.server.pulp["requests"]
+        # the repository href is queried only once, and all the tasks are
+        # polled by one request (two, as all are running for the first time)
+        assert requests.count("/pulp/api/v3/repositories/rpm/rpm/") == 1
+        assert requests.count("/pulp/api/v3/content/rpm/packages/") == 20
+        assert requests.count("/pulp/api/v3/tasks/") == 2
+
+    def test_upload_build_results_failed_task(self):
+        self._results(["foo.x86_64.rpm", "fail.rpm"])
+        storage = self._storage()
+        with mock.patch("copr_backend.pulp.POLL_DELAY_MIN", 0.01):
+            with pytest.raises(CoprBackendError) as error:
+                storage.upload_build_results("fedora-rawhide-x86_64",
+                                             self.tmpdir, None, build_id=123)
+        assert "didn't create any resources" in str(error.value)
+        failed = [href for href, task in self.server.pulp["tasks"].items()
+                  if not task["created_resources"]]
+        assert str(failed) in str(error.value)
+
+    def test_repository_and_distribution_hrefs(self):
+        # pylint: disable=protected-access
+        # the distribution name equals the repository name (non-devel)
+        storage = self._storage()
+        chroot = "fedora-rawhide-x86_64"
+        assert storage._distribution_name(chroot) == \
+            storage._repository_name(chroot)
+        for _ in range(2):
+            assert storage._get_repository(chroot) == \
+                "/pulp/api/v3/repositories/rpm/rpm/owner-project-fedora-rawhide-x86_64/"
+            assert storage._get_distribution(chroot) == \
+                "/pulp/api/v3/distributions/rpm/rpm/owner-project-fedora-rawhide-x86_64/"
+        requests = self.server.pulp["requests"]
+        assert requests.count("/pulp/api/v3/repositories/rpm/rpm/") == 1
+        assert requests.count("/pulp/api/v3/distributions/rpm/rpm/") == 1
+
+    def test_wait_for_finished_tasks_chunks(self):
+        client = PulpClient(self.config)
+        tasks = {}
+        for i in range(250):
+            href = "/pulp/api/v3/tasks/{0}/".format(i)
+            tasks[href] = {"pulp_href": href, "state": "completed",
+                           "created_resources": []}
+        self.server.pulp["tasks"] = tasks
+        finished = client.wait_for_finished_tasks(list(tasks))
+        assert finished == tasks
+        assert self.server.pulp["requests"].count("/pulp/api/v3/tasks/") == 3
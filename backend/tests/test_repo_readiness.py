@@ -0,0 +1,67 @@
+"""
+Test the RepoReadiness registry
+"""
+
+# pylint: disable=attribute-defined-outside-init
+
+import logging
+import threading
+import time
+
+import munch
+
+from copr_common.redis_helpers import get_redis_connection
+from copr_backend.repo_readiness import RepoReadiness
+
+
+class TestRepoReadiness:
+    def setup_method(self, _method):
+        opts = munch.Munch(redis_db=9, redis_port=7777)
+        self.redis = get_redis_connection(opts)
+        self.redis.flushdb()
+        self.readiness = RepoReadiness(self.redis, logging.getLogger())
+
+    def teardown_method(self, _method):
+        self.redis.flushdb()
+
+    def test_mark_and_forget(self):
+        self.readiness.mark_ready("user/project/fedora-rawhide-x86_64")
+        self.readiness.mark_ready("user/project/fedora-rawhide-i386")
+        self.readiness.mark_ready("user/other/fedora-rawhide-i386")
+        assert self.readiness.is_ready("user/project/fedora-rawhide-x86_64")
+        assert not self.readiness.is_ready("user/project/epel-9-x86_64")
+
+        self.readiness.forget("user/project/fedora-rawhide-x86_64")
+        assert not self.readiness.is_ready("user/project/fedora-rawhide-x86_64")
+
+        self.readiness.forget_prefix("user/project/")
+        assert not self.readiness.is_ready("user/project/fedora-rawhide-i386")
+        assert self.readiness.is_ready("user/other/fedora-rawhide-i386")
+
+    def test_wait_already_ready(self):
+        self.readiness.mark_ready("user/project/fedora-rawhide-x86_64")
+        with self.readiness.waiter("user/project/fedora-rawhide-x86_64") as w:
+            assert w.wait(0)
+
+    def test_wait_timeout(self):
+        with self.readiness.waiter("user/project/fedora-rawhide-x86_64") as w:
+            start = time.monotonic()
+            assert not w.wait(0.2)
+            assert time.monotonic() - start >= 0.2
+
+    def test_wait_notified(self):
+        name = "user/project/fedora-rawhide-x86_64"
+
+        def _publish():
+            time.sleep(0.2)
+            self.readiness.mark_ready("user/project/fedora-rawhide-i386")
+            time.sleep(0.2)
+            self.readiness.mark_ready(name)
+
+        with self.readiness.waiter(name) as waiter:
+            thread = threading.Thread(target=_publish)
+            thread.start()
+            start = time.monotonic()
+            assert waiter.wait(30)
+            assert time.monotonic() - start < 10
+            thread.join()
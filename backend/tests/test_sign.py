@@ -1,3 +1,5 @@
+import json
+import logging
 import os
 import tempfile
 import shutil
@@ -8,11 +10,13 @@ from unittest.mock import MagicMock
 from munch import Munch
 import pytest
 
+from copr_backend.helpers import write_results_manifest
 from copr_backend.exceptions import CoprSignError, CoprSignNoKeyError, CoprKeygenRequestError
 from copr_backend.sign import (
     get_pubkey, _sign_one, sign_rpms_in_dir, create_user_keys,
     gpg_hashtype_for_chroot,
     call_sign_bin,
+    RpmSigner,
 )
 
 STDOUT = "stdout"
@@ -301,6 +305,130 @@ class TestSign(object):
 
         assert mc_so.called
 
+    @mock.patch("copr_backend.sign._sign_one")
+    @mock.patch("copr_backend.sign.create_user_keys")
+    @mock.patch("copr_backend.sign.get_pubkey")
+    def test_signer_batch(self, mc_gp, mc_cuk, mc_so, tmp_dir, tmp_files):
+        # pylint: disable=unused-argument
+        other_dir = os.path.join(self.tmp_dir_path, "other")
+        os.mkdir(other_dir)
+        for name in ["baz.rpm", "qux.rpm"]:
+            with open(os.path.join(other_dir, name), "w") as handle:
+                handle.write("1")
+
+        running = []
+        max_running = []
+
+        def _sign(path, *_args):
+            running.append(path)
+            max_running.append(len(running))
+            time.sleep(0.1)
+            running.remove(path)
+            if path.endswith("qux.rpm"):
+                raise CoprSignError("foobar")
+
+        mc_so.side_effect = _sign
+        self.opts.sign_workers = 2
+        signer = RpmSigner(self.opts, MagicMock())
+        errors = signer.sign_dirs(self.username, self.projectname, [
+            (self.tmp_dir_path, "epel-7-x86_64"),
+            (other_dir, "fedora-36-x86_64"),
+        ])
+        assert [rpm for rpm, _ in errors] == [os.path.join(other_dir, "qux.rpm")]
+        assert max(max_running) == 2
+        assert len(mc_so.call_args_list) == 4
+        hashtypes = {call[0][0]: call[0][2] for call in mc_so.call_args_list}
+        assert hashtypes[os.path.join(self.tmp_dir_path, "foo.rpm")] == "sha256"
+        assert hashtypes[os.path.join(other_dir, "baz.rpm")] == "sha256"
+
+        # the pubkey is checked only once per project
+        signer.sign_dirs(self.username, self.projectname,
+                         [(other_dir, "fedora-36-x86_64")])
+        assert len(mc_gp.call_args_list) == 1
+        signer.sign_dirs(self.username, "other",
+                         [(other_dir, "fedora-36-x86_64")])
+        assert len(mc_gp.call_args_list) == 2
+
+    @mock.patch("copr_backend.sign.create_user_keys")
+    @mock.patch("copr_backend.sign.get_pubkey")
+    def test_signer_ensure_pubkey(self, mc_gp, mc_cuk):
+        mc_gp.side_effect = CoprSignNoKeyError("no key")
+        signer = RpmSigner(self.opts, MagicMock())
+        assert signer.ensure_pubkey(self.username, self.projectname) is None
+        mc_cuk.assert_called_once_with(self.username, self.projectname,
+                                       self.opts, try_indefinitely=True)
+
+        # the key-pair is created only once
+        assert signer.ensure_pubkey(self.username, self.projectname) is None
+        assert len(mc_cuk.call_args_list) == 1
+
+        mc_cuk.reset_mock()
+        signer = RpmSigner(self.opts, MagicMock(), try_indefinitely=False)
+        signer.ensure_pubkey(self.username, self.projectname)
+        mc_cuk.assert_called_once_with(self.username, self.projectname,
+                                       self.opts, try_indefinitely=False)
+
+    @mock.patch("copr_backend.sign._sign_one")
+    @mock.patch("copr_backend.sign.create_user_keys")
+    @mock.patch("copr_backend.sign.get_pubkey")
+    def test_signer_updates_manifest(self, mc_gp, mc_cuk, mc_so, tmp_dir,
+                                     tmp_files):
+        # pylint: disable=unused-argument
+        def _sign(path, *_args):
+            with open(path, "w") as handle:
+                handle.write("signed")
+        mc_so.side_effect = _sign
+
+        log = logging.getLogger(__name__)
+        manifest = os.path.join(self.tmp_dir_path, "files.json")
+        write_results_manifest(self.tmp_dir_path, log)
+        signer = RpmSigner(self.opts, log)
+        dirs = [(self.tmp_dir_path, "fedora-36-x86_64")]
+        assert signer.sign_dirs(self.username, self.projectname, dirs) == []
+        with open(manifest, "r") as handle:
+            files = {entry["name"]: entry for entry in json.load(handle)["files"]}
+        assert files["foo.rpm"]["size"] == len("signed")
+        assert files["bad"]["size"] == 1
+
+        # the manifest is not created when it doesn't exist
+        os.unlink(manifest)
+        signer.sign_dirs(self.username, self.projectname, dirs)
+        assert not os.path.exists(manifest)
+
+    @mock.patch("copr_backend.sign._unsign_one")
+    @mock.patch("copr_backend.sign._sign_one")
+    @mock.patch("copr_backend.sign.create_user_keys")
+    @mock.patch("copr_backend.sign.get_pubkey")
+    def test_signer_resign(self, mc_gp, mc_cuk, mc_so, mc_uo, tmp_dir,
+                           tmp_files):
+        # pylint: disable=unused-argument
+        order = []
+        mc_uo.side_effect = lambda path: order.append(("unsign", path))
+        mc_so.side_effect = lambda path, *_args: order.append(("sign", path))
+
+        signer = RpmSigner(self.opts, MagicMock())
+        dirs = [(self.tmp_dir_path, "fedora-36-x86_64")]
+        assert signer.resign_dirs(self.username, self.projectname, dirs) == []
+        assert len(order) == 4
+        for path in ["foo.rpm", "bar.rpm"]:
+            path = os.path.join(self.tmp_dir_path, path)
+            assert order.index(("unsign", path)) < order.index(("sign", path))
+
+        # unsign failure, the RPM is not signed
+        order.clear()
+        mc_uo.side_effect = CoprSignError("foobar")
+        errors = signer.resign_dirs(self.username, self.projectname, dirs)
+        assert len(errors) == 2
+        assert not order
+
+        # only unsign
+        mc_uo.side_effect = None
+        mc_so.reset_mock()
+        assert signer.resign_dirs(self.username, self.projectname, dirs,
+                                  sign=False) == []
+        assert not mc_so.called
+        assert len(mc_gp.call_args_list) == 1
+
 
 def test_chroot_gpg_hashes():
     chroots = [
@@ -0,0 +1,206 @@
+"""
+Parallel download of the build results.  Copr Backend lists the files in each
+build chroot results directory (with sizes and checksums) in the
+RESULTS_MANIFEST file, so we don't have to crawl the HTML directory listings.
+"""
+
+import fnmatch
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from urllib.parse import quote, urljoin
+except ImportError:
+    from urllib import quote
+    from urlparse import urljoin
+
+
+RESULTS_MANIFEST = "files.json"
+DEFAULT_JOBS = 8
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
+
+REVIEW_FILES = [
+    "fedora-review/files.dir/*",
+    "fedora-review/licensecheck.txt",
+    "fedora-review/review.txt",
+    "fedora-review/review.json",
+    "fedora-review/rpmlint.txt",
+]
+
+
+def download_filters(args):
+    """
+    Convert the download-build arguments into the (include, exclude) lists of
+    glob patterns, see file_selected()
+    """
+    include = list(args.include or [])
+    if args.rpms:
+        include.append("*.rpm")
+    if args.spec:
+        include.append("*.spec")
+    if args.logs:
+        include.append("*.log.gz")
+    if args.review:
+        include.extend(REVIEW_FILES)
+    return include, list(args.exclude or [])
+
+
+def _matches(name, patterns):
+    basename = os.path.basename(name)
+    return any(fnmatch.fnmatch(name, pattern)
+               or fnmatch.fnmatch(basename, pattern)
+               for pattern in patterns)
+
+
+def file_selected(name, include, exclude):
+    """
+    Check if the file NAME (path relative to the results directory) should be
+    downloaded.  Patterns are matched against both the relative path and the
+    file basename.  Empty INCLUDE list selects all the files.
+    """
+    if include and not _matches(name, include):
+        return False
+    return not _matches(name, exclude)
+
+
+def file_sha256(path):
+    """ Calculate the sha256 hexdigest of the PATH file contents """
+    checksum = hashlib.sha256()
+    with open(path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(CHUNK_SIZE), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+class DownloadError(Exception):
+    """ The file can not be downloaded, or the checksum doesn't match """
+
+
+class ResultsDownloader(object):
+    """
+    Download the build results from multiple build chroots concurrently, using
+    a pooled HTTP session (connections to the backend are re-used).  The
+    partially downloaded files are stored as ``<file>.part``, and the download
+    is resumed from there next time.  The already existing files are not
+    downloaded again if their checksum matches.
+    """
+
+    def __init__(self, jobs=DEFAULT_JOBS, log=None):
+        self.jobs = max(jobs, 1)
+        self.log = log or print
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.jobs,
+                              pool_maxsize=self.jobs)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @staticmethod
+    def _url(result_url, name):
+        return urljoin(result_url.rstrip("/") + "/", quote(name))
+
+    def get_manifest(self, result_url):
+        """
+        Return the list of files in the RESULT_URL directory, or None if the
+        manifest is not available (e.g. builds from older Copr Backend).
+        """
+        url = self._url(result_url, RESULTS_MANIFEST)
+        try:
+            response = self.session.get(url, timeout=TIMEOUT)
+            if response.status_code != 200:
+                return None
+            return response.json()["files"]
+        except (requests.RequestException, ValueError, KeyError, TypeError):
+            return None
+
+    def _fetch(self, url, path, offset):
+        headers = {}
+        if offset:
+            headers["Range"] = "bytes={0}-".format(offset)
+        response = self.session.get(url, headers=headers, stream=True,
+                                    timeout=TIMEOUT)
+        with response:
+            if offset and response.status_code == 206:
+                mode = "ab"
+            elif response.status_code == 200:
+                mode = "wb"
+            else:
+                raise DownloadError("{0}: HTTP status {1}".format(
+                    url, response.status_code))
+            with open(path, mode) as fd:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    fd.write(chunk)
+
+    def download_file(self, url, path, size, sha256):
+        """
+        Download the URL into PATH, and verify the checksum.  Return False if
+        the file is already downloaded.
+        """
+        if os.path.exists(path) and os.path.getsize(path) == size \
+                and file_sha256(path) == sha256:
+            return False
+
+        part = path + ".part"
+        offset = 0
+        if os.path.exists(part):
+            offset = os.path.getsize(part)
+            if offset > size:
+                offset = 0
+
+        self._fetch(url, part, offset)
+        if file_sha256(part) != sha256 and offset:
+            # the partial file was probably from a different build attempt
+            self._fetch(url, part, 0)
+        if os.path.getsize(part) != size or file_sha256(part) != sha256:
+            os.unlink(part)
+            raise DownloadError("{0}: checksum mismatch".format(url))
+        os.rename(part, path)
+        return True
+
+    def _download_task(self, task):
+        url, path, size, sha256 = task
+        try:
+            if self.download_file(url, path, size, sha256):
+                self.log(path)
+            return None
+        except (DownloadError, requests.RequestException, OSError) as err:
+            return str(err)
+
+    def download(self, chroots, include, exclude):
+        """
+        Download the selected files from the CHROOTS list of (result_url,
+        destination directory) pairs.  Return the (unsupported, errors) pair;
+        the result_urls without manifest (these need to be downloaded the old
+        way), and the list of download errors.
+        """
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            manifests = list(executor.map(
+                self.get_manifest, [url for url, _ in chroots]))
+
+            unsupported = []
+            tasks = []
+            for (result_url, dest), files in zip(chroots, manifests):
+                if files is None:
+                    unsupported.append(result_url)
+                    continue
+                for entry in files:
+                    name = os.path.normpath(entry["name"])
+                    if os.path.isabs(name) or name == os.pardir \
+                            or name.startswith(os.pardir + os.sep):
+                        continue
+                    if not file_selected(name, include, exclude):
+                        continue
+                    path = os.path.join(dest, name)
+                    dirname = os.path.dirname(path)
+                    if not os.path.isdir(dirname):
+                        os.makedirs(dirname)
+                    tasks.append((self._url(result_url, entry["name"]), path,
+                                  entry["size"], entry["sha256"]))
+
+            errors = [error for error in executor.map(self._download_task,
+                                                      tasks) if error]
+        return unsupported, errors
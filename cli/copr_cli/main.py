@@ -31,6 +31,7 @@ from copr.v3 import (
     CoprConfigException, CoprNoResultException, CoprAuthException,
 )
 from copr.v3.pagination import next_page
+from copr_cli.download import DEFAULT_JOBS, ResultsDownloader, download_filters
 from copr_cli.helpers import cli_use_output_format, print_project_info
 from copr_cli.monitor import cli_monitor_parser
 from copr_cli.printers import cli_get_output_printer as get_printer
@@ -141,6 +142,8 @@ class Commands(object):
             self.config["gssapi"] = True
         self.config["connection_attempts"] = 3
         self.client = Client(self.config)
+        # Set to False when frontend can't watch the builds (see watch-build)
+        self._watch_supported = True
 
     @property
     def username(self):
@@ -220,6 +223,35 @@ class Commands(object):
             return owner, m.group(3), m.group(4)
         raise CoprException("Unexpected chroot path format")
 
+    def _get_changed_builds(self, build_ids, prevstatus):
+        """
+        Wait till some of the build_ids changes its state (compared to
+        prevstatus), return a list of (build_id, build) pairs.  With older
+        frontends (not able to watch the builds), or when watching too many
+        builds, we return all the builds and set self._watch_supported to
+        False.
+        """
+        try:
+            if self._watch_supported:
+                try:
+                    started = time.time()
+                    builds = self.client.build_proxy.watch(
+                        [{"id": build_id, "state": prevstatus[build_id]}
+                         for build_id in build_ids],
+                        timeout=30)
+                    if not builds:
+                        # frontend answers sooner when it is too busy to wait
+                        time.sleep(max(0, 30 - (time.time() - started)))
+                    return [(build.id, build) for build in builds]
+                except (CoprNoResultException, CoprRequestException):
+                    # frontend can't watch (these) builds, poll them
+                    self._watch_supported = False
+
+            return [(build_id, self.client.build_proxy.get(build_id=build_id))
+                    for build_id in build_ids]
+        except requests.ConnectionError as e:
+            raise CoprRequestException(e)
+
     def _watch_builds(self, build_ids):
         """
         :param build_ids: list of build IDs
@@ -235,13 +267,9 @@ class Commands(object):
 
         try:
             while watched != done:
-                for build_id in watched:
-                    if build_id in done:
-                        continue
-                    try:
-                        build_details = self.client.build_proxy.get(build_id=build_id)
-                    except requests.ConnectionError as e:
-                        raise CoprRequestException(e)
+                not_done = [x for x in build_ids if x not in done]
+                for build_id, build_details in \
+                        self._get_changed_builds(not_done, prevstatus):
                     now = datetime.datetime.now()
                     if prevstatus[build_id] != build_details.state:
                         prevstatus[build_id] = build_details.state
@@ -264,7 +292,8 @@ class Commands(object):
                 if watched == done:
                     break
 
-                time.sleep(30)
+                if not self._watch_supported:
+                    time.sleep(30)
 
             exception_message = ""
             separator = ""
@@ -639,6 +668,7 @@ class Commands(object):
         base_len = len(os.path.split(build.repo_url))
         build_chroots = self.client.build_chroot_proxy.get_list(args.build_id)
 
+        chroots = []
         for chroot in build_chroots:
             if args.chroots and chroot.name not in args.chroots:
                 continue
@@ -647,8 +677,19 @@ class Commands(object):
                 sys.stderr.write("No data for build id: {} and chroot: {}.\n".format(args.build_id, chroot.name))
                 continue
 
+            chroots.append((chroot.result_url, os.path.join(args.dest, chroot.name)))
+
+        include, exclude = download_filters(args)
+        downloader = ResultsDownloader(jobs=args.jobs)
+        unsupported, errors = downloader.download(chroots, include, exclude)
+
+        # Results without the files.json manifest (from older Copr Backend)
+        for result_url, dest in chroots:
+            if result_url not in unsupported:
+                continue
+
             cmd = ['wget', '-r', '-nH', '--no-parent', '--reject', '"index.html*"', '-e', 'robots=off', '--no-verbose']
-            cmd.extend(['-P', os.path.join(args.dest, chroot.name)])
+            cmd.extend(['-P', dest])
             cmd.extend(['--cut-dirs', str(base_len + 4)])
 
             if args.rpms:
@@ -660,6 +701,12 @@ class Commands(object):
             if args.logs:
                 cmd.extend(["-A", "*.log.gz"])
 
+            for pattern in args.include or []:
+                cmd.extend(["-A", pattern])
+
+            for pattern in args.exclude or []:
+                cmd.extend(["-R", pattern])
+
             if args.review:
                 cmd.extend([
                     "-A", "files.dir",
@@ -671,11 +718,16 @@ class Commands(object):
                 # fedora-review url redirects to the fedora-review/ and wget2 with -A option
                 # doesn't follow redirects in this case
                 # upstream issue: https://bugzilla.redhat.com/show_bug.cgi?id=2348400
-                cmd.append(chroot.result_url + "fedora-review/")
+                cmd.append(result_url + "fedora-review/")
 
-            cmd.append(chroot.result_url)
+            cmd.append(result_url)
             subprocess.call(cmd)
 
+        if errors:
+            for error in errors:
+                sys.stderr.write("Download failed: {}\n".format(error))
+            raise CoprException("Failed to download {} files".format(len(errors)))
+
     @requires_api_auth
     def action_cancel(self, args):
         """ Method called when the 'cancel' action has been selected by the
@@ -1550,6 +1602,30 @@ def setup_parser():
         action="store_true",
         help="Download only the .log files",
     )
+    parser_download_build.add_argument(
+        "--include",
+        dest="include",
+        metavar="PATTERN",
+        action="append",
+        help=("Download only the files matching the glob PATTERN (file name "
+              "or path in the results directory), can be specified "
+              "multiple times"),
+    )
+    parser_download_build.add_argument(
+        "--exclude",
+        dest="exclude",
+        metavar="PATTERN",
+        action="append",
+        help=("Don't download the files matching the glob PATTERN, can be "
+              "specified multiple times"),
+    )
+    parser_download_build.add_argument(
+        "--jobs", "-j",
+        dest="jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help="Number of parallel downloads (default: %(default)s)",
+    )
     parser_download_build.set_defaults(func="action_download_build")
 
     # create the parser for the "cancel" command
@@ -1,5 +1,6 @@
 import os
 import argparse
+import hashlib
 import json
 import logging
 import shutil
@@ -17,6 +18,7 @@ from copr.exceptions import (
 from copr.v3.exceptions import CoprAuthException
 from cli_tests_lib import config as mock_config, mock, MagicMock
 from copr_cli import main
+from copr_cli.download import ResultsDownloader
 from copr_cli.main import FrontendOutdatedCliException
 
 
@@ -27,6 +29,17 @@ def exit_wrap(value):
         return value.code
 
 
+@pytest.fixture(autouse=True)
+def old_frontend_watch():
+    """
+    By default, simulate frontend that can not watch the builds, so the tests
+    mocking BuildProxy.get() test the polling.
+    """
+    with mock.patch("copr.v3.proxies.build.BuildProxy.watch") as watch:
+        watch.side_effect = copr.v3.CoprNoResultException("Page Not Found")
+        yield watch
+
+
 # import logging
 #
 # logging.basicConfig(
@@ -372,6 +385,7 @@ def test_delete_project(config_from_file, project_proxy_delete, capsys):
     assert out == "Project foo has been deleted.\n"
 
 
+@responses.activate
 @mock.patch('copr_cli.main.subprocess')
 @mock.patch('copr.v3.proxies.build.BuildProxy.get')
 @mock.patch('copr.v3.proxies.build_chroot.BuildChrootProxy.get_list')
@@ -414,6 +428,7 @@ def test_download_build(config_from_file, build_chroot_proxy_get_list, build_pro
         assert call_args_list in expected_sp_call_args
 
 
+@responses.activate
 @mock.patch('copr_cli.main.subprocess')
 @mock.patch('copr.v3.proxies.build.BuildProxy.get')
 @mock.patch('copr.v3.proxies.build_chroot.BuildChrootProxy.get_list')
@@ -448,6 +463,89 @@ def test_download_build_select_chroot(config_from_file, build_chroot_proxy_get_l
     assert mock_sp.call.call_args_list == expected_sp_call_args
 
 
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@responses.activate
+@mock.patch('copr_cli.main.subprocess')
+@mock.patch('copr.v3.proxies.build.BuildProxy.get')
+@mock.patch('copr.v3.proxies.build_chroot.BuildChrootProxy.get_list')
+@mock.patch('copr_cli.main.config_from_file', return_value=mock_config)
+def test_download_build_manifest(config_from_file, build_chroot_proxy_get_list,
+                                 build_proxy_get, mock_sp, capsys, tmp_path):
+    build_proxy_get.return_value = MagicMock(
+        repo_url="http://example.com/results/epel-6-x86_64/python-copr-1.50-1.fc20")
+
+    url = "http://example.com/results/epel-6-x86_64/python-copr-1.50-1.fc20/"
+    mock_ch1 = MagicMock()
+    mock_ch1.configure_mock(name="epel-6-x86_64", result_url=url)
+    build_chroot_proxy_get_list.return_value = [mock_ch1]
+
+    files = {
+        "python-copr-1.50-1.noarch.rpm": b"rpm contents",
+        "python-copr.spec": b"spec contents",
+        "builder-live.log.gz": b"log contents",
+        "fedora-review/review.txt": b"review contents",
+        "fedora-review/results/python-copr-1.50-1.noarch.rpm": b"rpm",
+    }
+    manifest = {"files": [{"name": name, "size": len(data),
+                           "sha256": _sha256(data)}
+                          for name, data in files.items()]}
+    responses.add(responses.GET, url + "files.json", json=manifest)
+    for name, data in files.items():
+        responses.add(responses.GET, url + name, body=data)
+
+    dest = tmp_path / "epel-6-x86_64"
+    dest.mkdir()
+    # already downloaded, not downloaded again
+    (dest / "python-copr.spec").write_bytes(b"spec contents")
+
+    main.main(argv=["download-build", "foo", "--dest", str(tmp_path),
+                    "--exclude", "fedora-review/results/*"])
+    stdout, _ = capsys.readouterr()
+
+    assert mock_sp.call.call_args_list == []
+    downloaded = {name for name in files
+                  if (dest / name).exists()}
+    assert downloaded == set(files) - {
+        "fedora-review/results/python-copr-1.50-1.noarch.rpm"}
+    assert (dest / "fedora-review/review.txt").read_bytes() == \
+        b"review contents"
+    assert "python-copr.spec" not in stdout
+    assert "builder-live.log.gz" in stdout
+    requested = [call.request.url for call in responses.calls]
+    assert url + "python-copr.spec" not in requested
+
+
+@responses.activate
+def test_download_build_resume_and_verify(tmp_path):
+    url = "http://example.com/results/fedora-rawhide-x86_64/00000001-foo/"
+    data = b"0123456789"
+    responses.add(responses.GET, url + "files.json", json={"files": [
+        {"name": "foo.rpm", "size": len(data), "sha256": _sha256(data)},
+        {"name": "bar.rpm", "size": 3, "sha256": _sha256(b"bar")},
+        {"name": "../escape.rpm", "size": 3, "sha256": _sha256(b"bar")},
+    ]})
+    responses.add(responses.GET, url + "foo.rpm", body=data[4:], status=206)
+    responses.add(responses.GET, url + "bar.rpm", body=b"BAR")
+
+    (tmp_path / "foo.rpm.part").write_bytes(data[:4])
+    downloader = ResultsDownloader(jobs=2, log=lambda _: None)
+    unsupported, errors = downloader.download(
+        [(url, str(tmp_path))], include=["*.rpm"], exclude=[])
+
+    assert unsupported == []
+    assert errors == [url + "bar.rpm: checksum mismatch"]
+    assert (tmp_path / "foo.rpm").read_bytes() == data
+    foo_requests = [call.request for call in responses.calls
+                    if call.request.url == url + "foo.rpm"]
+    assert foo_requests[0].headers["Range"] == "bytes=4-"
+    assert not (tmp_path / "bar.rpm").exists()
+    assert not (tmp_path / "bar.rpm.part").exists()
+    assert not (tmp_path.parent / "escape.rpm").exists()
+
+
 @mock.patch('copr.v3.proxies.project.ProjectProxy.add')
 @mock.patch('copr_cli.main.config_from_file', return_value=mock_config)
 def test_create_project(config_from_file, project_proxy_add, capsys):
@@ -706,6 +804,61 @@ def test_create_build_wait_keyboard_interrupt(config_from_file, build_proxy_get,
     assert "Watching build" in stdout
 
 
+@mock.patch('copr_cli.main.time')
+@mock.patch('copr.v3.proxies.build.BuildProxy.check_before_build')
+@mock.patch('copr.v3.proxies.build.BuildProxy.create_from_url')
+@mock.patch('copr.v3.proxies.build.BuildProxy.get')
+@mock.patch('copr_cli.main.config_from_file', return_value=mock_config)
+def test_create_build_wait_watch(config_from_file, build_proxy_get,
+                                 create_from_url, _check_before_build,
+                                 mock_time, old_frontend_watch, capsys):
+    mock_time.time.return_value = 1000
+    create_from_url.return_value = Munch(projectname="foo", id=123)
+    old_frontend_watch.side_effect = [
+        [Munch(id=123, state="pending")],
+        [Munch(id=123, state="running")],
+        [],
+        [Munch(id=123, state="failed")],
+    ]
+    with pytest.raises(SystemExit) as err:
+        main.main(argv=[
+            "build",
+            "copr_name", "http://example.com/pkgs.srpm"
+        ])
+    assert exit_wrap(err.value) == 4
+
+    stdout, stderr = capsys.readouterr()
+    assert "Build 123: pending" in stdout
+    assert "Build 123: running" in stdout
+    assert "Build 123: failed" in stdout
+    assert "Build(s) 123 failed" in stderr
+    assert not build_proxy_get.called
+    # frontend didn't wait for the change, we sleep instead
+    mock_time.sleep.assert_called_once_with(30)
+
+    assert old_frontend_watch.call_args_list[0][0][0] == \
+        [{"id": 123, "state": None}]
+    assert old_frontend_watch.call_args_list[3][0][0] == \
+        [{"id": 123, "state": "running"}]
+
+
+@mock.patch('copr_cli.main.time')
+@mock.patch('copr.v3.proxies.build.BuildProxy.get')
+@mock.patch('copr_cli.main.config_from_file', return_value=mock_config)
+def test_watch_build_too_many(config_from_file, build_proxy_get, mock_time,
+                              old_frontend_watch, capsys):
+    old_frontend_watch.side_effect = copr.v3.CoprRequestException(
+        "At most 1000 builds can be watched at once")
+    build_proxy_get.return_value = Munch(id=123, state="succeeded")
+    main.main(argv=["watch-build", "123"])
+
+    stdout, _ = capsys.readouterr()
+    assert "Build 123: succeeded" in stdout
+    assert len(old_frontend_watch.call_args_list) == 1
+    assert build_proxy_get.called
+    assert not mock_time.sleep.called
+
+
 @mock.patch('copr_cli.main.time')
 @mock.patch('copr_cli.main.config_from_file', return_value=mock_config)
 class TestCreateBuild(object):
@@ -12,6 +12,7 @@ import daemon
 import setproctitle
 
 from copr_common.redis_helpers import get_redis_connection
+from copr_common.worker_manager import worker_events_key
 
 
 @contextlib.contextmanager
@@ -64,7 +65,20 @@ class BackgroundWorker:
         """
         if not self.has_wm:
             return
-        self._redis.hset(self.args.worker_id, flag, value)
+        self._redis_update_worker(lambda pipe: pipe.hset(
+            self.args.worker_id, flag, value))
+
+    def _redis_update_worker(self, update):
+        """
+        Atomically modify our worker entry in Redis DB (by the ``update``
+        callback taking the pipeline argument), and let the WorkerManager know
+        that it should take a look at us.
+        """
+        prefix = self.args.worker_id.rsplit(':', 1)[0]
+        pipe = self._redis.pipeline()
+        update(pipe)
+        pipe.rpush(worker_events_key(prefix), self.args.worker_id)
+        pipe.execute()
 
     def redis_get_worker_flag(self, flag):
         """
@@ -132,8 +146,10 @@ class BackgroundWorker:
         if not self.has_wm:
             return True
 
-        self.redis_set_worker_flag('started', 1)
-        self.redis_set_worker_flag('PID', os.getpid())
+        def _started(pipe):
+            pipe.hset(self.args.worker_id, 'started', 1)
+            pipe.hset(self.args.worker_id, 'PID', os.getpid())
+        self._redis_update_worker(_started)
 
         data = self._redis.hgetall(self.args.worker_id)
         if 'allocated' not in data:
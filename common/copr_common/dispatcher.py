@@ -13,6 +13,22 @@ from copr_common.redis_helpers import get_redis_connection
 from copr_common.worker_manager import WorkerManager
 
 
+class TaskQueueChanges:
+    """
+    Changes in the Frontend task queue, as returned by the
+    Dispatcher.get_frontend_task_changes() method.
+
+    :param added: list of QueueTask objects that are either new, or changed
+    :param removed: list of QueueTask IDs that disappeared from the queue
+    :param full: True if ``added`` is the complete task queue, and the
+        WorkerManager queue needs to be re-filled from scratch
+    """
+    def __init__(self, added=None, removed=None, full=False):
+        self.added = added or []
+        self.removed = removed or []
+        self.full = full
+
+
 class Dispatcher(multiprocessing.Process):
     """
     1) Fetch tasks from frontend.
@@ -63,6 +79,16 @@ class Dispatcher(multiprocessing.Process):
         """
         raise NotImplementedError
 
+    def get_frontend_task_changes(self):
+        """
+        Get the TaskQueueChanges object describing what changed in the Frontend
+        task queue since the previous call.  This is an optional optimization
+        for large queues, return None if the Dispatcher doesn't support the
+        incremental updates (default) -- then get_frontend_tasks() is called.
+        """
+        _subclass_can_use = (self)
+        return None
+
     def get_cancel_requests_ids(self):
         """
         Return list of QueueTask IDS that should be canceled.
@@ -83,6 +109,33 @@ class Dispatcher(multiprocessing.Process):
             self.log.info("Got new '%s' tasks: %s", self.task_type, new_job_ids)
         self._previous_task_fetch_ids = job_ids
 
+    def _refill_queue(self, worker_manager):
+        changes = self.get_frontend_task_changes()
+        if changes is None:
+            tasks = self.get_frontend_tasks()
+            if tasks:
+                worker_manager.clean_tasks()
+
+            self._print_added_jobs(tasks)
+            for task in tasks:
+                worker_manager.add_task(task)
+            return
+
+        if changes.full:
+            worker_manager.clean_tasks()
+            self._print_added_jobs(changes.added)
+            for task in changes.added:
+                worker_manager.add_task(task)
+            return
+
+        new_job_ids = {task.id for task in changes.added} \
+            - self._previous_task_fetch_ids
+        if new_job_ids:
+            self.log.info("Got new '%s' tasks: %s", self.task_type, new_job_ids)
+        self._previous_task_fetch_ids = \
+            (self._previous_task_fetch_ids | new_job_ids) - set(changes.removed)
+        worker_manager.update_tasks(changes.added, changes.removed)
+
     def run(self):
         """
         Starts the infinite task dispatching process.
@@ -105,13 +158,7 @@ class Dispatcher(multiprocessing.Process):
             self.log.info("getting %ss from frontend", self.task_type)
             start = time.time()
 
-            tasks = self.get_frontend_tasks()
-            if tasks:
-                worker_manager.clean_tasks()
-
-            self._print_added_jobs(tasks)
-            for task in tasks:
-                worker_manager.add_task(task)
+            self._refill_queue(worker_manager)
 
             self._update_process_title("getting cancel requests")
             for task_id in self.get_cancel_requests_ids():
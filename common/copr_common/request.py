@@ -2,6 +2,7 @@
 Common Copr code for dealing with HTTP requests
 """
 
+import gzip
 import json
 import time
 from requests import get, post, put, RequestException
@@ -26,11 +27,14 @@ class SafeRequest:
         'version': package_version(package_name),
     }
 
-    def __init__(self, auth=None, log=None, try_indefinitely=False, timeout=2 * 60):
+    def __init__(self, auth=None, log=None, try_indefinitely=False, timeout=2 * 60,
+                 compress=False):
         self.auth = auth
         self.log = log
         self.try_indefinitely = try_indefinitely
         self.timeout = timeout
+        # gzip the POST/PUT data, server needs to handle Content-Encoding
+        self.compress = compress
 
     def get(self, url, **kwargs):
         """
@@ -73,6 +77,10 @@ class SafeRequest:
             method = method.lower()
             if method in ['post', 'put']:
                 req_args['data'] = json.dumps(data)
+                if self.compress:
+                    req_args['data'] = gzip.compress(
+                        req_args['data'].encode("utf-8"))
+                    headers["Content-Encoding"] = "gzip"
                 method = post if method == 'post' else put
             else:
                 method = get
@@ -10,6 +10,22 @@ import logging
 import subprocess
 
 
+def worker_events_key(worker_prefix):
+    """
+    Name of the Redis list where the background workers announce (push their
+    worker ID) that their state changed, so WorkerManager doesn't have to
+    re-check all the workers periodically.
+    """
+    return worker_prefix + '-events'
+
+
+def worker_registry_key(worker_prefix):
+    """
+    Name of the Redis set of all the worker IDs started by WorkerManager.
+    """
+    return worker_prefix + '-registry'
+
+
 class WorkerLimit:
     """
     Limit for the number of tasks being processed concurrently
@@ -18,14 +34,15 @@ class WorkerLimit:
     that should be processed.  Then WorkerManager is completely responsible for
     sorting out the queue, and behave -> respect the given limits.
 
-    WorkerManager implements really stupid algorithm to respect the limits;  we
-    simply drop the task from queue (and continue to the next task) if it was
-    about to exceed any given limit.  This is the only option at this moment
-    because JobQueue doesn't allow us to skip some task, and return to it later.
-    It is not a problem for Copr dispatchers though because we re-add the
-    dropped tasks to JobQueue anyways -- after the next call to the
-    Dispatcher.get_frontend_tasks() method (see "sleeptime" configuration
-    option).
+    WorkerManager implements rather simple algorithm to respect the limits;  we
+    skip the task (and continue to the next task) if it was about to exceed any
+    given limit.  Because the check() result only depends on the
+    partition_key() value of the given task, IndexedJobQueue skips all the
+    tasks with the same partition keys at once -- they stay in queue, but they
+    are not considered until the limits are re-calculated (the limits are never
+    lowered within one WorkerManager.run() call).  That happens after the next
+    call to the Dispatcher.get_frontend_tasks() method, or in
+    WorkerManager.update_tasks() (see "sleeptime" configuration option).
 
     Each Limit object works as a statistic counter for the list of _currently
     processed_ tasks (i.e. not queued tasks!).  And we may want to query the
@@ -56,6 +73,15 @@ class WorkerLimit:
         """ Clear the statistics. """
         raise NotImplementedError
 
+    def partition_key(self, task):
+        """
+        Return a hashable value that determines the check(task) result, i.e.
+        all the tasks with the same key are either allowed or not.  The default
+        implementation is conservative, each task has its own key.
+        """
+        _subclass_can_use = (self)
+        return repr(task)
+
     def info(self):
         """ Get the user-readable info about the limit object """
         if self._name:
@@ -93,6 +119,9 @@ class PredicateWorkerLimit(WorkerLimit):
             return True
         return len(self._refs) < self._limit
 
+    def partition_key(self, task):
+        return bool(self._predicate(task))
+
     def info(self):
         text = super().info()
         matching = ', '.join(self._refs.keys())
@@ -158,6 +187,9 @@ class HashWorkerLimit(WorkerLimit):
         group_name = self._hasher(task)
         return self._groups.count(group_name) < self._limit
 
+    def partition_key(self, task):
+        return self._hasher(task)
+
     def info(self):
         text = super().info()
         return "{}, counter: {}".format(text, str(self._groups))
@@ -206,6 +238,124 @@ class JobQueue():
         raise KeyError('pop from an empty priority queue')
 
 
+class IndexedJobQueue:
+    """
+    Priority "task" queue, API compatible with JobQueue, with tasks split into
+    partitions per the ``partition_key(task)`` return value.  Each partition is
+    a separate priority queue, and the partitions are ordered by their "top"
+    task.  The pop_task() method therefore returns exactly the same sequence of
+    tasks as JobQueue would, but we can skip_partition() -- i.e. make all the
+    tasks from the same partition invisible to pop_task() in O(log P) time
+    (P is the number of partitions), until the reset_skipped() call.
+    """
+
+    def __init__(self, partition_key, removed='<removed-task>'):
+        self.entry_finder = {}           # mapping of tasks to entries
+        self.removed = removed           # placeholder for a removed task
+        self.counter = itertools.count() # unique sequence count
+        self._partition_key = partition_key
+        self._partitions = {}            # key => heap of entries
+        self._heads = []                 # heap of the partition tops
+        self._head_entries = {}          # key => entry in self._heads
+        self._skipped = set()
+        self._last_popped = None
+
+    @property
+    def prio_queue(self):
+        """ List of (not-removed) entries, for debugging purposes """
+        return list(self.entry_finder.values())
+
+    def _push_head(self, key, entry):
+        old_head = self._head_entries.get(key)
+        if old_head is not None:
+            if old_head[:2] <= entry[:2]:
+                return
+            old_head[-1] = self.removed
+        # the third item is a tie-breaker for the outdated heads
+        head = [entry[0], entry[1], next(self.counter), key]
+        self._head_entries[key] = head
+        heappush(self._heads, head)
+
+    def add_task(self, task, priority=0):
+        'Add a new task or update the priority of an existing task'
+        if repr(task) in self.entry_finder:
+            self.remove_task(task)
+        count = next(self.counter)
+        entry = [priority, count, task]
+        self.entry_finder[repr(task)] = entry
+        key = self._partition_key(task)
+        heappush(self._partitions.setdefault(key, []), entry)
+        if key not in self._skipped:
+            self._push_head(key, entry)
+
+    def remove_task(self, task):
+        'Mark an existing task as removed.  Raise KeyError if not found.'
+        self.remove_task_by_id(repr(task))
+
+    def remove_task_by_id(self, task_id):
+        """
+        Using task id, drop the task from queue.  Raise KeyError if not found.
+        """
+        entry = self.entry_finder.pop(task_id)
+        entry[-1] = self.removed
+
+    def pop_task(self):
+        'Remove and return the lowest priority task. Raise KeyError if empty.'
+        while self._heads:
+            head = heappop(self._heads)
+            key = head[-1]
+            if key is self.removed:
+                continue
+            del self._head_entries[key]
+
+            partition = self._partitions[key]
+            while partition and partition[0][-1] is self.removed:
+                heappop(partition)
+            if not partition:
+                del self._partitions[key]
+                continue
+
+            if partition[0][:2] != head[:2]:
+                # the previous top was removed, re-order the partition
+                self._push_head(key, partition[0])
+                continue
+
+            entry = heappop(partition)
+            task = entry[-1]
+            del self.entry_finder[repr(task)]
+            if partition:
+                self._push_head(key, partition[0])
+            self._last_popped = entry
+            return task
+        raise KeyError('pop from an empty priority queue')
+
+    def skip_partition(self, task):
+        """
+        Put the (just popped) task back to the queue, and hide its whole
+        partition from pop_task() until reset_skipped() is called.
+        """
+        key = self._partition_key(task)
+        self._skipped.add(key)
+        head = self._head_entries.pop(key, None)
+        if head is not None:
+            head[-1] = self.removed
+        if repr(task) in self.entry_finder:
+            return
+        entry = self._last_popped
+        if entry is None or entry[-1] is not task:
+            entry = [task.priority, next(self.counter), task]
+        self.entry_finder[repr(task)] = entry
+        heappush(self._partitions.setdefault(key, []), entry)
+
+    def reset_skipped(self):
+        """ Make the skipped partitions visible to pop_task() again """
+        for key in self._skipped:
+            partition = self._partitions.get(key)
+            if partition:
+                self._push_head(key, partition[0])
+        self._skipped = set()
+
+
 class QueueTask:
     """
     A base class for tasks processed by `Dispatcher` implementations
@@ -253,6 +403,12 @@ class WorkerManager():
             Fill float value in seconds.
     :cvar worker_cleanup_period: How often should WorkerManager try to cleanup
             workers? (value is a period in seconds)
+    :cvar worker_orphan_scan_period: How often should WorkerManager scan the
+            Redis DB for worker entries it doesn't track (e.g. those left
+            behind by older WorkerManager versions).  Period in seconds.
+    :cvar start_batch_size: How many tasks (at most) are taken from the queue
+            at once, and given to the prepare_tasks() method together before
+            the workers are started.
     """
 
     # pylint: disable=too-many-instance-attributes
@@ -261,11 +417,13 @@ class WorkerManager():
     worker_timeout_start = 30
     worker_timeout_deadcheck = 3*60
     worker_cleanup_period = 3.0
-
+    worker_orphan_scan_period = 10*60
+    start_batch_size = 1
 
     def __init__(self, redis_connection=None, max_workers=8, log=None,
                  frontend_client=None, limits=None):
-        self.tasks = JobQueue()
+        self._limits = limits or []
+        self.tasks = self._new_queue()
         self.log = log if log else logging.getLogger()
         self.redis = redis_connection
         self.max_workers = max_workers
@@ -276,9 +434,23 @@ class WorkerManager():
         # starts (Manager/Dispatcher class is loaded) because we want the logic
         # to survive server restarts (we adopt the old background workers).
         self._tracked_workers = set(self.worker_ids())
-        self._limits = limits or []
+        # When should we look at the tracked worker again (worker_id =>
+        # timestamp), if it doesn't notify us about the state change sooner.
+        self._worker_deadlines = {}
+        self._check_all_workers = True
+        self._last_orphan_scan = 0.0
+        # All the tasks Frontend told us about (both queued and those being
+        # processed), so we can re-fill the queue without re-downloading them.
+        self._known_tasks = {}
         self._last_worker_cleanup = None
 
+    def prepare_tasks(self, tasks):
+        """
+        Called with the list of tasks that are about to be started (by
+        start_task()) in this cycle.  Override this to prepare the data the
+        workers will need in bulk, e.g. to download them from Frontend at once.
+        """
+
     def start_task(self, worker_id, task):
         """
         Start background job using the 'task' object taken from the 'tasks'
@@ -362,6 +534,12 @@ class WorkerManager():
         assert prefix == self.worker_prefix
         return task_id
 
+    def _partition_key(self, task):
+        return tuple(limit.partition_key(task) for limit in self._limits)
+
+    def _new_queue(self):
+        return IndexedJobQueue(self._partition_key)
+
     def _calculate_limits_for_task(self, worker_id, task):
         for limit in self._limits:
             limit.worker_added(worker_id, task)
@@ -375,6 +553,7 @@ class WorkerManager():
         """
         task_id = repr(task)
         worker_id = self.get_worker_id(task_id)
+        self._known_tasks[task_id] = task
 
         if worker_id in self._tracked_workers:
             # No need to re-add this to queue, but we need to calculate
@@ -401,8 +580,9 @@ class WorkerManager():
         :return: True if worker is running on background, False otherwise
         """
         self._drop_task_id_safe(task_id)
+        self._known_tasks.pop(str(task_id), None)
         worker_id = self.get_worker_id(task_id)
-        if worker_id not in self.worker_ids():
+        if not self.redis.exists(worker_id):
             self.log.info("Cancel request, worker %s is not running", worker_id)
             return False
         self.log.info("Cancel request, worker %s requested to cancel",
@@ -414,7 +594,7 @@ class WorkerManager():
         """
         Return the redis keys representing workers running on background.
         """
-        return self.redis.keys(self.worker_prefix + ':*')
+        return list(self.redis.smembers(worker_registry_key(self.worker_prefix)))
 
     def run(self, timeout=float('inf')):
         """
@@ -427,8 +607,11 @@ class WorkerManager():
         # Make sure _cleanup_workers() has some effect during the run() call.
         # This is here mostly for the test-suite, because in the real use-cases
         # the worker_cleanup_period is much shorter period than the timeout and
-        # the cleanup is done _several_ times during the run() call.
+        # the cleanup is done _several_ times during the run() call.  The first
+        # cleanup in each run() call checks all the tracked workers, not only
+        # those which notified us.
         self._last_worker_cleanup = 0.0
+        self._check_all_workers = True
 
         while True:
             now = start_time if now is None else time.time()
@@ -445,10 +628,10 @@ class WorkerManager():
                 continue
 
             # We can allocate some workers, if there's something to do.
-            try:
-                task = self.tasks.pop_task()
-            except KeyError:
-                # Empty queue!
+            tasks = self._pop_startable_tasks(
+                min(self.max_workers - worker_count, self.start_batch_size))
+            if not tasks:
+                # Empty queue (or all the remaining tasks exceed limits)!
                 if worker_count:
                     # It still makes sense to cycle to finish the workers.
                     self.log.debug("No more tasks, waiting for workers")
@@ -458,47 +641,161 @@ class WorkerManager():
                 # to do.  Just simply wait till the end of the cycle.
                 break
 
-            break_on_limit = False
+            try:
+                self.prepare_tasks(tasks)
+            except Exception:  # pylint: disable=broad-except
+                self.log.exception("Can't prepare %s tasks, re-queued",
+                                   len(tasks))
+                # The tasks were already accounted into the limits, undo that
+                # and put them back to the queue.
+                self.update_tasks()
+                time.sleep(1)
+                continue
+
+            for task in tasks:
+                self._start_worker(task, now)
+
+        self.log.debug("Reaped %s processes", self._clean_daemon_processes())
+        self.log.debug("Worker.run() stop at time %s", time.time())
+
+    def _pop_startable_task(self):
+        """
+        Pop the highest-priority task which doesn't exceed any of the limits.
+        Raise KeyError if there's no such task in the queue.
+        """
+        while True:
+            task = self.tasks.pop_task()
             for limit in self._limits:
-                # just skip this task, it will be processed in the next
-                # run because we keep re-filling the queue
+                # Skip this task, and all the tasks with the same partition
+                # key.  Those will be processed in the next run because we
+                # keep re-filling the queue (and re-calculating limits).
                 if not limit.check(task):
                     self.log.debug("Task '%s' skipped, limit info: %s",
                                    task.id, limit.info())
-                    break_on_limit = True
+                    self.tasks.skip_partition(task)
                     break
-            if break_on_limit:
-                continue
-
-            self._start_worker(task, now)
+            else:
+                return task
 
-        self.log.debug("Reaped %s processes", self._clean_daemon_processes())
-        self.log.debug("Worker.run() stop at time %s", time.time())
+    def _pop_startable_tasks(self, count):
+        """
+        Pop at most COUNT startable tasks.  The tasks are immediately accounted
+        into the limits, so the next tasks are checked against them.
+        """
+        tasks = []
+        while len(tasks) < count:
+            try:
+                task = self._pop_startable_task()
+            except KeyError:
+                break
+            worker_id = self.get_worker_id(repr(task))
+            self._calculate_limits_for_task(worker_id, task)
+            tasks.append(task)
+        return tasks
 
     def _start_worker(self, task, time_now):
         worker_id = self.get_worker_id(repr(task))
-        self.redis.hset(worker_id, 'allocated', time_now)
+        pipe = self.redis.pipeline()
+        pipe.hset(worker_id, 'allocated', time_now)
+        pipe.sadd(worker_registry_key(self.worker_prefix), worker_id)
+        pipe.execute()
         self._tracked_workers.add(worker_id)
+        self._worker_deadlines[worker_id] = \
+            float(time_now) + self.worker_timeout_start
         self.log.info("Starting worker %s, task.priority=%s", worker_id,
                       task.priority)
-        self._calculate_limits_for_task(worker_id, task)
         self.start_task(worker_id, task)
 
     def clean_tasks(self):
         """
         Remove all tasks from queue.
         """
-        self.tasks = JobQueue()
+        self.tasks = self._new_queue()
+        self._known_tasks = {}
         for limit in self._limits:
             limit.clear()
 
+    def update_tasks(self, added=None, removed=None):
+        """
+        Patch the task queue in place, instead of clean_tasks() followed by
+        add_task() for the complete task list.  The ``added`` tasks are either
+        new or changed (those are re-queued), ``removed`` is a list of task IDs
+        that should not be processed anymore.
+
+        The tasks previously dropped from the queue by run() (because of the
+        limits, or because their worker failed) are re-queued here, and the
+        limits are re-calculated for the currently processed tasks -- exactly
+        as if the complete task list was re-added.
+        """
+        for task_id in removed or []:
+            self._known_tasks.pop(task_id, None)
+            self._drop_task_id_safe(task_id)
+
+        for task in added or []:
+            self._known_tasks[repr(task)] = task
+
+        for limit in self._limits:
+            limit.clear()
+        self.tasks.reset_skipped()
+
+        for task_id, task in self._known_tasks.items():
+            worker_id = self.get_worker_id(task_id)
+            if worker_id in self._tracked_workers:
+                self._calculate_limits_for_task(worker_id, task)
+                continue
+            entry = self.tasks.entry_finder.get(task_id)
+            if entry and entry[-1] is task:
+                # already queued
+                continue
+            self.tasks.add_task(task, task.priority)
+
     def _delete_worker(self, worker_id):
-        self.redis.delete(worker_id)
+        pipe = self.redis.pipeline()
+        pipe.delete(worker_id)
+        pipe.srem(worker_registry_key(self.worker_prefix), worker_id)
+        pipe.execute()
         self._tracked_workers.discard(worker_id)
+        self._worker_deadlines.pop(worker_id, None)
+
+    def _pop_worker_events(self):
+        """
+        Atomically take the list of worker IDs which announced a state change.
+        """
+        pipe = self.redis.pipeline()
+        key = worker_events_key(self.worker_prefix)
+        pipe.lrange(key, 0, -1)
+        pipe.delete(key)
+        worker_ids, _ = pipe.execute()
+        return set(worker_ids)
+
+    def _workers_to_check(self, now):
+        """
+        Return the set of worker IDs that need to be checked now; those that
+        notified us about a state change, or those with an expired deadline
+        (not started in time, or it is time for the periodic dead-check).
+        """
+        worker_ids = self._pop_worker_events()
+
+        if self._check_all_workers:
+            self._check_all_workers = False
+            worker_ids |= self._tracked_workers
+        else:
+            worker_ids |= {worker_id for worker_id, deadline
+                           in self._worker_deadlines.items()
+                           if deadline <= now}
+
+        if now - self._last_orphan_scan > self.worker_orphan_scan_period:
+            # Non-blocking (SCAN) search for workers we don't know about.
+            self._last_orphan_scan = now
+            worker_ids |= set(self.redis.scan_iter(
+                match=self.worker_prefix + ':*'))
+
+        return worker_ids
 
     def _cleanup_workers(self, now):
         """
-        Go through all the tracked workers and check if they already finished,
+        Go through the tracked workers that changed their state (or need to be
+        checked because of timeouts), and check if they already finished,
         failed to start or died in the background.
         """
 
@@ -513,52 +810,81 @@ class WorkerManager():
         self.log.debug("Trying to clean old workers")
         self._last_worker_cleanup = time.time()
 
-        for worker_id in self.worker_ids():
-            info = self.redis.hgetall(worker_id)
+        worker_ids = list(self._workers_to_check(now))
+        if not worker_ids:
+            return
 
-            allocated = info.get('allocated', None)
-            if not allocated:
-                # In worker manager, we _always_ add 'allocated' tag when we
-                # start worker.  So this may only happen when worker is
-                # orphaned for some reason (we gave up with him), and it still
-                # touches the database on background.
-                self.log.info("Missing 'allocated' flag for worker %s", worker_id)
-                self._delete_worker(worker_id)
+        # one round-trip for all the workers
+        pipe = self.redis.pipeline(transaction=False)
+        for worker_id in worker_ids:
+            pipe.hgetall(worker_id)
+
+        for worker_id, info in zip(worker_ids, pipe.execute()):
+            if not info and worker_id not in self._tracked_workers:
+                # notification from already removed worker
                 continue
+            self._cleanup_worker(worker_id, info, now)
+
+    def _cleanup_worker(self, worker_id, info, now):
+        allocated = info.get('allocated', None)
+        if not allocated:
+            # In worker manager, we _always_ add 'allocated' tag when we
+            # start worker.  So this may only happen when worker is
+            # orphaned for some reason (we gave up with him), and it still
+            # touches the database on background.
+            self.log.info("Missing 'allocated' flag for worker %s", worker_id)
+            self._delete_worker(worker_id)
+            return
 
-            allocated = float(allocated)
+        if worker_id not in self._tracked_workers:
+            # Worker started by previous WorkerManager instance, adopt it.
+            self.log.info("Adopting worker %s", worker_id)
+            self.redis.sadd(worker_registry_key(self.worker_prefix), worker_id)
+            self._tracked_workers.add(worker_id)
 
-            if self.has_worker_ended(worker_id, info):
-                # finished worker
-                self.log.info("Finished worker %s", worker_id)
-                self.finish_task(worker_id, info)
-                self._delete_worker(worker_id)
-                continue
+        allocated = float(allocated)
 
-            if info.get('delete'):
-                self.log.warning("worker %s deleted", worker_id)
-                self._delete_worker(worker_id)
-                continue
+        if self.has_worker_ended(worker_id, info):
+            # finished worker
+            self.log.info("Finished worker %s", worker_id)
+            self.finish_task(worker_id, info)
+            self._delete_worker(worker_id)
+            return
 
-            if not self.has_worker_started(worker_id, info):
-                if now - allocated > self.worker_timeout_start:
-                    # This worker failed to start?
-                    self.log.error("worker %s failed to start", worker_id)
-                    self._delete_worker(worker_id)
-                continue
+        if info.get('delete'):
+            self.log.warning("worker %s deleted", worker_id)
+            self._delete_worker(worker_id)
+            return
 
-            checked = info.get('checked', allocated)
+        if not self.has_worker_started(worker_id, info):
+            if now - allocated > self.worker_timeout_start:
+                # This worker failed to start?
+                self.log.error("worker %s failed to start", worker_id)
+                self._delete_worker(worker_id)
+                return
+            self._worker_deadlines[worker_id] = \
+                allocated + self.worker_timeout_start
+            return
 
-            if now - float(checked) > self.worker_timeout_deadcheck:
-                self.log.info("checking worker %s", worker_id)
-                self.redis.hset(worker_id, 'checked', now)
-                if self.is_worker_alive(worker_id, info):
-                    continue
-                self.log.error("dead worker %s", worker_id)
+        checked = float(info.get('checked', allocated))
+
+        if now - checked > self.worker_timeout_deadcheck:
+            self.log.info("checking worker %s", worker_id)
+            self.redis.hset(worker_id, 'checked', now)
+            if self.is_worker_alive(worker_id, info):
+                self._worker_deadlines[worker_id] = \
+                    now + self.worker_timeout_deadcheck
+                return
+            self.log.error("dead worker %s", worker_id)
+
+            # The worker could finish in the meantime, make sure we
+            # hgetall() once more.
+            self.redis.hset(worker_id, 'delete', 1)
+            self._worker_deadlines[worker_id] = now
+            return
 
-                # The worker could finish in the meantime, make sure we
-                # hgetall() once more.
-                self.redis.hset(worker_id, 'delete', 1)
+        self._worker_deadlines[worker_id] = \
+            checked + self.worker_timeout_deadcheck
 
     def start_daemon_on_background(self, command, env=None):
         """
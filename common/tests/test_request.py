@@ -1,3 +1,5 @@
+import gzip
+import json
 import logging
 from unittest import TestCase
 from requests import RequestException
@@ -23,6 +25,15 @@ class TestStringMethods(TestCase):
             request._send_request(self.url, "post", self.data)
         self.assertTrue(post_req.called)
 
+    @mock.patch("copr_common.request.post")
+    def test_send_request_compressed(self, post_req):
+        post_req.return_value.status_code = 201
+        request = SafeRequest(log=self.log, compress=True)
+        request._send_request(self.url, "post", self.data)
+        kwargs = post_req.call_args[1]
+        self.assertEqual(kwargs["headers"]["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(kwargs["data"])), self.data)
+
     @mock.patch("copr_common.request.post")
     def test_send_request_post_error(self, post_req):
         post_req.side_effect = RequestException()
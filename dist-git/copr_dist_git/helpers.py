@@ -1,5 +1,8 @@
 import os
 import sys
+import errno
+import shutil
+import hashlib
 import logging
 import subprocess
 from configparser import ConfigParser
@@ -116,10 +119,26 @@ class ConfigReader(object):
             cp, "dist-git", "lookaside_location", "/var/lib/dist-git/cache/lookaside/pkgs/"
         )
 
+        # Content-addressed storage for the source tarballs, the files in
+        # lookaside_location are hardlinks to these.  It needs to be on the
+        # same filesystem as lookaside_location.
+        opts.lookaside_blobs_location = _get_conf(
+            cp, "dist-git", "lookaside_blobs_location",
+            os.path.join(opts.lookaside_location, ".blobs")
+        )
+
         opts.git_base_url = _get_conf(
             cp, "dist-git", "git_base_url", "/var/lib/dist-git/git/%(module)s"
         )
 
+        # Local mirrors of the DistGit repositories, the imports are done in
+        # throwaway clones of these.  Empty value means that each import
+        # clones the DistGit repository from scratch.
+        opts.git_mirrors_location = _get_conf(
+            cp, "dist-git", "git_mirrors_location",
+            "/var/lib/copr-dist-git/git-mirrors"
+        )
+
         opts.git_user_name = _get_conf(
             cp, "dist-git", "git_user_name", "CoprDistGit"
         )
@@ -169,6 +188,79 @@ def download_file(url, destination):
     return filepath
 
 
+def file_checksum(path, hashtype="sha256"):
+    """
+    Calculate the checksum of the file at PATH
+    """
+    checksum = hashlib.new(hashtype)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def blob_path(blobs_location, checksum):
+    """
+    Path to the blob with the given (sha256) CHECKSUM in the content-addressed
+    storage
+    """
+    return os.path.join(blobs_location, checksum[:2], checksum)
+
+
+def store_blob(blobs_location, path):
+    """
+    Store the file at PATH into the content-addressed storage, unless the same
+    content is already there.  Return the path to the blob.
+    """
+    blob = blob_path(blobs_location, file_checksum(path))
+    if os.path.exists(blob):
+        log.debug("Blob %s already exists", blob)
+        return blob
+
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    # Concurrent imports may store the same blob, so rename atomically
+    tmp_blob = "{0}.tmp.{1}".format(blob, os.getpid())
+    shutil.copyfile(path, tmp_blob)
+    os.replace(tmp_blob, blob)
+    return blob
+
+
+def link_blob(blob, destination):
+    """
+    Make the DESTINATION file a hardlink to the BLOB.  Fall back to copying
+    if hardlinking isn't possible (e.g. too many links, or a different
+    filesystem).
+    """
+    try:
+        os.link(blob, destination)
+    except FileExistsError:
+        pass
+    except OSError as e:
+        if e.errno not in [errno.EMLINK, errno.EXDEV, errno.EPERM]:
+            raise
+        log.warning("Can't hardlink %s to %s (%s), copying", blob,
+                    destination, str(e))
+        shutil.copyfile(blob, destination)
+
+
+def remove_unused_blobs(blobs_location):
+    """
+    Remove blobs that are not hardlinked from the lookaside cache anymore
+    """
+    if not os.path.isdir(blobs_location):
+        return
+    for prefix in os.scandir(blobs_location):
+        if not prefix.is_dir():
+            continue
+        for blob in os.scandir(prefix.path):
+            if ".tmp." in blob.name:
+                # being stored right now
+                continue
+            if blob.stat().st_nlink == 1:
+                log.info("Removing unused blob %s", blob.path)
+                os.unlink(blob.path)
+
+
 def run_cmd(cmd, cwd='.', raise_on_error=True):
     """
     Runs given command in a subprocess.
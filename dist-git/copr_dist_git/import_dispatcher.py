@@ -6,7 +6,8 @@ import os
 import sys
 import logging
 from copr_common.dispatcher import Dispatcher
-from copr_common.worker_manager import HashWorkerLimit
+from copr_common.redis_helpers import get_redis_connection
+from copr_common.worker_manager import HashWorkerLimit, worker_registry_key
 from copr_dist_git.importer import Importer, ImportWorkerManager
 
 
@@ -16,6 +17,15 @@ LIMITS = {
     "owner": 5,
 }
 
+# How many tasks we lease from the importing queue per worker (on top of the
+# tasks already being imported), so the LIMITS have enough tasks to choose
+# from.  Frontend leases at most LIMITS["owner"] tasks per owner, so one owner
+# can not fill the whole lease.
+LEASED_TASKS_PER_WORKER = 5
+
+# The leases are prolonged in each dispatcher iteration
+LEASE_EXPIRE = 600
+
 
 class _PriorityCounter:
     def __init__(self):
@@ -44,6 +54,7 @@ class ImportDispatcher(Dispatcher):
         self.log = self._get_logger()
         self.sleeptime = opts.sleep_time
         self.max_workers = self.opts.max_workers
+        self._redis = None
 
         for limit_type in ['sandbox', 'owner']:
             limit = LIMITS[limit_type]
@@ -56,9 +67,30 @@ class ImportDispatcher(Dispatcher):
 
         self._create_per_task_logs_directory(self.opts.per_task_log_dir)
 
+    def _running_build_ids(self):
+        """
+        Return the IDs of builds which are being imported by the background
+        workers (see ImportWorkerManager.get_worker_id()).
+        """
+        if self._redis is None:
+            self._redis = get_redis_connection(self.opts)
+        workers = self._redis.smembers(
+            worker_registry_key(ImportWorkerManager.worker_prefix))
+        return [int(worker_id.rsplit(":", 1)[1]) for worker_id in workers]
+
     def get_frontend_tasks(self):
         importer = Importer(self.opts)
-        tasks = importer.try_to_obtain_new_tasks(limit=999999)
+        try:
+            # The running tasks are returned, too, so they are counted into
+            # the limits.
+            tasks = importer.lease_tasks(
+                limit=self.max_workers * LEASED_TASKS_PER_WORKER,
+                expire=LEASE_EXPIRE,
+                exclude=self._running_build_ids(),
+                owner_limit=LIMITS["owner"])
+        except Exception:  # pylint: disable=broad-except
+            self.log.exception("Failed to lease the importing tasks")
+            return []
         counter = _PriorityCounter()
         for task in tasks:
             task.dispatcher_priority += counter.get_priority(task)
@@ -1,11 +1,12 @@
 import os
 import json
 import time
+import socket
 import logging
 import tempfile
 import shutil
 
-from requests import get, post
+from requests import post
 
 from copr_common.worker_manager import WorkerManager
 from copr_common.lock import lock
@@ -19,33 +20,63 @@ from . import helpers
 
 log = logging.getLogger(__name__)
 
+# Timeout for one import worker (seconds)
+IMPORT_TIMEOUT = 3600 * 3
+
 class Importer(object):
     def __init__(self, opts):
         self.is_running = False
         self.opts = opts
 
-        self.get_url = "{}/backend/importing/".format(self.opts.frontend_base_url)
+        self.lease_url = "{}/backend/importing/lease/".format(self.opts.frontend_base_url)
+        self.lease_holder = socket.gethostname()
         self.post_back_url = "{}/backend/import-completed/".format(self.opts.frontend_base_url)
         self.auth = ("user", self.opts.frontend_auth)
         self.headers = {"content-type": "application/json"}
 
         self.tmp_root = None
 
-    def try_to_obtain_new_tasks(self, exclude=None, limit=1):
+    def lease_tasks(self, limit, expire=IMPORT_TIMEOUT, exclude=None,
+                    owner_limit=None):
+        """
+        Lease at most LIMIT new tasks from the frontend importing queue for
+        EXPIRE seconds, on top of the EXCLUDE'd build IDs (already being
+        imported, their leases are prolonged).  With OWNER_LIMIT, the frontend
+        leases at most that many tasks per owner (the excluded tasks included),
+        so one owner can not fill the whole lease.  Return all the leased
+        tasks, including the excluded ones.
+        """
+        # The tasks we are already importing are leased to us, so they are
+        # returned again and we need to ask for them on top of the LIMIT.
+        data = {
+            "holder": self.lease_holder,
+            "limit": limit + len(exclude or []),
+            "expire": expire,
+        }
+        if owner_limit:
+            data["owner_limit"] = owner_limit
+        r = post(self.lease_url, auth=self.auth, data=json.dumps(data),
+                 headers=self.headers)
+        r.raise_for_status()
+        log.debug("Got tasks from %s", self.lease_url)
+        return [ImportTask.from_dict(build) for build in r.json()]
+
+    def try_to_obtain_new_tasks(self, exclude=None, limit=1, expire=IMPORT_TIMEOUT):
+        """
+        Lease at most LIMIT tasks from the frontend importing queue for EXPIRE
+        seconds, skipping the EXCLUDE'd build IDs (already being imported).
+        The leases of the excluded tasks are prolonged, too.
+        """
         log.debug("Get task data...")
         if exclude is None:
             exclude = []
         try:
-            # get the data
-            r = get(self.get_url)
-            # take the first task
-            builds = list(filter(lambda x: x["build_id"] not in exclude, r.json()))
-            if not builds:
+            tasks = self.lease_tasks(limit, expire, exclude)
+            tasks = [x for x in tasks if x.build_id not in exclude]
+            if not tasks:
                 log.debug("No new tasks to process.")
                 return []
-
-            log.debug("Got tasks from %s", self.get_url)
-            return [ImportTask.from_dict(build) for build in builds[:limit]]
+            return tasks[:limit]
         except Exception as e:
             log.exception("Failed acquire new packages for import:" + str(e))
 
@@ -135,7 +166,7 @@ class Importer(object):
                 continue
 
             for mb_task in mb_tasks:
-                p = worker_cls(target=self.do_import, args=[mb_task], id=mb_task.build_id, timeout=3600 * 3)
+                p = worker_cls(target=self.do_import, args=[mb_task], id=mb_task.build_id, timeout=IMPORT_TIMEOUT)
                 pool.append(p)
                 log.info("Starting worker '{}' with task '{}' (timeout={})"
                          .format(p.name, mb_task.build_id, p.timeout))
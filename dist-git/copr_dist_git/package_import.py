@@ -19,7 +19,7 @@ os.getlogin = lambda: pwd.getpwuid(os.getuid())[0]
 from pyrpkg import Commands
 from pyrpkg.errors import rpkgError
 
-from .exceptions import PackageImportException
+from .exceptions import PackageImportException, RunCommandException
 
 from . import helpers
 
@@ -32,19 +32,26 @@ def my_upload_fabric(opts):
         This is a replacement function for uploading sources.
         Rpkg uses upload.cgi for uploading which doesn't make sense
         on the local machine.
+
+        The sources are stored only once in the content-addressed blob
+        storage, and hardlinked into the lookaside cache of the given repo.
+        Forks and rebuilds of the same sources don't take any extra space.
         """
         filename = os.path.basename(abs_filename)
         destination = os.path.join(opts.lookaside_location, reponame,
                                    filename, filehash, filename)
 
+        if os.path.exists(destination):
+            return
+
         if not os.path.isdir(os.path.dirname(destination)):
             try:
                 os.makedirs(os.path.dirname(destination))
             except OSError as e:
                 log.exception(str(e))
 
-        if not os.path.exists(destination):
-            shutil.copyfile(abs_filename, destination)
+        blob = helpers.store_blob(opts.lookaside_blobs_location, abs_filename)
+        helpers.link_blob(blob, destination)
 
     return my_upload
 
@@ -132,6 +139,86 @@ def setup_git_repo(reponame, branches):
                 raise PackageImportException(e.output)
 
 
+def update_git_mirror(opts, reponame):
+    """
+    Create, or incrementally update, the local mirror of the DistGit repository.
+
+    :param Munch opts: service configuration
+    :param str reponame: name of the repository
+    :return str: path to the mirror
+    """
+    git_url = opts.git_base_url % {"module": reponame}
+    mirror = os.path.join(opts.git_mirrors_location, reponame + ".git")
+
+    if os.path.isdir(mirror):
+        log.debug("updating git mirror {}".format(mirror))
+        try:
+            helpers.run_cmd(['git', 'fetch', '--prune', 'origin'], cwd=mirror)
+            return mirror
+        except RunCommandException as e:
+            log.error("Failed to update git mirror {}, re-creating: {}"
+                      .format(mirror, str(e)))
+            shutil.rmtree(mirror)
+
+    log.debug("creating git mirror {}".format(mirror))
+    os.makedirs(os.path.dirname(mirror), exist_ok=True)
+    # Don't leave a half-baked mirror behind if the clone fails
+    tmp_mirror = "{}.tmp.{}".format(mirror, os.getpid())
+    shutil.rmtree(tmp_mirror, ignore_errors=True)
+    helpers.run_cmd(['git', 'clone', '--mirror', git_url, tmp_mirror])
+    os.rename(tmp_mirror, mirror)
+    return mirror
+
+
+def clone_repo(opts, commands, reponame, repo_dir):
+    """
+    Clone the DistGit repository into the repo_dir directory.  When the git
+    mirrors are enabled, the mirror is updated and cloned instead (objects
+    are shared with the mirror, so this is cheap even for long histories) and
+    the origin remote is pointed back to the DistGit repository.
+
+    :param Munch opts: service configuration
+    :param Commands commands: pyrpkg commands for the repository
+    :param str reponame: name of the repository
+    :param str repo_dir: path to the (empty) target directory
+    """
+    if not getattr(opts, "git_mirrors_location", None):
+        commands.clone(reponame, target=repo_dir, skip_hooks=True)
+        return
+
+    mirror = update_git_mirror(opts, reponame)
+    git_url = opts.git_base_url % {"module": reponame}
+    helpers.run_cmd(['git', 'clone', '--shared', mirror, repo_dir])
+    helpers.run_cmd(['git', 'remote', 'set-url', 'origin', git_url],
+                    cwd=repo_dir)
+
+
+def push_branches(branches):
+    """
+    Push all the given branches from the current git directory to origin at
+    once.  Return the list of successfully pushed branches.
+
+    :param list(str) branches: branch names to be pushed
+    """
+    refspecs = ["refs/heads/{0}:refs/heads/{0}".format(b) for b in branches]
+    process = subprocess.run(['git', 'push', '--porcelain', 'origin'] + refspecs,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             encoding='utf-8', check=False)
+    if process.returncode:
+        log.error("Exception raised during push: {}"
+                  .format(process.stderr.strip()))
+
+    pushed = []
+    for line in process.stdout.splitlines():
+        # <flag> TAB <from>:<to> TAB <summary>, the "!" flag means rejected
+        fields = line.split("\t")
+        if len(fields) != 3 or fields[0] not in [" ", "+", "*", "="]:
+            continue
+        ref = fields[1].split(":")[-1]
+        pushed.append(ref[len("refs/heads/"):])
+    return pushed
+
+
 def cleanup_repo(repo_path):
     """
     Remove all files from the given repository
@@ -196,7 +283,7 @@ def import_package(opts, namespace, branches, srpm_path, pkg_name):
 
     try:
         log.debug("clone the pkg repository into repo_dir directory")
-        commands.clone(reponame, target=repo_dir, skip_hooks=True)
+        clone_repo(opts, commands, reponame, repo_dir)
     except Exception as e:
         log.error("Failed to clone the Git repository and add files.")
         raise PackageImportException(str(e))
@@ -211,7 +298,7 @@ def import_package(opts, namespace, branches, srpm_path, pkg_name):
 
     message = "automatic import of {}".format(pkg_name)
 
-    branch_commits = {}
+    committed = {}
     for branch in branches:
         log.debug("checkout '{0}' branch".format(branch))
 
@@ -222,7 +309,7 @@ def import_package(opts, namespace, branches, srpm_path, pkg_name):
             continue
 
         try:
-            if not branch_commits:
+            if not committed:
                 upload_files = commands.import_srpm(
                     srpm_path, check_specfile_matches_repo_name=False)
                 # in case of importing, the content of directory in `reponame`
@@ -243,20 +330,20 @@ def import_package(opts, namespace, branches, srpm_path, pkg_name):
                     # Probably nothing to be committed.
                     log.error(str(e))
             else:
-                sync_branch(branch, branch_commits, message)
+                sync_branch(branch, committed, message)
         except Exception as exc:
             log.exception("Error during source uploading, merge, or commit: %s", str(exc))
             continue
 
-        try:
-            log.debug("push")
-            commands.push()
-        except rpkgError as e:
-            log.exception("Exception raised during push: %s", str(e))
-            continue
-
         commands.load_commit()
-        branch_commits[branch] = commands.commithash
+        committed[branch] = commands.commithash
+
+    # All the branches are pushed at once
+    branch_commits = {}
+    if committed:
+        log.debug("push")
+        for branch in push_branches(list(committed)):
+            branch_commits[branch] = committed[branch]
 
     os.chdir(oldpath)
     shutil.rmtree(repo_dir)
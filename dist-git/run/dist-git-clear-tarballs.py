@@ -3,6 +3,7 @@
 """
 One-shot script to remove all tarballs in <package_lookaside_directory> except
 for tarballs that are referenced by the latest commit of each branch in <package_git_directory>.
+The blobs that are not referenced from the lookaside cache anymore are removed, too.
 Should be run as copr-dist-git user.
 """
 
@@ -13,7 +14,12 @@ import logging
 from configparser import ConfigParser
 
 from copr_common.tree import walk_limited
-from copr_dist_git.helpers import ConfigReader, distgit_cmd_path, run_cmd
+from copr_dist_git.helpers import (
+    ConfigReader,
+    distgit_cmd_path,
+    remove_unused_blobs,
+    run_cmd,
+)
 from copr_dist_git.exceptions import RunCommandException
 
 log = logging.getLogger(__name__)
@@ -52,3 +58,4 @@ if __name__ == "__main__":
         datefmt='%H:%M:%S'
     )
     clear_tarballs(gitroot_dir, opts.lookaside_location)
+    remove_unused_blobs(opts.lookaside_blobs_location)
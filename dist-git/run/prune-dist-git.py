@@ -15,6 +15,7 @@ import datetime
 import copr
 
 from copr.v3.client import Client as CoprClient
+from copr_dist_git.helpers import ConfigReader
 
 parser = argparse.ArgumentParser(description="Prune DistGit repositories and lookaside cache. "
                                              "Requires to be run as copr-dist-git user. "
@@ -25,6 +26,9 @@ parser.add_argument('--repos', action='store', help='local path to a DistGit rep
 parser.add_argument('--lookasidepkgs', action='store', help='local path to a DistGit lookaside cache pkgs root',
                     required=True)
 parser.add_argument('--copr-config', action='store', help='path to copr config with API credentials', required=True)
+parser.add_argument('--git-mirrors', action='store',
+                    help='local path to the root of DistGit repository mirrors used for imports, '
+                         'by default git_mirrors_location from /etc/copr/copr-dist-git.conf')
 parser.add_argument('--always-yes', action='store_true', help="Assume answer 'yes' for each deletion.")
 
 args = parser.parse_args()
@@ -55,30 +59,57 @@ def check_user():
         sys.exit(1)
 
 
-def process_dirname(pkgs_project_path, project_dirname, repos_project_path, username):
-    """Directory doesn't exist so delete it"""
-    answer = None
+def confirm(question):
+    """Ask the user, unless --always-yes is set"""
     if args.always_yes:
-        answer = 'y'
-    while not answer:
-        a = input('Project {0}/{1} does not exist.\nDelete paths {2} and {3} [y/n]? '
-                  .format(username, project_dirname, repos_project_path, pkgs_project_path))
-
+        return True
+    while True:
+        a = input(question)
         if a in ['n', 'no']:
-            answer = 'n'
+            return False
         if a in ['y', 'yes']:
-            answer = 'y'
-    if answer == 'y':
-        print("Deleting {0}".format(repos_project_path))
-        shutil.rmtree(repos_project_path, ignore_errors=True)
-        print("Deleting {0}".format(pkgs_project_path))
-        shutil.rmtree(pkgs_project_path, ignore_errors=True)
+            return True
+
+
+def process_dirname(pkgs_project_path, project_dirname, repos_project_path, username,
+                    mirrors_project_path=None):
+    """Directory doesn't exist so delete it"""
+    paths = [repos_project_path, pkgs_project_path]
+    if mirrors_project_path and os.path.isdir(mirrors_project_path):
+        paths.append(mirrors_project_path)
+
+    if confirm('Project {0}/{1} does not exist.\nDelete paths {2} [y/n]? '
+               .format(username, project_dirname, " and ".join(paths))):
+        for path in paths:
+            print("Deleting {0}".format(path))
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def prune_orphaned_mirrors(git_mirrors):
+    """Delete the mirrors of DistGit repositories that were deleted before"""
+    if not os.path.isdir(git_mirrors):
+        return
+    for username_entry in os.scandir(git_mirrors):
+        if not username_entry.is_dir():
+            continue
+        for project_dirname_entry in os.scandir(username_entry.path):
+            repos_project_path = os.path.join(args.repos, username_entry.name,
+                                              project_dirname_entry.name)
+            if os.path.exists(repos_project_path):
+                continue
+            if confirm('Repository {0} does not exist.\nDelete mirror {1} [y/n]? '
+                       .format(repos_project_path, project_dirname_entry.path)):
+                print("Deleting {0}".format(project_dirname_entry.path))
+                shutil.rmtree(project_dirname_entry.path, ignore_errors=True)
 
 
 def main():
     """The main function that takes care of the whole logic"""
     check_user()
     client = CoprClient.create_from_config_file(args.copr_config)
+    git_mirrors = args.git_mirrors
+    if git_mirrors is None:
+        git_mirrors = ConfigReader().read().git_mirrors_location
     os.chdir(args.repos)
     if not os.path.isdir(args.repos):
         print("{0} is not a directory.".format(args.repos), file=sys.stderr)
@@ -124,7 +155,14 @@ def main():
                 continue
 
             pkgs_project_path = os.path.join(args.lookasidepkgs, username, project_dirname)
-            process_dirname(pkgs_project_path, project_dirname, repos_project_path, username)
+            mirrors_project_path = None
+            if git_mirrors:
+                mirrors_project_path = os.path.join(git_mirrors, username, project_dirname)
+            process_dirname(pkgs_project_path, project_dirname, repos_project_path, username,
+                            mirrors_project_path)
+
+    if git_mirrors:
+        prune_orphaned_mirrors(git_mirrors)
 
 
 if __name__ == "__main__":
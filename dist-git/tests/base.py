@@ -23,6 +23,7 @@ class Base(object):
 
             "git_base_url": "https://my_git_base_url.org",
             "lookaside_location": self.lookaside_location,
+            "lookaside_blobs_location": os.path.join(self.lookaside_location, ".blobs"),
             "sleep_time": 10,
             "pool_busy_sleep_time": 0.5,
             "log_dir": self.tmp_dir_name,
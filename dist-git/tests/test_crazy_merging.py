@@ -113,7 +113,9 @@ def opts_basic(tmpdir, lookaside):
         pass
     opts = _()
     opts.lookaside_location = os.path.join(tmpdir, 'lookaside')
+    opts.lookaside_blobs_location = os.path.join(tmpdir, 'lookaside', '.blobs')
     opts.git_base_url = os.path.join(tmpdir, 'git_repos/%(module)s')
+    opts.git_mirrors_location = os.path.join(tmpdir, 'lookaside', 'git_mirrors')
     opts.git_user_name = os.path.join(tmpdir, 'git_user_name')
     opts.git_user_email = os.path.join(tmpdir, 'git_user_email')
     yield opts
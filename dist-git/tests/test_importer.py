@@ -43,12 +43,6 @@ def mc_time():
         yield handle
 
 
-@pytest.fixture
-def mc_get():
-    with mock.patch("{}.get".format(MODULE_REF)) as handle:
-        yield handle
-
-
 @pytest.fixture
 def mc_post():
     with mock.patch("{}.post".format(MODULE_REF)) as handle:
@@ -56,38 +50,58 @@ def mc_post():
 
 
 class TestImporter(Base):
-    def test_try_to_obtain_new_task_empty(self, mc_get):
-        mc_get.return_value.json.return_value = []
+    def test_try_to_obtain_new_task_empty(self, mc_post):
+        mc_post.return_value.json.return_value = []
         assert len(self.importer.try_to_obtain_new_tasks()) is 0
 
-    def test_try_to_obtain_handle_error(self, mc_get):
+    def test_try_to_obtain_handle_error(self, mc_post):
         for err in [IOError, OSError, ValueError]:
-            mc_get.side_effect = err
+            mc_post.side_effect = err
             assert len(self.importer.try_to_obtain_new_tasks()) is 0
 
-    def test_try_to_obtain_ok(self, mc_get):
-        mc_get.return_value.json.return_value = [self.url_task_data, self.upload_task_data]
+    def test_try_to_obtain_ok(self, mc_post):
+        mc_post.return_value.json.return_value = [self.url_task_data, self.upload_task_data]
         task = self.importer.try_to_obtain_new_tasks()[0]
         assert task.build_id == self.url_task_data["build_id"]
         assert task.owner == self.USER_NAME
         assert self.BRANCH in task.branches
         assert task.srpm_url == "http://example.com/pkg.src.rpm"
 
-    def test_try_to_obtain_ok_2(self, mc_get):
-        mc_get.return_value.json.return_value = [self.upload_task_data, self.url_task_data]
+    def test_try_to_obtain_ok_2(self, mc_post):
+        mc_post.return_value.json.return_value = [self.upload_task_data, self.url_task_data]
         task = self.importer.try_to_obtain_new_tasks()[0]
         assert task.build_id == self.upload_task_data["build_id"]
         assert task.owner == self.USER_NAME
         assert self.BRANCH in task.branches
         assert task.srpm_url == "http://front/tmp/tmp_2/pkg_2.src.rpm"
 
-    def test_try_to_obtain_new_task_unknown_source_type_ok_3(self, mc_get):
+    def test_try_to_obtain_new_task_unknown_source_type_ok_3(self, mc_post):
         task_data = copy.deepcopy(self.url_task_data)
         task_data["source_type"] = 999999
-        mc_get.return_value.json.return_value = [task_data]
+        mc_post.return_value.json.return_value = [task_data]
         task = self.importer.try_to_obtain_new_tasks()[0]
         assert task.build_id == task_data["build_id"]
 
+    def test_try_to_obtain_lease(self, mc_post):
+        mc_post.return_value.json.return_value = [self.url_task_data, self.upload_task_data]
+        tasks = self.importer.try_to_obtain_new_tasks(
+            exclude=[self.url_task_data["build_id"]], limit=2, expire=60)
+        assert [task.build_id for task in tasks] == [self.upload_task_data["build_id"]]
+        data = json.loads(mc_post.call_args[1]["data"])
+        assert data == {"holder": self.importer.lease_holder, "limit": 3,
+                        "expire": 60}
+        assert mc_post.call_args[0][0].endswith("/backend/importing/lease/")
+
+    def test_lease_tasks(self, mc_post):
+        mc_post.return_value.json.return_value = [self.url_task_data, self.upload_task_data]
+        tasks = self.importer.lease_tasks(
+            2, expire=60, exclude=[self.url_task_data["build_id"]],
+            owner_limit=5)
+        assert [task.build_id for task in tasks] == [123, 124]
+        data = json.loads(mc_post.call_args[1]["data"])
+        assert data == {"holder": self.importer.lease_holder, "limit": 3,
+                        "expire": 60, "owner_limit": 5}
+
     def test_post_back(self, mc_post):
         dd = {"foo": "bar"}
         self.importer.post_back(dd)
@@ -138,8 +152,9 @@ class TestImporter(Base):
         def _shortener(the_dict):
             return copr_dist_git.import_task.ImportTask.from_dict(
                 defaultdict(lambda: "notset", the_dict))
-        self.importer.try_to_obtain_new_tasks = MagicMock()
-        self.importer.try_to_obtain_new_tasks.return_value = [
+        self.importer.lease_tasks = MagicMock()
+        self.dispatcher._running_build_ids = MagicMock(return_value=[1])
+        self.importer.lease_tasks.return_value = [
             _shortener({"build_id": 1, "sandbox": "a", "background": False}),
             _shortener({"build_id": 2, "sandbox": "a", "background": False}),
             _shortener({"build_id": 3, "sandbox": "b", "background": False}),
@@ -152,6 +167,12 @@ class TestImporter(Base):
         assert tasks[2].priority == 1
         assert tasks[3].priority == 1
         assert tasks[4].priority == 103
+        self.importer.lease_tasks.assert_called_once_with(
+            limit=mock.ANY, expire=mock.ANY, exclude=[1], owner_limit=5)
+
+        # lease failure, the queue is not touched
+        self.importer.lease_tasks.side_effect = IOError
+        assert self.dispatcher.get_frontend_tasks() == []
 
 
     def test_run(self, mc_time, mc_worker):
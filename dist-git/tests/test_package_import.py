@@ -1,24 +1,27 @@
 # coding: utf-8
 
 import os
+import subprocess
 
 from unittest import mock
 from unittest.mock import MagicMock
 
 import pytest
-from pyrpkg import rpkgError
 from munch import Munch
 
 from base import Base
 
 from copr_dist_git.package_import import (
+    clone_repo,
     import_package,
     my_upload_fabric,
+    push_branches,
     refresh_cgit_listing,
     setup_git_repo,
+    update_git_mirror,
 )
 
-from copr_dist_git.helpers import distgit_cmd_path
+from copr_dist_git.helpers import distgit_cmd_path, remove_unused_blobs
 
 MODULE_REF = 'copr_dist_git.package_import'
 
@@ -53,6 +56,12 @@ def mc_sync_branch():
         yield handle
 
 
+@pytest.fixture
+def mc_push_branches():
+    with mock.patch("{}.push_branches".format(MODULE_REF)) as handle:
+        yield handle
+
+
 @pytest.fixture
 def mc_refresh_cgit_listing():
     with mock.patch("{}.refresh_cgit_listing".format(MODULE_REF)) as handle:
@@ -88,9 +97,38 @@ class TestPackageImport(Base):
          my_upload("", reponame, source_path, self.FILE_HASH)
          assert os.path.isfile(target)
 
+    def test_my_upload_deduplicated(self, mc_os_setgid):
+        filename = "source"
+        source_path = os.path.join(self.tmp_dir_name, filename)
+        with open(source_path, "w") as handle:
+            handle.write("1")
+
+        my_upload = my_upload_fabric(self.opts)
+        targets = []
+        for reponame in ["foo/bar/pkg", "baz/bar/pkg"]:
+            my_upload("", reponame, source_path, self.FILE_HASH)
+            targets.append("/".join([
+                self.lookaside_location, reponame, filename, self.FILE_HASH,
+                filename
+            ]))
+
+        blob = os.path.join(
+            self.opts.lookaside_blobs_location, "6b",
+            "6b86b273ff34fce19d6b804eff5a3f5747ada4eaa22f1d49c01e52ddb7875b4b")
+        assert os.stat(blob).st_nlink == 3
+        for target in targets:
+            assert os.path.samefile(target, blob)
+
+        for target in targets:
+            os.unlink(target)
+        remove_unused_blobs(self.opts.lookaside_blobs_location)
+        assert not os.path.exists(blob)
+
     def test_import_package(self, mc_pyrpkg_commands, mc_helpers, mc_shutil,
-                            mc_sync_branch, mc_setup_git_repo, mc_refresh_cgit_listing):
+                            mc_sync_branch, mc_setup_git_repo, mc_refresh_cgit_listing,
+                            mc_push_branches):
         mc_cmd = MagicMock()
+        mc_push_branches.side_effect = lambda branches: branches
         mc_pyrpkg_commands.return_value = mc_cmd
         mc_cmd.commithash = '1234'
 
@@ -104,7 +142,10 @@ class TestPackageImport(Base):
         })
         assert (result == expected_result)
 
-        mc_cmd.push.side_effect = rpkgError
+        mc_push_branches.assert_called_once_with(['f25', 'f26'])
+
+        mc_push_branches.side_effect = None
+        mc_push_branches.return_value = []
         result = import_package(self.opts, namespace, branches, 'some_srpm_path', 'pkg_name')
         expected_result = Munch({
             'branch_commits': {},
@@ -113,6 +154,54 @@ class TestPackageImport(Base):
         assert (result == expected_result)
 
 
+    def test_git_mirror(self):
+        reponame = "foo/bar/pkg"
+        self.opts.git_base_url = os.path.join(self.tmp_dir_name, "git", "%(module)s")
+        self.opts.git_mirrors_location = os.path.join(self.tmp_dir_name, "mirrors")
+        origin = self.opts.git_base_url % {"module": reponame}
+        work = os.path.join(self.tmp_dir_name, "work")
+        assert 0 == os.system(
+        """ set -e
+        git init -q --bare {origin}
+        git init -q {work}
+        cd {work}
+        git config user.email "you@example.com"
+        git config user.name "Your Name"
+        git commit -q --allow-empty -m 'initial commit'
+        git push -q {origin} HEAD:refs/heads/f25 HEAD:refs/heads/f26
+        """.format(origin=origin, work=work))
+
+        repo_dir = os.path.join(self.tmp_dir_name, "repo")
+        clone_repo(self.opts, None, reponame, repo_dir)
+        mirror = os.path.join(self.opts.git_mirrors_location, reponame + ".git")
+        assert os.path.isdir(mirror)
+
+        oldpath = os.getcwd()
+        os.chdir(repo_dir)
+        try:
+            assert 0 == os.system(
+            """ set -e
+            git config user.email "you@example.com"
+            git config user.name "Your Name"
+            git checkout -q -b f25 origin/f25
+            git commit -q --allow-empty -m 'second commit'
+            git checkout -q -b f26 origin/f26
+            git reset -q --hard f25
+            git checkout -q -b f27
+            """)
+            assert push_branches(["f25", "f26", "f27"]) == ["f25", "f26", "f27"]
+            # up to date
+            assert push_branches(["f25"]) == ["f25"]
+        finally:
+            os.chdir(oldpath)
+
+        # the mirror is updated incrementally
+        update_git_mirror(self.opts, reponame)
+        branches = subprocess.check_output(
+            ["git", "branch", "--format=%(refname:short)"], cwd=mirror,
+            encoding="utf-8").split()
+        assert branches == ["f25", "f26", "f27"]
+
     def test_setup_git_repo(self, mc_subprocess_check_output):
         reponame = 'foo'
         branches = ['f25', 'f26']
@@ -265,6 +265,7 @@ install -d %{buildroot}%{_libexecdir}
 install -p -m 755 conf/cron.hourly/copr-frontend* %{buildroot}%{_sysconfdir}/cron.hourly
 install -p -m 755 conf/cron.daily/copr-frontend* %{buildroot}%{_sysconfdir}/cron.daily
 install -p -m 755 coprs_frontend/run/copr_dump_db.sh %{buildroot}%{_libexecdir}
+install -p -m 644 conf/copr-frontend-search-indexer.service %{buildroot}%{_unitdir}
 
 cp -a coprs_frontend/* %{buildroot}%{_datadir}/copr/coprs_frontend
 rm -rf %{buildroot}%{_datadir}/copr/coprs_frontend/tests
@@ -313,15 +314,18 @@ install -m0644 -D conf/copr-frontend.sysusers.conf %{buildroot}%{_sysusersdir}/c
 %post
 /bin/systemctl condrestart httpd.service || :
 %systemd_post fm-consumer@copr_messaging.service
+%systemd_post copr-frontend-search-indexer.service
 
 
 %preun
 %systemd_preun fm-consumer@copr_messaging.service
+%systemd_preun copr-frontend-search-indexer.service
 
 
 %postun
 /bin/systemctl condrestart httpd.service || :
 %systemd_postun_with_restart fm-consumer@copr_messaging.service
+%systemd_postun_with_restart copr-frontend-search-indexer.service
 
 
 %files
@@ -360,6 +364,7 @@ install -m0644 -D conf/copr-frontend.sysusers.conf %{buildroot}%{_sysusersdir}/c
 %config(noreplace) %{_sysconfdir}/cron.hourly/copr-frontend-optional
 %config(noreplace) %{_sysconfdir}/cron.daily/copr-frontend-optional
 %{_libexecdir}/copr_dump_db.sh
+%{_unitdir}/copr-frontend-search-indexer.service
 %exclude_files flavor
 %exclude_files devel
 %{_sysusersdir}/copr-frontend.conf
@@ -0,0 +1,28 @@
+"""
+Add Build.import_lease_holder and Build.import_lease_expires columns
+
+Revision ID: 4e8d2a61c9b7
+Create Date: 2026-10-18 21:48:05.530127
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e8d2a61c9b7'
+down_revision = '9b4c2f1e7a3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('build', sa.Column('import_lease_holder', sa.Text(),
+                                     nullable=True))
+    op.add_column('build', sa.Column('import_lease_expires', sa.Integer(),
+                                     nullable=True))
+
+
+def downgrade():
+    op.drop_column('build', 'import_lease_expires')
+    op.drop_column('build', 'import_lease_holder')
@@ -0,0 +1,28 @@
+"""
+Add the counter_stat_flush table
+
+Revision ID: 5c3e7d91a0f4
+Create Date: 2026-10-19 09:12:44.204518
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = '5c3e7d91a0f4'
+down_revision = '4e8d2a61c9b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'counter_stat_flush',
+        sa.Column('counter_type', sa.String(length=30), nullable=False),
+        sa.Column('flush_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('counter_type')
+    )
+
+
+def downgrade():
+    op.drop_table('counter_stat_flush')
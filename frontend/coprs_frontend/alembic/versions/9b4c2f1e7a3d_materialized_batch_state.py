@@ -0,0 +1,75 @@
+"""
+Add materialized Batch.is_finished and Batch.is_blocked columns
+
+Revision ID: 9b4c2f1e7a3d
+Create Date: 2026-10-18 10:12:41.114732
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from copr_common.enums import StatusEnum
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4c2f1e7a3d'
+down_revision = 'bb52d9f878f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('batch', sa.Column('is_finished', sa.Boolean(),
+                                     server_default='0', nullable=False))
+    op.add_column('batch', sa.Column('is_blocked', sa.Boolean(),
+                                     server_default='0', nullable=False))
+    op.create_index(op.f('ix_batch_is_blocked'), 'batch', ['is_blocked'],
+                    unique=False)
+
+    finished = ", ".join(str(StatusEnum(state)) for state in
+                         ["succeeded", "forked", "canceled", "skipped", "failed"])
+    early = ", ".join(str(StatusEnum(state)) for state in ["failed", "canceled"])
+
+    # The same logic as BatchesLogic._unfinished_build_exists()
+    op.execute(f"""
+    UPDATE batch SET is_finished = true
+    WHERE EXISTS (SELECT 1 FROM build WHERE build.batch_id = batch.id)
+      AND NOT EXISTS (
+        SELECT 1 FROM build
+        WHERE build.batch_id = batch.id
+          AND build.canceled = false
+          AND (build.source_status IS NULL
+               OR build.source_status NOT IN ({early}))
+          AND (
+            EXISTS (
+              SELECT 1 FROM build_chroot
+              WHERE build_chroot.build_id = build.id
+                AND (build_chroot.status IS NULL
+                     OR build_chroot.status NOT IN ({finished})))
+            OR (
+              NOT EXISTS (SELECT 1 FROM build_chroot
+                          WHERE build_chroot.build_id = build.id)
+              AND (build.source_status IS NULL
+                   OR build.source_status NOT IN ({finished})))
+          )
+      )
+    """)
+
+    # Batch is blocked if the parent is not finished or blocked, iterate
+    # until all the batch chains are propagated.
+    conn = op.get_bind()
+    while True:
+        result = conn.execute(sa.text("""
+        UPDATE batch SET is_blocked = true
+        FROM batch AS parent
+        WHERE batch.blocked_by_id = parent.id
+          AND batch.is_blocked = false
+          AND (parent.is_finished = false OR parent.is_blocked = true)
+        """))
+        if not result.rowcount:
+            break
+
+
+def downgrade():
+    op.drop_index(op.f('ix_batch_is_blocked'), table_name='batch')
+    op.drop_column('batch', 'is_blocked')
+    op.drop_column('batch', 'is_finished')
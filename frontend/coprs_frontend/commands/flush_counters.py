@@ -0,0 +1,17 @@
+"""
+Cron logic for moving the buffered counter increments from Redis to database
+"""
+
+import click
+
+from coprs.logic.stat_logic import CounterStatLogic
+
+
+@click.command()
+def flush_counters():
+    """
+    Store the counter increments (e.g. repo file downloads) buffered in Redis
+    into the database.
+    """
+    count = CounterStatLogic.flush_buffered()
+    print("Flushed {0} counters".format(count))
@@ -0,0 +1,43 @@
+"""
+Daemon keeping the whoosh search index up-to-date
+"""
+
+import time
+
+import click
+from flask_whooshee import Whooshee
+from redis.exceptions import RedisError
+from whoosh.index import LockError
+
+from coprs import app
+from coprs.whoosheers import CoprWhoosheer
+
+
+@click.command()
+@click.option("--interval", type=int, default=2,
+              help="Seconds to sleep when there's nothing to re-index")
+@click.option("--once", is_flag=True, default=False,
+              help="Re-index the queued projects, and exit")
+def search_indexer(interval, once):
+    """
+    Re-index the projects changed since the last run (queued in Redis on
+    commit), in batches.  Runs forever unless --once is specified.
+    """
+    index = Whooshee.get_or_create_index(app, CoprWhoosheer)
+    while True:
+        try:
+            count = CoprWhoosheer.index_dirty(index)
+            if count:
+                app.logger.info("Re-indexed %s projects", count)
+        except (RedisError, LockError) as err:
+            app.logger.warning("Can't re-index projects now: %s", err)
+            count = 0
+        except Exception:  # pylint: disable=broad-except
+            # e.g. a database error, the projects are queued again
+            app.logger.exception("Failed to re-index projects")
+            count = 0
+
+        if once and not count:
+            return
+        if not count:
+            time.sleep(interval)
@@ -2,8 +2,9 @@ import click
 import whoosh
 from flask_whooshee import Whooshee
 from coprs import app
+from coprs import db
+from coprs import models
 from coprs.whoosheers import CoprWhoosheer, WhoosheeStamp
-from coprs.logic import coprs_logic
 
 @click.command()
 def update_indexes():
@@ -18,13 +19,13 @@ def update_indexes():
     writer.schema = CoprWhoosheer.schema
 
     app.logger.info("Building cache")
-    coprs = coprs_logic.CoprsLogic.get_multiple(
-        include_unlisted_on_hp=False).all()
-    for i, copr in enumerate(coprs):
-        if i%1000 == 0:
-            app.logger.info("Building cache [%s/%s] - %s",
-                            i, len(coprs), copr.full_name)
-        CoprWhoosheer.insert_copr(writer, copr)
+    copr_ids = [copr_id for copr_id, in (
+        db.session.query(models.Copr.id)
+        .filter(models.Copr.deleted.is_(False))
+        .filter(models.Copr.unlisted_on_hp.is_(False))
+        .filter(models.Copr.delete_after.is_(None))
+    )]
+    CoprWhoosheer.bulk_index(writer, copr_ids, log=app.logger)
 
     # Commit changes but don't merge them with the existing index.
     # Instead, build a new index from scratch.
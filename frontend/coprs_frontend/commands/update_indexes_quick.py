@@ -18,13 +18,11 @@ def update_indexes_quick(minutes_passed):
     index = Whooshee.get_or_create_index(app, CoprWhoosheer)
 
     writer = index.writer()
-    query = db.session.query(models.Copr).filter(
+    query = db.session.query(models.Copr.id).filter(
         models.Copr.latest_indexed_data_update >= time.time()-int(minutes_passed)*60
     )
 
-    coprs = query.all()
-    app.logger.info("Updating %s projects", len(coprs))
-    for copr in coprs:
-        CoprWhoosheer.delete_copr(writer, copr)
-        CoprWhoosheer.insert_copr(writer, copr)
+    copr_ids = [copr_id for copr_id, in query]
+    app.logger.info("Updating %s projects", len(copr_ids))
+    CoprWhoosheer.bulk_index(writer, copr_ids, update=True)
     writer.commit(optimize=True)
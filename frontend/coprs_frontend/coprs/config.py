@@ -158,6 +158,12 @@ class Config(object):
 
     HIDE_IMPORT_LOG_AFTER_DAYS = 14
 
+    # How many /api_3/build/watch requests may block (wait for a build state
+    # change) at once, per frontend process.  Each of them occupies one WSGI
+    # thread, so keep this well below the WSGIDaemonProcess "threads" number.
+    # Further watch requests only check the states and return immediately.
+    WATCH_MAX_WAITERS = 2
+
     # LDAP server URL, e.g. ldap://ldap.foo.company.com
     LDAP_URL = None
 
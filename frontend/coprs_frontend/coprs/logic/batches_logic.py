@@ -6,11 +6,13 @@ import contextlib
 import anytree
 import backoff
 
+from sqlalchemy import and_, exists, or_
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.sql import text
+from sqlalchemy.sql import false, text
+from copr_common.enums import StatusEnum
 from coprs import app, db, cache
-from coprs.helpers import WorkList
-from coprs.models import Batch, Build
+from coprs.helpers import FINISHED_STATUSES, WorkList
+from coprs.models import Batch, Build, BuildChroot
 from coprs.exceptions import BadRequest
 import coprs.logic.builds_logic as bl
 
@@ -81,9 +83,107 @@ class BatchesLogic:
             if not build.batch:
                 build.batch = Batch()
                 db.session.add(build.batch)
+                db.session.flush()
+                # The build may be already finished, and the new batch may
+                # become a parent of other batches right away.
+                cls.update_state(build.batch)
 
         return build.batch
 
+    @staticmethod
+    def _unfinished_build_exists(batch_id):
+        """
+        SQL variant of "any(not build.finished for build in batch.builds)"
+        """
+        status_unfinished = or_(
+            BuildChroot.status.is_(None),
+            BuildChroot.status.notin_(FINISHED_STATUSES),
+        )
+        source_unfinished = or_(
+            Build.source_status.is_(None),
+            Build.source_status.notin_(FINISHED_STATUSES),
+        )
+        has_chroots = exists().where(BuildChroot.build_id == Build.id)
+        unfinished_chroot = exists().where(and_(
+            BuildChroot.build_id == Build.id,
+            status_unfinished,
+        ))
+        return db.session.query(exists().where(and_(
+            Build.batch_id == batch_id,
+            # see Build.finished_early
+            Build.canceled == false(),
+            or_(
+                Build.source_status.is_(None),
+                Build.source_status.notin_([StatusEnum("failed"),
+                                            StatusEnum("canceled")]),
+            ),
+            or_(
+                unfinished_chroot,
+                and_(~has_chroots, source_unfinished),
+            ),
+        ))).scalar()
+
+    @classmethod
+    def update_state(cls, batch, allow_empty=False):
+        """
+        Re-calculate the materialized Batch.is_finished state (call this when
+        some build in the batch finishes, or is deleted), and when the batch is
+        finished, unblock the batches depending on it.  A batch without builds
+        is considered finished only with ALLOW_EMPTY=True (all its builds were
+        deleted), otherwise the builds are just not assigned yet.
+        """
+        if batch.is_finished:
+            return
+        # Lock the batch row, otherwise two concurrent transactions finishing
+        # the last two builds would each see the other build unfinished, and
+        # the batch would never be marked as finished.  Re-load the state,
+        # the other transaction may have finished the batch meanwhile.
+        batch = Batch.query.filter_by(id=batch.id).with_for_update() \
+            .populate_existing().one()
+        if batch.is_finished:
+            return
+        has_builds = db.session.query(
+            exists().where(Build.batch_id == batch.id)).scalar()
+        if not has_builds and not allow_empty:
+            # no builds assigned to this batch (yet)
+            return
+        if has_builds and cls._unfinished_build_exists(batch.id):
+            # still processing
+            return
+        log.info("Batch %s finished", batch.id)
+        batch.is_finished = True
+        db.session.add(batch)
+        cls._propagate_blocked(batch)
+
+    @classmethod
+    def set_blocked_by(cls, batch, parent):
+        """
+        Make the BATCH blocked by the PARENT batch
+        """
+        batch.blocked_by = parent
+        batch.is_blocked = cls._blocks_children(parent)
+
+    @staticmethod
+    def _blocks_children(batch):
+        return batch.is_blocked or not batch.is_finished
+
+    @classmethod
+    def _propagate_blocked(cls, batch):
+        """
+        Update the Batch.is_blocked state of all the (transitively) dependent
+        batches.
+        """
+        wl = WorkList([batch])
+        while not wl.empty:
+            parent = wl.pop()
+            blocked = cls._blocks_children(parent)
+            for child in Batch.query.filter(Batch.blocked_by_id == parent.id):
+                if child.is_blocked == blocked:
+                    continue
+                child.is_blocked = blocked
+                db.session.add(child)
+                wl.schedule(child)
+
     @staticmethod
     def pending_batches():
         """
@@ -1,11 +1,17 @@
+import contextlib
 import tempfile
 import shutil
+import itertools
 import json
 import os
 import pprint
+import threading
 import time
+from collections import defaultdict
 import requests
 
+from redis.exceptions import RedisError
+from sqlalchemy import event, inspect
 from sqlalchemy.sql import text
 from sqlalchemy.sql.expression import not_
 from sqlalchemy.orm import joinedload, selectinload, load_only, contains_eager
@@ -52,8 +58,65 @@ PROCESSING_STATES = [StatusEnum(s) for s in [
     "running", "pending", "starting", "importing", "waiting",
 ]]
 
+# Redis channel where the IDs of builds with a changed state are published
+BUILD_STATE_CHANNEL = "copr:frontend:build_state"
+
+# Session.info key with the set of builds with a changed state
+BUILD_STATE_CHANGES = "build_state_changes"
+
+
+def _attrs_changed(obj, attrs):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+@event.listens_for(db.session, "after_flush")
+def collect_build_state_changes(session, _flush_context):
+    """
+    Remember which builds changed their state in this transaction, so we can
+    notify the watchers (see BuildsLogic.watch_builds) after commit.
+    """
+    changes = set()
+    for obj in session.dirty:
+        if isinstance(obj, models.BuildChroot):
+            if _attrs_changed(obj, ["status"]):
+                changes.add(obj.build_id)
+        elif isinstance(obj, models.Build):
+            if _attrs_changed(obj, ["source_status", "canceled"]):
+                changes.add(obj.id)
+    if changes:
+        session.info.setdefault(BUILD_STATE_CHANGES, set()).update(changes)
+
+
+@event.listens_for(db.session, "after_commit")
+def publish_build_state_changes(session):
+    """ Notify the watchers about the changed builds """
+    changes = session.info.pop(BUILD_STATE_CHANGES, None)
+    if changes:
+        BuildsLogic.publish_state_changes(changes)
+
+
+@event.listens_for(db.session, "after_rollback")
+def forget_build_state_changes(session):
+    """ Nothing changed """
+    session.info.pop(BUILD_STATE_CHANGES, None)
+
 
 class BuildsLogic(object):
+    # Maximum number of builds watched by one watch_builds() call, and the
+    # maximum number of seconds to wait there
+    WATCH_MAX_BUILDS = 1000
+    WATCH_MAX_TIMEOUT = 60
+
+    # How often we check the database for changes when Redis isn't available
+    WATCH_POLL_INTERVAL = 5
+
+    # Maximum number of builds in one get_build_states() call
+    STATES_MAX_BUILDS = 5000
+
+    _redis = None
+    _watch_slots = None
+
     @classmethod
     def get(cls, build_id):
         return models.Build.query.filter(models.Build.id == build_id)
@@ -304,6 +367,64 @@ class BuildsLogic(object):
             query = query.filter(models.Build.is_background == (true() if background else false()))
         return query
 
+    @classmethod
+    def lease_importing_builds(cls, holder, limit, expire, owner_limit=None):
+        """
+        Lease up to LIMIT builds from the importing queue to the HOLDER
+        (DistGit machine) for EXPIRE seconds, and return them.  Builds leased
+        to other holders are skipped until their lease expires, builds already
+        leased to the same HOLDER are returned again (first) and their lease is
+        prolonged.  With OWNER_LIMIT, at most that many builds per project owner
+        are leased, so one owner's mass rebuild doesn't starve the others.  The
+        rows are locked (concurrent requests skip them), so one build is never
+        leased to two holders at the same time.
+        """
+        now = int(time.time())
+        leasable = or_(models.Build.import_lease_holder.is_(None),
+                       models.Build.import_lease_holder == holder,
+                       models.Build.import_lease_expires < now)
+
+        # Pick the build IDs fairly, without locking the whole queue
+        candidates = (
+            cls.get_build_importing_queue()
+            .join(models.Copr, models.Build.copr_id == models.Copr.id)
+            .filter(leasable)
+            .with_entities(models.Build.id, models.Copr.user_id,
+                           models.Copr.group_id,
+                           models.Build.import_lease_holder == holder)
+        )
+        held = []
+        other = []
+        for build_id, user_id, group_id, is_held in candidates:
+            owner = ("group", group_id) if group_id else ("user", user_id)
+            (held if is_held else other).append((build_id, owner))
+
+        build_ids = []
+        per_owner = defaultdict(int)
+        for build_id, owner in held + other:
+            if len(build_ids) >= limit:
+                break
+            if owner_limit and per_owner[owner] >= owner_limit:
+                continue
+            per_owner[owner] += 1
+            build_ids.append(build_id)
+        if not build_ids:
+            return []
+
+        query = (
+            models.Build.query
+            .filter(models.Build.id.in_(build_ids))
+            .filter(leasable)
+            .order_by(models.Build.id.asc())
+            .with_for_update(skip_locked=True, of=models.Build)
+        )
+        builds = query.all()
+        for build in builds:
+            build.import_lease_holder = holder
+            build.import_lease_expires = now + expire
+            db.session.add(build)
+        return builds
+
     @classmethod
     def _todo_states(cls, data_type):
         """
@@ -321,6 +442,21 @@ class BuildsLogic(object):
             todo_states += ["starting", "running"]
         return [StatusEnum(x) for x in todo_states]
 
+    @classmethod
+    def _filter_unblocked(cls, query, data_type):
+        """
+        Backend can not process the builds in blocked batches, filter them out
+        (per the materialized Batch.is_blocked state).
+        """
+        if data_type != "for_backend":
+            return query
+        return (
+            query.outerjoin(models.Batch,
+                            models.Build.batch_id == models.Batch.id)
+            .filter(or_(models.Build.batch_id.is_(None),
+                        models.Batch.is_blocked == false()))
+        )
+
     @classmethod
     def get_pending_srpm_build_tasks(cls, background=None, data_type=None):
         query = (
@@ -330,6 +466,7 @@ class BuildsLogic(object):
             .filter(models.Build.source_status.in_(cls._todo_states(data_type)))
             .order_by(models.Build.is_background.asc(), models.Build.id.asc())
         )
+        query = cls._filter_unblocked(query, data_type)
 
         if data_type in ["for_backend", "overview"]:
 
@@ -368,10 +505,6 @@ class BuildsLogic(object):
                 joinedload(models.Build.user).load_only(
                     models.User.username,
                 ),
-                # preload also batch info
-                joinedload(models.Build.batch).load_only(
-                    models.Batch.blocked_by_id,
-                ),
             )
         if background is not None:
             query = query.filter(models.Build.is_background == (true() if background else false()))
@@ -402,6 +535,7 @@ class BuildsLogic(object):
             query.filter(models.Build.canceled == false())
             .filter(models.BuildChroot.status.in_(cls._todo_states(data_type)))
             .order_by(models.Build.is_background.asc(), models.Build.id.asc()))
+        query = cls._filter_unblocked(query, data_type)
 
         if data_type in ["for_backend", "overview"]:
             query = query.options(
@@ -436,10 +570,6 @@ class BuildsLogic(object):
                     joinedload(models.Build.user).load_only(
                         models.User.username,
                     ),
-                    # preload also batch info
-                    joinedload(models.Build.batch).load_only(
-                        models.Batch.blocked_by_id,
-                    ),
                 ),
                 joinedload(models.BuildChroot.mock_chroot).load_only(
                     models.MockChroot.os_version,
@@ -466,10 +596,262 @@ class BuildsLogic(object):
         except NoResultFound as ex:
             raise ObjectNotFound("Specified task ID not found") from ex
 
+    @classmethod
+    def get_build_tasks_by_ids(cls, task_ids):
+        """
+        Bulk variant of get_build_task(), load all the BuildChroot objects
+        (together with the related objects needed by get_build_record()) for
+        the list of TASK_IDS in one query.  Invalid or non-existing task IDs
+        are silently skipped.
+        """
+        wanted = set()
+        build_ids = set()
+        for task_id in task_ids:
+            build_id, _, chroot_name = str(task_id).partition("-")
+            if not build_id.isdigit() or not chroot_name:
+                continue
+            wanted.add(task_id)
+            build_ids.add(int(build_id))
+
+        if not build_ids:
+            return []
+
+        query = (
+            models.BuildChroot.query
+            .filter(models.BuildChroot.build_id.in_(build_ids))
+            .options(
+                joinedload(models.BuildChroot.mock_chroot),
+                joinedload(models.BuildChroot.build).options(
+                    joinedload(models.Build.copr).options(
+                        joinedload(models.Copr.user),
+                        joinedload(models.Copr.group),
+                    ),
+                    joinedload(models.Build.copr_dir),
+                    joinedload(models.Build.package),
+                    joinedload(models.Build.user),
+                ),
+            )
+            .order_by(models.BuildChroot.build_id.asc())
+        )
+        # MockChroot.name is not a column, so filter the chroots here
+        return [build_chroot for build_chroot in query
+                if build_chroot.task_id in wanted]
+
     @classmethod
     def get_srpm_build_task(cls, build_id):
         return BuildsLogic.get_by_id(build_id).first()
 
+    @classmethod
+    def get_srpm_build_tasks_by_ids(cls, build_ids):
+        """
+        Bulk variant of get_srpm_build_task(), load all the Build objects (with
+        the related objects needed by get_srpm_build_record()) in one query.
+        """
+        return (
+            models.Build.query
+            .filter(models.Build.id.in_(build_ids))
+            .options(
+                joinedload(models.Build.copr).options(
+                    joinedload(models.Copr.user),
+                    joinedload(models.Copr.group),
+                ),
+                joinedload(models.Build.copr_dir),
+                joinedload(models.Build.package),
+                joinedload(models.Build.user),
+            )
+            .order_by(models.Build.id.asc())
+        )
+
+    @classmethod
+    def get_builds_by_ids(cls, build_ids):
+        """
+        Load the Build objects with the given IDs, together with everything
+        needed for calculating their state, in one query.
+        """
+        return (
+            cls.get_srpm_build_tasks_by_ids(build_ids)
+            .options(
+                selectinload(models.Build.build_chroots)
+                .joinedload(models.BuildChroot.mock_chroot),
+            )
+        )
+
+    @classmethod
+    def get_build_states(cls, build_ids):
+        """
+        Generate compact state records ``{"id": .., "state": .., "chroots":
+        {name: state}}`` for the given BUILD_IDS (sorted by ID, non-existing
+        builds are skipped).  Only the needed columns are selected by one
+        query joining the build chroots, no ORM objects are loaded.
+        """
+        query = (
+            db.session.query(
+                models.Build.id,
+                models.Build.canceled,
+                models.Build.source_status,
+                models.BuildChroot.status,
+                models.MockChroot.os_release,
+                models.MockChroot.os_version,
+                models.MockChroot.arch,
+            )
+            .outerjoin(models.BuildChroot,
+                       models.BuildChroot.build_id == models.Build.id)
+            .outerjoin(models.MockChroot,
+                       models.MockChroot.id == models.BuildChroot.mock_chroot_id)
+            .filter(models.Build.id.in_(build_ids))
+            .order_by(models.Build.id)
+            .yield_per(1000)
+        )
+
+        for build_id, rows in itertools.groupby(query, lambda row: row[0]):
+            rows = list(rows)
+            _, canceled, source_status = rows[0][:3]
+            chroots = {}
+            for row in rows:
+                status, os_release, os_version, arch = row[3:]
+                if os_release is None:
+                    continue  # no build chroots (outer join)
+                chroots["{}-{}-{}".format(os_release, os_version, arch)] = \
+                    StatusEnum(status) if status is not None else "unknown"
+
+            status = models.Build.calculate_status(
+                build_id, canceled, source_status,
+                [row[3] for row in rows if row[4] is not None])
+            yield {
+                "id": build_id,
+                "state": StatusEnum(status) if status is not None else "unknown",
+                "chroots": chroots,
+            }
+
+    @classmethod
+    def _get_redis(cls):
+        if cls._redis is None:
+            cls._redis = helpers.RedisConnectionProvider(
+                config=app.config).get_connection()
+        return cls._redis
+
+    @classmethod
+    def publish_state_changes(cls, build_ids):
+        """
+        Let the watch_builds() callers (in all the frontend processes) know
+        that the given builds changed their state.
+        """
+        try:
+            cls._get_redis().publish(BUILD_STATE_CHANNEL,
+                                     json.dumps(sorted(build_ids)))
+        except RedisError as err:
+            log.warning("Can't publish the build state changes: %s", err)
+
+    @classmethod
+    def _wait_for_published(cls, pubsub, build_ids, deadline):
+        """
+        Wait till some of the BUILD_IDS are published as changed, or until
+        DEADLINE.  Return the set of (possibly) changed builds.  Without Redis
+        (PUBSUB is None) just sleep a while, and let the caller check all.
+        """
+        if pubsub is None:
+            time.sleep(max(0, min(cls.WATCH_POLL_INTERVAL,
+                                  deadline - time.time())))
+            return build_ids
+
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return build_ids
+            try:
+                message = pubsub.get_message(timeout=remaining)
+            except RedisError as err:
+                log.warning("Can't wait for the build state changes: %s", err)
+                return build_ids
+            if not message:
+                continue
+            changed = build_ids & set(json.loads(message["data"]))
+            if changed:
+                return changed
+
+    @staticmethod
+    def _check_watched_exist(build_ids, builds):
+        if len(builds) != len(build_ids):
+            missing = build_ids - {build.id for build in builds}
+            raise ObjectNotFound("Builds {0} don't exist".format(
+                ", ".join(str(x) for x in sorted(missing))))
+
+    @classmethod
+    @contextlib.contextmanager
+    def _watch_slot(cls, timeout):
+        """
+        Acquire one of the WATCH_MAX_WAITERS slots for a waiting watcher, and
+        yield the TIMEOUT we can wait.  When all the slots are taken, yield 0
+        (no waiting), so the watchers can not occupy all the WSGI threads.
+        """
+        if not timeout:
+            yield 0
+            return
+        if cls._watch_slots is None:
+            cls._watch_slots = threading.BoundedSemaphore(
+                app.config["WATCH_MAX_WAITERS"])
+        if not cls._watch_slots.acquire(blocking=False):
+            yield 0
+            return
+        try:
+            yield timeout
+        finally:
+            cls._watch_slots.release()
+
+    @classmethod
+    def watch_builds(cls, known_states, timeout):
+        """
+        Wait at most TIMEOUT seconds until some of the builds in KNOWN_STATES
+        (dict {build_id: state}) has a different state than the one known to
+        the caller, and return the list of such builds.  Empty list is
+        returned when nothing changed in time.  State changes are published
+        through Redis after commit (see publish_build_state_changes), so we
+        don't need to poll the database.  Only WATCH_MAX_WAITERS calls wait
+        at once, the others return immediately (the caller needs to sleep).
+        """
+        with cls._watch_slot(timeout) as wait_for:
+            return cls._watch_builds(known_states, wait_for)
+
+    @classmethod
+    def _watch_builds(cls, known_states, timeout):
+        build_ids = set(known_states)
+        if not build_ids:
+            return []
+        deadline = time.time() + timeout
+
+        if not timeout:
+            builds = cls.get_builds_by_ids(build_ids).all()
+            cls._check_watched_exist(build_ids, builds)
+            return [build for build in builds
+                    if build.state != known_states[build.id]]
+
+        pubsub = None
+        try:
+            # Subscribe before the first check, not to miss any change
+            pubsub = cls._get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(BUILD_STATE_CHANNEL)
+        except RedisError as err:
+            log.warning("Can't subscribe for build state changes: %s", err)
+            pubsub = None
+
+        try:
+            check_ids = build_ids
+            while True:
+                builds = cls.get_builds_by_ids(check_ids).all()
+                if check_ids is build_ids:
+                    cls._check_watched_exist(build_ids, builds)
+                changed = [build for build in builds
+                           if build.state != known_states[build.id]]
+                if changed or time.time() >= deadline:
+                    return changed
+                # Don't keep the transaction open while waiting, and
+                # forget the loaded objects
+                db.session.rollback()
+                check_ids = cls._wait_for_published(pubsub, build_ids, deadline)
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
     @classmethod
     def get_multiple(cls):
         return models.Build.query.order_by(models.Build.id.desc())
@@ -818,7 +1200,7 @@ class BuildsLogic(object):
         if after_build_id:
             old_batch = BatchesLogic.get_batch_or_create(after_build_id, user)
             batch = models.Batch()
-            batch.blocked_by = old_batch
+            BatchesLogic.set_blocked_by(batch, old_batch)
             db.session.add(batch)
 
         if always_create and batch is None:
@@ -1156,6 +1538,7 @@ class BuildsLogic(object):
                         finish(chroot, StatusEnum("skipped"))
 
             cls.process_update_callback(build)
+            cls.update_batch_state(build)
             db.session.add(build)
             return
 
@@ -1187,8 +1570,17 @@ class BuildsLogic(object):
                         ActionsLogic.send_build_module(build.copr, build.module)
 
         cls.process_update_callback(build)
+        cls.update_batch_state(build)
         db.session.add(build)
 
+    @classmethod
+    def update_batch_state(cls, build):
+        """
+        If the BUILD is finished, it might have finished its batch, too.
+        """
+        if build.batch and build.finished:
+            BatchesLogic.update_state(build.batch)
+
     @classmethod
     def process_update_callback(cls, build):
         parsed_git_url = helpers.get_parsed_git_url(build.copr.scm_repo_url)
@@ -1270,6 +1662,7 @@ class BuildsLogic(object):
 
         build.canceled = True
         cls.process_update_callback(build)
+        cls.update_batch_state(build)
 
 
     @classmethod
@@ -1308,7 +1701,10 @@ class BuildsLogic(object):
         if send_delete_action:
             ActionsLogic.send_delete_build(build)
 
+        batch = build.batch
         db.session.delete(build)
+        if batch:
+            cls._update_batches_after_delete([batch])
 
     @classmethod
     def delete_builds(cls, user, build_ids, send_delete_action=True):
@@ -1357,8 +1753,22 @@ class BuildsLogic(object):
         log.info("User '%s' removing builds: %s",
                  user.username, [x.id for x in to_delete])
 
+        batches = {build.batch for build in to_delete if build.batch}
         for build in to_delete:
             db.session.delete(build)
+        cls._update_batches_after_delete(batches)
+
+    @staticmethod
+    def _update_batches_after_delete(batches):
+        """
+        The deleted builds might have been the last unfinished builds of their
+        BATCHES, re-calculate the batch states.
+        """
+        if not batches:
+            return
+        db.session.flush()
+        for batch in sorted(batches, key=lambda batch: batch.id):
+            BatchesLogic.update_state(batch, allow_empty=True)
 
     @classmethod
     def mark_as_failed(cls, build_id):
@@ -1372,6 +1782,7 @@ class BuildsLogic(object):
         if build.source_status != StatusEnum("succeeded"):
             build.source_status = StatusEnum("failed")
         cls.process_update_callback(build)
+        cls.update_batch_state(build)
         return build
 
     @classmethod
@@ -4,6 +4,7 @@ import os
 import datetime
 import time
 import fnmatch
+import uuid
 import flask
 import sqlalchemy
 
@@ -42,6 +43,44 @@ def unpin_projects_on_delete(copr, deleted, oldvalue, event):
     PinnedCoprsLogic.delete_by_copr(copr)
 
 
+# Session.info key with the set of changed projects (see BuildConfigLogic)
+BUILD_CONFIG_CHANGES = "build_config_changes"
+
+
+@sqlalchemy.event.listens_for(db.session, "after_flush")
+def collect_build_config_changes(session, _flush_context):
+    """
+    Remember which projects had their build configuration changed in this
+    transaction, so we can invalidate the cached build configs after commit.
+    """
+    changes = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, models.Copr):
+            changes.add(obj.id)
+        elif isinstance(obj, (models.CoprChroot, models.CoprDir)):
+            changes.add(obj.copr_id)
+        elif isinstance(obj, models.MockChroot):
+            changes.add(BuildConfigLogic.ALL_PROJECTS)
+    if changes:
+        session.info.setdefault(BUILD_CONFIG_CHANGES, set()).update(changes)
+
+
+@sqlalchemy.event.listens_for(db.session, "after_commit")
+def invalidate_build_configs(session):
+    """ Invalidate the cached build configs of the changed projects """
+    changes = session.info.pop(BUILD_CONFIG_CHANGES, None)
+    if changes:
+        BuildConfigLogic.invalidate(changes)
+
+
+@sqlalchemy.event.listens_for(db.session, "after_rollback")
+def forget_build_config_changes(session):
+    """ Nothing changed """
+    session.info.pop(BUILD_CONFIG_CHANGES, None)
+
+
 class ComplexLogic(object):
     """
     Used for manipulation which affects multiply models
@@ -263,6 +302,53 @@ class ComplexLogic(object):
             return None
         return ComplexLogic.get_copr_by_owner(owner, copr)
 
+    @staticmethod
+    def get_coprs_by_repos(repo_urls):
+        """
+        The same as get_copr_by_repo(), but for a list of repo URLs, and all
+        the projects are queried at once.  Return a dict {repo_url: Copr}
+        of the existing projects.
+        """
+        wanted = {}
+        for repo_url in repo_urls:
+            copr_repo = copr_repo_fullname(repo_url)
+            if not copr_repo:
+                continue
+            try:
+                owner, name = copr_repo.split("/")
+            except ValueError:
+                # invalid format, e.g. multiple slashes in copr_repo
+                continue
+            if not owner or not name:
+                continue
+            wanted[(owner, name)] = repo_url
+
+        if not wanted:
+            return {}
+
+        conditions = []
+        for owner, name in wanted:
+            if owner[0] == "@":
+                conditions.append(sqlalchemy.and_(
+                    models.Group.name == owner[1:],
+                    models.Copr.name == name,
+                ))
+            else:
+                conditions.append(sqlalchemy.and_(
+                    models.User.username == owner,
+                    models.Copr.group_id.is_(None),
+                    models.Copr.name == name,
+                ))
+
+        query = (
+            CoprsLogic.get_all()
+            .outerjoin(models.Group)
+            .options(db.contains_eager(models.Copr.group))
+            .filter(sqlalchemy.or_(*conditions))
+        )
+        return {wanted[(copr.owner_name, copr.name)]: copr
+                for copr in query}
+
     @staticmethod
     def get_copr_dir(ownername, copr_dirname):
         """
@@ -585,9 +671,79 @@ class ProjectForking(object):
 
 
 class BuildConfigLogic(object):
+    """
+    The build configuration for the given CoprDir and chroot
+    """
+
+    # Pseudo-project ID, the cached configs of all projects depend on it
+    ALL_PROJECTS = "all"
+
+    # The cached build configs are invalidated when the (referenced) projects
+    # change, so this is just for not keeping the unused configs forever.
+    CACHE_TIMEOUT = 3600
+
+    @staticmethod
+    def _generation_key(copr_id):
+        return "build_config_generation_{}".format(copr_id)
+
+    @classmethod
+    def invalidate(cls, copr_ids):
+        """
+        Invalidate all the cached build configs depending on the given
+        projects (by changing their "generation").
+        """
+        for copr_id in copr_ids:
+            cache.set(cls._generation_key(copr_id), uuid.uuid4().hex,
+                      timeout=0)
+
+    @classmethod
+    def _generations(cls, copr_ids):
+        keys = [cls._generation_key(copr_id) for copr_id in copr_ids]
+        return dict(zip(copr_ids, cache.get_many(*keys)))
+
+    @staticmethod
+    def _cacheable():
+        """
+        We can not use (nor fill) the cache when this session has un-committed
+        changes, those would not be visible in the cached build config (or
+        they would be cached even if rolled back later).
+        """
+        session = db.session
+        return not (session.new or session.dirty or session.deleted
+                    or session.info.get(BUILD_CONFIG_CHANGES))
+
     @classmethod
     def generate_build_config(cls, coprdir, chroot_id):
-        """ Return dict with proper build config contents """
+        """
+        Return dict with proper build config contents.  The result is cached
+        (in Redis, so shared by all the frontend processes) till the project,
+        its chroots, or the projects referenced by copr:// repos are changed.
+        """
+        if not cls._cacheable():
+            return cls._generate_build_config(coprdir, chroot_id)[0]
+
+        key = "build_config_{}_{}".format(coprdir.id, chroot_id)
+        cached = cache.get(key)
+        if cached and cls._generations(list(cached["generations"])) \
+                == cached["generations"]:
+            return cached["config"]
+
+        # Read the generations _before_ the data, so the concurrent changes
+        # invalidate what we cache.  The referenced projects are known only
+        # after the config is generated, though.
+        generations = cls._generations([cls.ALL_PROJECTS, coprdir.copr_id])
+        config, copr_ids = cls._generate_build_config(coprdir, chroot_id)
+        generations.update(cls._generations(copr_ids))
+        cache.set(key, {"config": config, "generations": generations},
+                  timeout=cls.CACHE_TIMEOUT)
+        return config
+
+    @classmethod
+    def _generate_build_config(cls, coprdir, chroot_id):
+        """
+        Return the build config dict, and the list of IDs of the projects
+        referenced by copr:// repos.
+        """
         copr = coprdir.copr
         chroot = None
         for i in copr.active_copr_chroots:
@@ -595,7 +751,7 @@ class BuildConfigLogic(object):
                 chroot = i
                 break
         if not chroot:
-            return {}
+            return {}, []
 
         packages = "" if not chroot.buildroot_pkgs else chroot.buildroot_pkgs
 
@@ -631,8 +787,13 @@ class BuildConfigLogic(object):
         for repo in repos:
             repo["priority"] = repo_priority
 
-        repos.extend(cls.get_additional_repo_views(copr.repos_list, chroot_id))
-        repos.extend(cls.get_additional_repo_views(chroot.repos_list, chroot_id))
+        # resolve all the referenced projects at once
+        coprs = ComplexLogic.get_coprs_by_repos(
+            copr.repos_list + chroot.repos_list)
+        repos.extend(cls.get_additional_repo_views(copr.repos_list, chroot_id,
+                                                   coprs))
+        repos.extend(cls.get_additional_repo_views(chroot.repos_list, chroot_id,
+                                                   coprs))
 
         config_dict = {
             'project_id': copr.repo_id,
@@ -644,7 +805,7 @@ class BuildConfigLogic(object):
         }
         config_dict.update(chroot.isolation_setup)
         config_dict.update(chroot.bootstrap_setup)
-        return config_dict
+        return config_dict, sorted({c.id for c in coprs.values()})
 
     @classmethod
     def build_bootstrap_setup(cls, build_config, build):
@@ -676,7 +837,13 @@ class BuildConfigLogic(object):
         return isolation
 
     @classmethod
-    def get_additional_repo_views(cls, repos_list, chroot_id):
+    def get_additional_repo_views(cls, repos_list, chroot_id, coprs=None):
+        """
+        Transform the list of additional repo URLs into the list of repo
+        dicts.  The COPRS is the get_coprs_by_repos() output, if already known.
+        """
+        if coprs is None:
+            coprs = ComplexLogic.get_coprs_by_repos(repos_list)
         repos = []
         for repo in repos_list:
             params = parse_repo_params(repo)
@@ -686,16 +853,12 @@ class BuildConfigLogic(object):
                 "name": "Additional repo " + generate_repo_name(repo),
             }
 
-            # We ask get_copr_by_repo() here only to resolve the
-            # module_hotfixes attribute.  If the asked project doesn't exist, we
-            # still adjust the 'repos' variable -- the build will eventually
-            # fail on repo downloading, but at least the copr maintainer will be
-            # notified about the misconfiguration.  Better than just skip the
-            # repo.
-            try:
-                copr = ComplexLogic.get_copr_by_repo(repo)
-            except ObjectNotFound:
-                copr = None
+            # We resolve the projects here only to get the module_hotfixes
+            # attribute.  If the asked project doesn't exist, we still adjust
+            # the 'repos' variable -- the build will eventually fail on repo
+            # downloading, but at least the copr maintainer will be notified
+            # about the misconfiguration.  Better than just skip the repo.
+            copr = coprs.get(repo)
             if copr and copr.module_hotfixes:
                 params["module_hotfixes"] = True
 
@@ -10,6 +10,7 @@ from coprs import models
 from coprs import db
 from coprs import exceptions
 from coprs.logic import builds_logic
+from coprs.logic.batches_logic import BatchesLogic
 from coprs.logic.dist_git_logic import DistGitLogic
 from wtforms import ValidationError
 
@@ -210,11 +211,12 @@ class ModuleBuildFacade(object):
                 raise ValidationError(msg)
 
     def add_builds(self, rpms, module):
-        blocked_by_id = None
+        blocked_by = None
         for group in self.get_build_batches(rpms):
             batch = models.Batch()
             db.session.add(batch)
-            batch.blocked_by_id = blocked_by_id
+            if blocked_by is not None:
+                BatchesLogic.set_blocked_by(batch, blocked_by)
             for pkgname, rpm in group.items():
                 build = self.get_build(rpm, pkgname)
                 db.session.add(build)
@@ -223,7 +225,7 @@ class ModuleBuildFacade(object):
                 build.module_id = module.id
 
             # Every batch needs to by blocked by the previous one
-            blocked_by_id = batch.id
+            blocked_by = batch
 
     def get_build(self, rpm, pkgname):
         """
@@ -1,15 +1,34 @@
 from collections import defaultdict
 
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 
 from coprs import app
 from coprs import db
-from coprs.models import CounterStat
+from coprs.models import CounterStat, CounterStatFlush
 from coprs import helpers, models
 
+log = app.logger
+
+# Redis hashes {name: count} with the not yet flushed counter increments (one
+# hash per counter type), and the hashes being flushed to the database
+BUFFER_KEY = "copr:frontend:counter_stat::{}"
+FLUSHING_KEY = "copr:frontend:counter_stat_flushing::{}"
+
+# Every hash being flushed is marked by a unique ID (generated by the counter
+# key), the ID is stored in the database (CounterStatFlush) in the same
+# transaction as the increments so a hash is never applied twice
+FLUSH_ID_KEY = "copr:frontend:counter_stat_flush_id"
+FLUSH_ID_FIELD = "::flush_id"
+
 
 class CounterStatLogic(object):
+    # Maximum number of rows in one bulk_incr() upsert statement
+    BULK_CHUNK = 5000
+
+    _redis = None
 
     @classmethod
     def get(cls, name):
@@ -52,6 +71,172 @@ class CounterStatLogic(object):
             update({"counter": CounterStat.counter + count})
         db.session.commit()
 
+    @classmethod
+    def _get_redis(cls):
+        if cls._redis is None:
+            cls._redis = helpers.RedisConnectionProvider(
+                config=app.config).get_connection()
+        return cls._redis
+
+    @classmethod
+    def incr_buffered(cls, name, counter_type, count=1):
+        """
+        Increment the counter in the Redis buffer, the database is updated
+        later by flush_buffered() in batches.  Without Redis, fall back to
+        incr() (which commits).
+        """
+        try:
+            cls._get_redis().hincrby(BUFFER_KEY.format(counter_type), name,
+                                     count)
+        except RedisError as err:
+            log.warning("Can't buffer the %s counter: %s", name, err)
+            cls.incr(name, counter_type, count)
+
+    @classmethod
+    def get_buffered(cls, counter_type, names=None):
+        """
+        Return the not yet flushed increments of the COUNTER_TYPE counters,
+        as a dict {name: count}.  Only the NAMES counters are returned, if
+        specified.
+        """
+        if names is not None:
+            names = list(names)
+            if not names:
+                return {}
+
+        deltas = defaultdict(int)
+        keys = [BUFFER_KEY.format(counter_type),
+                FLUSHING_KEY.format(counter_type)]
+        try:
+            for key in keys:
+                if names is None:
+                    values = cls._get_redis().hgetall(key).items()
+                else:
+                    values = zip(names, cls._get_redis().hmget(key, names))
+                for name, count in values:
+                    if count is None:
+                        continue
+                    if isinstance(name, bytes):
+                        name = name.decode("utf-8")
+                    if name == FLUSH_ID_FIELD:
+                        continue
+                    deltas[name] += int(count)
+        except RedisError as err:
+            log.warning("Can't read the buffered counters: %s", err)
+            return {}
+        return dict(deltas)
+
+    @classmethod
+    def flush_buffered(cls):
+        """
+        Move the counter increments buffered in Redis to the database.  The
+        buffer is atomically renamed first, so the concurrent increments go to
+        a new buffer.  The renamed buffer is removed only after commit, a
+        failed flush is re-tried next time.  The renamed buffer gets a unique
+        flush ID which is committed together with the increments, so a re-try
+        after a crash between the commit and the removal doesn't apply the
+        increments twice.  Return the number of flushed counters.
+        """
+        redis = cls._get_redis()
+        flushed = 0
+        counter_types = set()
+        for pattern in [BUFFER_KEY, FLUSHING_KEY]:
+            prefix = pattern.format("")
+            for key in redis.scan_iter(match=prefix + "*"):
+                if isinstance(key, bytes):
+                    key = key.decode("utf-8")
+                counter_types.add(key[len(prefix):])
+
+        for counter_type in sorted(counter_types):
+            buffer_key = BUFFER_KEY.format(counter_type)
+            flushing_key = FLUSHING_KEY.format(counter_type)
+            if not redis.exists(flushing_key):
+                try:
+                    redis.rename(buffer_key, flushing_key)
+                except ResponseError:
+                    continue  # nothing buffered
+
+            if not redis.hexists(flushing_key, FLUSH_ID_FIELD):
+                redis.hsetnx(flushing_key, FLUSH_ID_FIELD,
+                             redis.incr(FLUSH_ID_KEY))
+
+            flush_id = None
+            hits = []
+            for name, count in redis.hgetall(flushing_key).items():
+                name = name.decode("utf-8")
+                if name == FLUSH_ID_FIELD:
+                    flush_id = int(count)
+                    continue
+                hits.append((name, counter_type, int(count)))
+
+            if cls._mark_flushed(counter_type, flush_id):
+                cls.bulk_incr(hits)
+                flushed += len(hits)
+            else:
+                log.warning("The %s counters were already flushed",
+                            counter_type)
+            db.session.commit()
+            redis.delete(flushing_key)
+        return flushed
+
+    @classmethod
+    def _mark_flushed(cls, counter_type, flush_id):
+        """
+        Record FLUSH_ID as the last flushed batch of the COUNTER_TYPE
+        counters, in the current transaction.  Return False if the batch has
+        already been recorded (and its increments applied) before.  The upsert
+        locks the row, so the concurrent flushes of the same batch wait for
+        each other, and only the first one applies it.
+        """
+        table = CounterStatFlush.__table__
+        stmt = cls._insert()(table).values(counter_type=counter_type,
+                                           flush_id=flush_id)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.counter_type],
+            set_={"flush_id": stmt.excluded.flush_id},
+            where=table.c.flush_id != stmt.excluded.flush_id,
+        )
+        return db.session.execute(stmt).rowcount > 0
+
+    @staticmethod
+    def _insert():
+        """
+        The dialect specific insert() construct, with ON CONFLICT support
+        """
+        if db.session.get_bind().dialect.name == "postgresql":
+            return postgresql.insert
+        return sqlite.insert
+
+    @classmethod
+    def bulk_incr(cls, hits):
+        """
+        Increment many counters at once, HITS is an iterable of
+        (name, counter_type, count) tuples.  The counters are created or
+        incremented by set-based upserts (INSERT ... ON CONFLICT DO UPDATE),
+        in the current transaction (the caller commits).
+        """
+        counts = {}
+        for name, counter_type, count in hits:
+            _, previous = counts.get(name, (None, 0))
+            counts[name] = (counter_type, previous + count)
+        if not counts:
+            return
+
+        insert = cls._insert()
+
+        # Sorted, so the concurrent transactions lock the rows in the same
+        # order (no deadlocks)
+        rows = [{"name": name, "counter_type": counter_type, "counter": count}
+                for name, (counter_type, count) in sorted(counts.items())]
+        table = CounterStat.__table__
+        for start in range(0, len(rows), cls.BULK_CHUNK):
+            stmt = insert(table).values(rows[start:start + cls.BULK_CHUNK])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.name],
+                set_={"counter": table.c.counter + stmt.excluded.counter},
+            )
+            db.session.execute(stmt)
+
     @classmethod
     def get_copr_repo_dl_stat(cls, copr):
         # chroot -> stat_name
@@ -73,6 +258,11 @@ class CounterStatLogic(object):
         for stat in stats:
             repo_dl_stats[chroot_by_stat_name[stat.name]] = stat.counter
 
+        buffered = cls.get_buffered(helpers.CounterStatType.REPO_DL,
+                                    chroot_by_stat_name.keys())
+        for name, count in buffered.items():
+            repo_dl_stats[chroot_by_stat_name[name]] += count
+
         return repo_dl_stats
 
     @classmethod
@@ -93,12 +283,28 @@ class CounterStatLogic(object):
     def get_popular(cls, counter_type, limit=10):
         """
         Return CounterStat results with the highest counter for a given
-        CounterStatType.
+        CounterStatType.  The not yet flushed increments are included, in
+        such case the results are detached CounterStat objects.
         """
-        return (CounterStat.query
-                .filter(CounterStat.counter_type == counter_type)
-                .order_by(models.CounterStat.counter.desc())
-                .limit(limit))
+        popular = (CounterStat.query
+                   .filter(CounterStat.counter_type == counter_type)
+                   .order_by(models.CounterStat.counter.desc())
+                   .limit(limit)).all()
+        buffered = cls.get_buffered(counter_type)
+        if not buffered:
+            return popular
+
+        # The buffered counters may get to the top
+        counters = {stat.name: stat.counter for stat in popular}
+        for stat in cls.get_multiply_same_type(counter_type, list(buffered)):
+            counters[stat.name] = stat.counter
+        for name, count in buffered.items():
+            counters[name] = counters.get(name, 0) + count
+
+        top = sorted(counters.items(), key=lambda x: x[1], reverse=True)
+        return [CounterStat(name=name, counter_type=counter_type,
+                            counter=counter)
+                for name, counter in top[:limit]]
 
 
 def handle_be_stat_message(stat_data):
@@ -108,8 +314,8 @@ def handle_be_stat_message(stat_data):
     """
     app.logger.debug('Got stat data: {}'.format(stat_data))
 
-    hits = stat_data['hits']
-    for key_str, count in hits.items():
+    hits = []
+    for key_str, count in stat_data['hits'].items():
         stat_type, key_string = key_str.split("|", 1)
 
         # FIXME the keys from backend doesn't match CounterStatType exactly
@@ -126,4 +332,6 @@ def handle_be_stat_message(stat_data):
             stat_type=stat_type,
             key_string=key_string,
         )
-        CounterStatLogic.incr(stat_name, stat_type, count)
+        hits.append((stat_name, stat_type, count))
+
+    CounterStatLogic.bulk_incr(hits)
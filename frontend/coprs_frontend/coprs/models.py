@@ -1134,6 +1134,11 @@ class Build(db.Model, helpers.Serializer):
     # the info that the build was resubmitted
     resubmitted_from_id = db.Column(db.Integer)
 
+    # DistGit machine which leased this build for importing, and the time
+    # (in seconds since epoch) when the lease expires
+    import_lease_holder = db.Column(db.Text)
+    import_lease_expires = db.Column(db.Integer)
+
     __table_args__ = (
         db.Index('build_canceled', "canceled"),
         db.Index('build_order', "is_background", "id"),
@@ -1326,14 +1331,28 @@ class Build(db.Model, helpers.Serializer):
         """
         Return build status.
         """
-        if self.canceled:
+        return self.calculate_status(self.id, self.canceled,
+                                     self.source_status, self.chroot_states)
+
+    @staticmethod
+    def calculate_status(build_id, canceled, source_status, chroot_states):
+        """
+        Calculate the build status from the Build columns, and the list of its
+        BuildChroot statuses.  Shared with BuildsLogic.get_build_states() that
+        doesn't load the Build objects.
+        """
+        if canceled:
             return StatusEnum("canceled")
 
+        source_state = "unknown"
+        if source_status is not None:
+            source_state = StatusEnum(source_status)
+
         use_src_states = ["starting", "pending", "running", "importing", "failed"]
-        if self.source_state in use_src_states:
-            return self.source_status
+        if source_state in use_src_states:
+            return source_status
 
-        if not self.chroot_states:
+        if not chroot_states:
             # There were some builds in DB which had source_status equal
             # to 'succeeded', while they had no build_chroots created.
             # The original source of this inconsistency isn't known
@@ -1342,20 +1361,20 @@ class Build(db.Model, helpers.Serializer):
             # Anyways, return something meaningful here so we can debug
             # properly if such situation happens.
             app.logger.error("Build %s has source_state %s, but "
-                             "no build_chroots", self.id, self.source_state)
+                             "no build_chroots", build_id, source_state)
             return StatusEnum("waiting")
 
         for state in ["running", "starting", "pending", "failed", "succeeded", "skipped", "forked"]:
-            if StatusEnum(state) in self.chroot_states:
+            if StatusEnum(state) in chroot_states:
                 return StatusEnum(state)
 
-        if StatusEnum("waiting") in self.chroot_states:
+        if StatusEnum("waiting") in chroot_states:
             # We should atomically flip
             # a) build.source_status: "importing" -> "succeeded" and
             # b) biuld_chroot.status: "waiting" -> "pending"
             # so at this point nothing really should be in "waiting" state.
             app.logger.error("Build chroots pending, even though build %s"
-                             " has succeeded source_status", self.id)
+                             " has succeeded source_status", build_id)
             return StatusEnum("pending")
 
         return None
@@ -2386,64 +2405,29 @@ class Batch(db.Model):
     blocked_by_id = db.Column(db.Integer, db.ForeignKey("batch.id"), nullable=True)
     blocked_by = db.relationship("Batch", remote_side=[id])
 
-    _is_finished = None
-
-    @property
-    def finished_slow(self):
-        """
-        Check if this batch is finished by iterating through all the contained
-        builds.
-        """
-        cache_timeout = 3600
-        redis_cache_id = "batch_finished_{}".format(self.id)
-
-        if app.cache.get(redis_cache_id):
-            # prolong the cache after the access
-            app.cache.set(redis_cache_id, True, timeout=cache_timeout)
-            return True
-
-        if not self.builds:
-            # no builds assigned to this batch (yet)
-            return False
-
-        # Some Batches are rather large;  use the all+map pair here, not a list
-        # comprehension, to escape the loop as soon as possible on the first
-        # miss (comprehension would go through all builds unnecessarily)
-        if all(map(lambda x: x.finished, self.builds)):
-            # nothing can switch finished batch to non-finished state, cache it
-            app.cache.set(redis_cache_id, True, cache_timeout)
-            return True
-        return False
+    # Materialized batch state, kept up-to-date by BatchesLogic.update_state()
+    # when builds in this batch finish.  This allows us to filter out the
+    # blocked builds in SQL, without walking all the builds in the batch.
+    is_finished = db.Column(db.Boolean, default=False, nullable=False,
+                            server_default="0")
+    is_blocked = db.Column(db.Boolean, default=False, nullable=False,
+                           server_default="0", index=True)
 
     @property
     def finished(self):
         """
-        Same as self.finished_slow, but doesn't require re-calculation for all
-        the builds, buildchroots, states, etc.  Or checking Redis caches.
+        All the builds in this batch are finished (nothing can switch finished
+        batch to non-finished state).
         """
-        if self._is_finished is None:
-            self._is_finished = self.finished_slow
-        return self._is_finished
+        return self.is_finished
 
     @property
     def blocked(self):
         """
-        Batch is blocked when the parent batch is not yet finished.
+        Batch is blocked when the parent batch (or any other batch up the
+        chain) is not yet finished.
         """
-        if not self.blocked_by_id:
-            return False
-
-        # a) we are blocked if parent is blocked, or ...
-        if self.blocked_by.blocked:
-            # Optimization, checking for "blocked" is often cheaper than
-            # checking for "finished" because batches tend to contain too many
-            # builds (and transitively build_chroots).  IOW, since in each batch
-            # tree is only one batch being processed - it doesn't make sense to
-            # re-calculate 'finished' state for all of them.
-            return True
-
-        # b) ... when parent is not yet finished
-        return not self.blocked_by.finished
+        return bool(self.blocked_by_id) and self.is_blocked
 
     @property
     def state(self):
@@ -2629,6 +2613,15 @@ class DistGitInstance(db.Model):
             ))
 
 
+class CounterStatFlush(db.Model):
+    """
+    The ID of the last buffered CounterStat increments batch moved from Redis
+    to the database, see CounterStatLogic.flush_buffered().
+    """
+    counter_type = db.Column(db.String(30), primary_key=True)
+    flush_id = db.Column(db.Integer, nullable=False)
+
+
 class CancelRequest(db.Model):
     """ Requests for backend to cancel some background job """
     # for now we only cancel builds, so we have here task_id (either <build_id>
@@ -1,3 +1,5 @@
+import base64
+import binascii
 import json
 import flask
 import wtforms
@@ -101,6 +103,7 @@ class PaginationForm(wtforms.Form):
     order = wtforms.StringField("Order by", validators=[wtforms.validators.Optional()])
     order_type = wtforms.SelectField("Order type", validators=[wtforms.validators.Optional()],
                                      choices=[("ASC", "ASC"), ("DESC", "DESC")], default="ASC")
+    cursor = wtforms.StringField("Cursor", validators=[wtforms.validators.Optional()])
 
 
 def get_copr(ownername=None, projectname=None):
@@ -111,11 +114,20 @@ def get_copr(ownername=None, projectname=None):
 
 
 class Paginator(object):
+    """
+    Paginate the query either by LIMIT/OFFSET, or by cursor (keyset
+    pagination).  The cursor identifies the last object of the previous page,
+    so the next page can be selected by an indexed WHERE condition instead of
+    skipping OFFSET rows.  This is only possible for the CURSOR_ORDERS, the
+    object ID is used as a tie-breaker for the non-unique columns.
+    """
     LIMIT = None
     OFFSET = 0
     ORDER = "id"
+    CURSOR_ORDERS = ["id", "name"]
 
-    def __init__(self, query, model, limit=None, offset=None, order=None, order_type=None, **kwargs):
+    def __init__(self, query, model, limit=None, offset=None, order=None, order_type=None,
+                 cursor=None, **kwargs):
         self.query = query
         self.model = model
         self.limit = limit or self.LIMIT
@@ -128,15 +140,29 @@ class Paginator(object):
                 self.order_type = 'DESC'
             if self.order == 'name':
                 self.order_type = 'ASC'
+        self.cursor = cursor or None
+        self.items = None
+        self._after = self._decode_cursor(self.cursor) if self.cursor else None
 
-    def get(self):
-        return self.paginate_query(self.query)
-
-    def paginate_query(self, query):
-        """
-        Return `self.query` with all pagination parameters (limit, offset,
-        order) but do not run it.
-        """
+    def _decode_cursor(self, cursor):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            order, order_type, value, pk = data
+        except (ValueError, TypeError, binascii.Error):
+            raise BadRequest("Invalid pagination cursor")
+
+        if [order, order_type] != [self.order, self.order_type]:
+            raise BadRequest(
+                "The pagination cursor doesn't match order={}, order_type={}"
+                .format(self.order, self.order_type))
+        return value, pk
+
+    def _encode_cursor(self, obj):
+        data = [self.order, self.order_type, getattr(obj, self.order), obj.id]
+        return base64.urlsafe_b64encode(
+            json.dumps(data).encode("utf-8")).decode("ascii")
+
+    def _order_attr(self):
         order_attr = getattr(self.model, self.order, None)
         if not order_attr:
             msg = "Cannot order by {}, {} doesn't have such property".format(
@@ -147,6 +173,35 @@ class Paginator(object):
         # a real database column
         if not isinstance(order_attr, InstrumentedAttribute):
             raise CoprHttpException("Cannot order by {}".format(self.order))
+        return order_attr
+
+    def _cursor_filter(self, order_attr):
+        value, pk = self._after
+        pk_attr = self.model.id
+        if self.order_type == "DESC":
+            if self.order == "id":
+                return pk_attr < pk
+            return sqlalchemy.or_(order_attr < value,
+                                  sqlalchemy.and_(order_attr == value, pk_attr < pk))
+        if self.order == "id":
+            return pk_attr > pk
+        return sqlalchemy.or_(order_attr > value,
+                              sqlalchemy.and_(order_attr == value, pk_attr > pk))
+
+    def get(self):
+        self.items = self.paginate_query(self.query).all()
+        return self.items
+
+    def paginate_query(self, query):
+        """
+        Return `self.query` with all pagination parameters (limit, offset or
+        cursor, order) but do not run it.
+        """
+        order_attr = self._order_attr()
+
+        if self.cursor and self.order not in self.CURSOR_ORDERS:
+            raise BadRequest("Cannot paginate by cursor when ordering by {}"
+                             .format(self.order))
 
         order_fun = (lambda x: x)
         if self.order_type == 'ASC':
@@ -154,13 +209,46 @@ class Paginator(object):
         elif self.order_type == 'DESC':
             order_fun = sqlalchemy.desc
 
-        return (query.order_by(order_fun(order_attr))
-                .limit(self.limit)
+        # The pagination order replaces the query order (if any), the cursor
+        # needs to know the real order
+        query = query.order_by(None).order_by(order_fun(order_attr))
+        if self.order != "id":
+            # make the order deterministic, for both offset and cursor
+            query = query.order_by(order_fun(self.model.id))
+
+        if self.cursor:
+            return query.filter(self._cursor_filter(order_attr)).limit(self.limit)
+
+        return (query.limit(self.limit)
                 .offset(self.offset))
 
+    def sort_key(self, obj):
+        """ Key for sorting the objects in Python, in the pagination order """
+        return getattr(obj, self.order), obj.id
+
+    @property
+    def next_cursor(self):
+        """
+        Cursor pointing after the last object on this page, None if there's no
+        next page
+        """
+        if not self.items or not self.limit or len(self.items) < self.limit:
+            return None
+        if self.order not in self.CURSOR_ORDERS:
+            return None
+        # The items are not necessarily sorted (see SubqueryPaginator)
+        if self.order_type == "DESC":
+            last = min(self.items, key=self.sort_key)
+        else:
+            last = max(self.items, key=self.sort_key)
+        return self._encode_cursor(last)
+
     @property
     def meta(self):
-        return {k: getattr(self, k) for k in ["limit", "offset", "order", "order_type"]}
+        meta = {k: getattr(self, k) for k in ["limit", "offset", "order", "order_type",
+                                              "cursor"]}
+        meta["next_cursor"] = self.next_cursor
+        return meta
 
     def map(self, fun):
         return [fun(x) for x in self.get()]
@@ -174,7 +262,8 @@ class SubqueryPaginator(Paginator):
     Selecting rows with large offsets (400k+) is slower (~10 times) than
     offset=0. There is not many options to get around it. To mitigate the
     slowdown at least a little (~10%), we can filter, offset, and limit within
-    a subquery and then base the full-query on the subquery results.
+    a subquery and then base the full-query on the subquery results.  Use the
+    cursor pagination to avoid the offsets completely.
     """
     def __init__(self, query, subquery, *args, **kwargs):
         super().__init__(query, *args, **kwargs)
@@ -184,7 +273,8 @@ class SubqueryPaginator(Paginator):
     def get(self):
         subquery = self.paginate_query(self.subquery).subquery()
         query = self.query.filter(self.pk.in_(subquery))
-        return query.all()
+        self.items = query.all()
+        return self.items
 
 
 class ListPaginator(Paginator):
@@ -207,13 +297,23 @@ class ListPaginator(Paginator):
             raise CoprHttpException(msg)
 
         if self.order:
-            objects.sort(key=lambda x: getattr(x, self.order), reverse=reverse)
+            objects.sort(key=self.sort_key, reverse=reverse)
+
+        offset = self.offset
+        if self.cursor:
+            offset = 0
+            after = tuple(self._after)
+            if reverse:
+                objects = [x for x in objects if self.sort_key(x) < after]
+            else:
+                objects = [x for x in objects if self.sort_key(x) > after]
 
         limit = None
         if self.limit:
-            limit = self.offset + self.limit
+            limit = offset + self.limit
 
-        return objects[self.offset : limit]
+        self.items = objects[offset : limit]
+        return self.items
 
 
 def set_defaults(formdata, form_class):
@@ -3,6 +3,7 @@
 # pylint: disable=missing-class-docstring
 
 import os
+import json
 import flask
 from sqlalchemy.orm import joinedload
 
@@ -18,7 +19,8 @@ from coprs.views.apiv3_ns import api, rename_fields_helper, deprecated_route_met
 from coprs.views.apiv3_ns.schema.schemas import build_model, pagination_build_model, source_chroot_model, \
     source_build_config_model, list_build_params, create_build_url_input_model, create_build_upload_input_model, \
     create_build_scm_input_model, create_build_distgit_input_model, create_build_pypi_input_model, \
-    create_build_rubygems_input_model, create_build_custom_input_model, delete_builds_input_model, list_build_model
+    create_build_rubygems_input_model, create_build_custom_input_model, delete_builds_input_model, list_build_model, \
+    watch_builds_input_model, build_states_input_model
 from coprs.views.apiv3_ns.schema.docs import get_build_docs
 from coprs.logic.complex_logic import ComplexLogic
 from coprs.logic.builds_logic import BuildsLogic
@@ -161,6 +163,10 @@ class ListBuild(Resource):
         paginator_limit = None if status else kwargs["limit"]
         del kwargs["limit"]
 
+        # The newest builds first, unless requested otherwise
+        if "order_type" not in flask.request.args:
+            kwargs["order_type"] = "DESC"
+
         # Loading relationships straight away makes running `to_dict` somewhat
         # faster, which adds up over time, and  brings a significant speedup for
         # large projects
@@ -177,13 +183,84 @@ class ListBuild(Resource):
 
         paginator = SubqueryPaginator(query, subquery, models.Build, limit=paginator_limit, **kwargs)
 
-        builds = paginator.map(to_dict)
+        builds = paginator.get()
 
         if status:
-            builds = [b for b in builds if b["state"] == status][:limit]
+            # Take the first `limit` builds in the pagination order, so the
+            # next_cursor continues right after them
+            builds = sorted((b for b in builds if b.state == status),
+                            key=paginator.sort_key,
+                            reverse=paginator.order_type == "DESC")[:limit]
             paginator.limit = limit
+            paginator.items = builds
+
+        return {"items": [to_dict(b) for b in builds], "meta": paginator.meta}
 
-        return {"items": builds, "meta": paginator.meta}
+
+@apiv3_builds_ns.route("/watch")
+class WatchBuilds(Resource):
+    @apiv3_builds_ns.expect(watch_builds_input_model)
+    @apiv3_builds_ns.marshal_with(pagination_build_model)
+    def post(self):
+        """
+        Watch builds
+        Wait (at most `timeout` seconds) until some of the given builds changes
+        its state from the one known to the client, and return the changed
+        builds.  An empty list is returned if nothing changed in time.  Use
+        `timeout=0` to get the builds with unknown (or changed) state
+        immediately.  This replaces periodic polling of each build.  The
+        number of waiting requests is limited (WATCH_MAX_WAITERS), so the
+        request may return sooner; the client should sleep before the next
+        request then.
+        """
+        data = flask.request.json or {}
+        try:
+            known_states = {int(build["id"]): build.get("state")
+                            for build in data["builds"]}
+            timeout = int(data.get("timeout", 0))
+        except (KeyError, TypeError, ValueError, AttributeError) as ex:
+            raise BadRequest("Invalid list of builds to watch") from ex
+
+        if len(known_states) > BuildsLogic.WATCH_MAX_BUILDS:
+            raise BadRequest("At most {0} builds can be watched at once"
+                             .format(BuildsLogic.WATCH_MAX_BUILDS))
+        timeout = max(0, min(timeout, BuildsLogic.WATCH_MAX_TIMEOUT))
+
+        builds = BuildsLogic.watch_builds(known_states, timeout)
+        return {"items": [to_dict(build) for build in builds], "meta": {}}
+
+
+@apiv3_builds_ns.route("/states")
+class BuildStates(Resource):
+    @apiv3_builds_ns.expect(build_states_input_model)
+    def post(self):
+        """
+        Get states of many builds
+        Get the state of each given build (and the states of its chroots) in
+        one request.  The response is streamed, as `{"items": [{"id": 1,
+        "state": "running", "chroots": {"fedora-rawhide-x86_64": "running"}},
+        ...], "meta": {}}`.  Non-existing builds are omitted.
+        """
+        data = flask.request.json or {}
+        try:
+            build_ids = sorted({int(build_id) for build_id in data["builds"]})
+        except (KeyError, TypeError, ValueError) as ex:
+            raise BadRequest("Invalid list of build IDs") from ex
+
+        if len(build_ids) > BuildsLogic.STATES_MAX_BUILDS:
+            raise BadRequest("At most {0} builds can be queried at once"
+                             .format(BuildsLogic.STATES_MAX_BUILDS))
+
+        def _generate():
+            yield '{"items": ['
+            separator = ""
+            for record in BuildsLogic.get_build_states(build_ids):
+                yield separator + json.dumps(record)
+                separator = ","
+            yield '], "meta": {}}'
+
+        return flask.Response(flask.stream_with_context(_generate()),
+                              mimetype="application/json")
 
 
 @apiv3_builds_ns.route("/source-chroot/<int:build_id>")
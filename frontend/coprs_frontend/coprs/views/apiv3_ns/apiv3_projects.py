@@ -173,6 +173,9 @@ class ProjectSearch(Resource):
         Get list of projects
         Get details for multiple Copr projects according to search query.
         """
+        # The newest projects first, unless requested otherwise
+        if "order_type" not in flask.request.args:
+            kwargs["order_type"] = "DESC"
         try:
             search_query = CoprsLogic.get_multiple_fulltext(query)
             paginator = Paginator(search_query, models.Copr, **kwargs)
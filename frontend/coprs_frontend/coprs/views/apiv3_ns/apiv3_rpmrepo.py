@@ -151,5 +151,6 @@ class RpmRepo(Resource):
             copr_dir=copr.main_dir,
             name_release=name_release,
         )
-        CounterStatLogic.incr(name=name, counter_type=CounterStatType.REPO_DL)
+        CounterStatLogic.incr_buffered(name=name,
+                                       counter_type=CounterStatType.REPO_DL)
         return get_project_rpmrepo_metadata(copr)
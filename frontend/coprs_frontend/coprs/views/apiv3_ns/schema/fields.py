@@ -227,6 +227,21 @@ order_type = String(
     example="DESC",
 )
 
+cursor = String(
+    description=(
+        "Continue after the last object of the previous page, the value "
+        "is taken from the next_cursor field of the previous page meta. "
+        "Offset is ignored if cursor is specified."
+    ),
+)
+
+next_cursor = String(
+    description=(
+        "Cursor for the next page, or null if there is no next page (or "
+        "the objects can not be paginated by cursor)"
+    ),
+)
+
 
 build_enable_net = Boolean(
     description="Enable networking for the builds",
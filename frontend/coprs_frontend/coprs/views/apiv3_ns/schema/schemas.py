@@ -161,9 +161,15 @@ class PaginationMeta(ParamsSchema):
     offset: Integer = fields.offset
     order: String = fields.order
     order_type: String = fields.order_type
+    cursor: String = fields.cursor
 
 
-_pagination_meta_model = PaginationMeta.get_cls().model()
+@dataclass
+class PaginationMetaSchema(PaginationMeta):
+    next_cursor: String = fields.next_cursor
+
+
+_pagination_meta_model = PaginationMetaSchema.get_cls().model()
 
 
 @dataclass
@@ -802,6 +808,35 @@ class DeleteBuilds(InputSchema):
     builds: List = List(Integer, description="List of build ids to delete")
 
 
+@dataclass
+class WatchedBuild(InputSchema):
+    id: Integer = fields.id_field
+    state: String = String(
+        description="The last build state known to the client (null if unknown)",
+        example="running",
+    )
+
+
+_watched_build_model = WatchedBuild.get_cls().model()
+
+
+@dataclass
+class WatchBuilds(InputSchema):
+    builds: List = List(Nested(_watched_build_model),
+                        description="List of builds to watch")
+    timeout: Integer = Integer(
+        description=("Maximum number of seconds to wait for a state change, "
+                     "0 to return immediately"),
+        example=30,
+    )
+
+
+@dataclass
+class BuildStates(InputSchema):
+    builds: List = List(Integer, description="List of build IDs",
+                        example=[1, 2, 3])
+
+
 
 # OUTPUT MODELS
 project_chroot_model = ProjectChroot.get_cls().model()
@@ -851,6 +886,8 @@ create_build_pypi_input_model = CreateBuildPyPI.get_cls().input_model()
 create_build_rubygems_input_model = CreateBuildRubyGems.get_cls().input_model()
 create_build_custom_input_model = CreateBuildCustom.get_cls().input_model()
 delete_builds_input_model = DeleteBuilds.get_cls().input_model()
+watch_builds_input_model = WatchBuilds.get_cls().input_model()
+build_states_input_model = BuildStates.get_cls().input_model()
 
 
 # PARAMETER SCHEMAS
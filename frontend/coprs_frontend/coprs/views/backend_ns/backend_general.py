@@ -1,3 +1,5 @@
+import uuid
+
 import flask
 from copr_common.enums import StatusEnum, ActionTypeEnum, StorageEnum
 from coprs import db, app
@@ -16,6 +18,15 @@ from coprs.helpers import streamed_json
 from coprs.views import misc
 from coprs.views.backend_ns import backend_ns
 
+# Cache key (and expiration in seconds) for the last /pending-jobs/delta/
+# snapshot sent to Backend.
+PENDING_JOBS_SNAPSHOT_KEY = "pending_jobs_snapshot"
+PENDING_JOBS_SNAPSHOT_TIMEOUT = 3600
+
+# Maximum number of task IDs in one /get-build-tasks/ request, Backend asks
+# for at most RPMBuildWorkerManager.start_batch_size tasks at once.
+MAX_BUILD_TASKS = 100
+
 
 @backend_ns.after_request
 def send_frontend_version(response):
@@ -25,7 +36,7 @@ def send_frontend_version(response):
     setup the version according to our needs.
     For the backend counterpart, see the `MIN_FE_BE_API` constant.
     """
-    response.headers['Copr-FE-BE-API-Version'] = '6'
+    response.headers['Copr-FE-BE-API-Version'] = '7'
     return response
 
 
@@ -42,6 +53,36 @@ def dist_git_importing_queue():
     return streamed_json(_stream())
 
 
+@backend_ns.route("/importing/lease/", methods=["POST"])
+@misc.backend_authenticated
+def dist_git_importing_lease():
+    """
+    Lease (at most) "limit" builds from the importing queue to the "holder"
+    DistGit machine for "expire" seconds, and return their import records.
+    Unlike the /importing/ route, DistGit doesn't need to download the whole
+    queue to pick a few tasks.  Calling this repeatedly prolongs the lease of
+    builds that are still being imported by the same holder.  The optional
+    "owner_limit" caps the number of leased builds per project owner.
+    """
+    data = flask.request.json or {}
+    try:
+        holder = str(data["holder"])
+        limit = int(data.get("limit", 1))
+        expire = int(data.get("expire", 600))
+        owner_limit = data.get("owner_limit")
+        if owner_limit is not None:
+            owner_limit = int(owner_limit)
+    except (KeyError, TypeError, ValueError):
+        jsonout = flask.jsonify({"msg": "Expected holder, limit and expire"})
+        jsonout.status_code = 400
+        return jsonout
+
+    builds = BuildsLogic.lease_importing_builds(holder, limit, expire,
+                                                owner_limit)
+    db.session.commit()
+    return flask.jsonify([get_import_record(build) for build in builds])
+
+
 @backend_ns.route("/get-import-task/<build_id>")
 def get_import_task(build_id):
     """
@@ -111,6 +152,9 @@ def dist_git_upload_completed():
         build.backend_enqueue_buildchroots()
 
     build.source_status = final_source_status
+    build.import_lease_holder = None
+    build.import_lease_expires = None
+    BuildsLogic.update_batch_state(build)
     db.session.add(build)
     db.session.commit()
 
@@ -278,12 +322,14 @@ def build_task_canceled(task_id):
             try:
                 build_chroot = BuildsLogic.get_build_task(task_id)
                 build_chroot.status = StatusEnum("canceled")
+                BuildsLogic.update_batch_state(build_chroot.build)
             except ObjectNotFound:
                 pass
         else:
             build = models.Build.query.filter_by(id=task_id).first()
             if build:
                 build.source_status = StatusEnum("canceled")
+                BuildsLogic.update_batch_state(build)
     db.session.commit()
     return flask.jsonify("success")
 
@@ -330,40 +376,68 @@ def pending_action_count():
     return flask.jsonify(actions_logic.ActionsLogic.get_waiting().count())
 
 
-@backend_ns.route("/pending-jobs/")
-def pending_jobs():
+def _pending_job_records():
     """
-    Return the job queue.
+    Generate the (for_backend) records of all the pending build tasks, both
+    SRPM and RPM ones, which are not blocked by any batch (the blocked ones
+    are filtered out by the queries).
     """
+    args = {"data_type": "for_backend"}
 
-    # This code is really expensive, and takes a long time when there is a large
-    # build queue.  We want to avoid repeated reload of models.Batch data, and
-    # for that we need to have it strongly referenced.
-    cache = set()
+    app.logger.info("Generating SRPM builds")
+    for build in BuildsLogic.get_pending_srpm_build_tasks(**args):
+        record = get_srpm_build_record(build, for_backend=True)
+        yield record
 
-    def build_ready(build):
-        """ Is the build blocked? """
-        cache.add(build.batch)
-        return not build.blocked
+    app.logger.info("Generating RPM builds")
+    for build_chroot in BuildsLogic.get_pending_build_tasks(**args):
+        record = get_build_record(build_chroot, for_backend=True)
+        yield record
 
-    def _stream():
-        args = {"data_type": "for_backend"}
 
-        app.logger.info("Generating SRPM builds")
-        for build in BuildsLogic.get_pending_srpm_build_tasks(**args):
-            if not build_ready(build):
-                continue
-            record = get_srpm_build_record(build, for_backend=True)
-            yield record
+@backend_ns.route("/pending-jobs/")
+def pending_jobs():
+    """
+    Return the job queue.
+    """
+    return streamed_json(_pending_job_records())
 
-        app.logger.info("Generating RPM builds")
-        for build_chroot in BuildsLogic.get_pending_build_tasks(**args):
-            if not build_ready(build_chroot.build):
-                continue
-            record = get_build_record(build_chroot, for_backend=True)
-            yield record
 
-    return streamed_json(_stream())
+@backend_ns.route("/pending-jobs/delta/")
+@backend_ns.route("/pending-jobs/delta/<cursor>/")
+def pending_jobs_delta(cursor=None):
+    """
+    Return only the changes in the job queue since the moment the ``cursor``
+    was generated.  The last sent queue snapshot is kept in cache, so if the
+    ``cursor`` doesn't match (Backend restarted, snapshot expired, etc.) we
+    send the full queue and set ``full`` to True.  The ``added`` list contains
+    both new and changed tasks, ``removed`` is a list of task IDs.
+    """
+    tasks = {record["task_id"]: record for record in _pending_job_records()}
+
+    snapshot = app.cache.get(PENDING_JOBS_SNAPSHOT_KEY)
+    new_cursor = uuid.uuid4().hex
+    app.cache.set(PENDING_JOBS_SNAPSHOT_KEY,
+                  {"cursor": new_cursor, "tasks": tasks},
+                  timeout=PENDING_JOBS_SNAPSHOT_TIMEOUT)
+
+    if not cursor or not snapshot or snapshot["cursor"] != cursor:
+        return flask.jsonify({
+            "cursor": new_cursor,
+            "full": True,
+            "added": list(tasks.values()),
+            "removed": [],
+        })
+
+    old_tasks = snapshot["tasks"]
+    return flask.jsonify({
+        "cursor": new_cursor,
+        "full": False,
+        "added": [record for task_id, record in tasks.items()
+                  if old_tasks.get(task_id) != record],
+        "removed": [task_id for task_id in old_tasks
+                    if task_id not in tasks],
+    })
 
 
 @backend_ns.route("/get-build-task/<int:build_id>-<chroot>/")
@@ -380,6 +454,45 @@ def get_build_task(build_id, chroot):
         return jsonout
 
 
+def _build_task_records(task_ids):
+    """
+    Generate the full build records for the list of (both SRPM and RPM)
+    TASK_IDS.  The non-existing tasks are skipped.
+    """
+    srpm_ids = [int(task_id) for task_id in task_ids
+                if str(task_id).isdigit()]
+    if srpm_ids:
+        for build in BuildsLogic.get_srpm_build_tasks_by_ids(srpm_ids):
+            yield get_srpm_build_record(build)
+
+    for task in BuildsLogic.get_build_tasks_by_ids(task_ids):
+        record = get_build_record(task)
+        if record:
+            yield record
+
+
+@backend_ns.route("/get-build-tasks/", methods=["POST"])
+@misc.backend_authenticated
+def get_build_tasks():
+    """
+    Bulk variant of the /get-build-task/ and /get-srpm-build-task/ routes.
+    The request data is a JSON list of (at most MAX_BUILD_TASKS) task IDs, and
+    the response is a (streamed) JSON list of the corresponding build records.
+    Backend uses this to prefetch the tasks it is about to start.
+    """
+    task_ids = flask.request.json
+    if not isinstance(task_ids, list):
+        jsonout = flask.jsonify({"msg": "Expected a list of task IDs"})
+        jsonout.status_code = 400
+        return jsonout
+    if len(task_ids) > MAX_BUILD_TASKS:
+        jsonout = flask.jsonify({"msg": "At most {} task IDs expected".format(
+            MAX_BUILD_TASKS)})
+        jsonout.status_code = 400
+        return jsonout
+    return streamed_json(_build_task_records(task_ids))
+
+
 @backend_ns.route("/get-srpm-build-task/<build_id>/")
 @backend_ns.route("/get-srpm-build-task/<build_id>")
 def get_srpm_build_task(build_id):
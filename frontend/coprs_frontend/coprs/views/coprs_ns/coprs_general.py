@@ -894,8 +894,8 @@ def render_generate_repo_file(copr_dir, name_release, arch=None):
         copr_dir=copr_dir,
         name_release=name_release,
     )
-    CounterStatLogic.incr(name=name, counter_type=CounterStatType.REPO_DL)
-    db.session.commit()
+    CounterStatLogic.incr_buffered(name=name,
+                                   counter_type=CounterStatType.REPO_DL)
     return render_generate_repo_file_cached(copr_dir, name_release, arch=arch)
 
 @cache.memoize(timeout=5*60)
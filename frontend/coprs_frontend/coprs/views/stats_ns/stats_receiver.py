@@ -1,5 +1,8 @@
 # coding: utf-8
 
+import gzip
+import json
+
 import flask
 from coprs import app
 from coprs import db
@@ -19,8 +22,7 @@ def ping():
 def increment(counter_type, name):
     app.logger.debug(flask.request.remote_addr)
 
-    CounterStatLogic.incr(name, counter_type)
-    db.session.commit()
+    CounterStatLogic.incr_buffered(name, counter_type)
     return "", 201
 
 
@@ -28,7 +30,10 @@ def increment(counter_type, name):
 @backend_authenticated
 def backend_stat_message_handler():
     try:
-        handle_be_stat_message(flask.request.json)
+        data = flask.request.get_data()
+        if flask.request.headers.get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        handle_be_stat_message(json.loads(data))
         db.session.commit()
     except Exception as err:
         app.logger.exception(err)
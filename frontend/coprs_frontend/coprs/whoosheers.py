@@ -1,17 +1,27 @@
 import os
+import itertools
+import queue
+import threading
 import whoosh
 import time
 
 from subprocess import Popen, PIPE
 from flask_whooshee import AbstractWhoosheer
-from sqlalchemy import text
+from redis.exceptions import RedisError
+from sqlalchemy import bindparam, text
 
 from coprs import app
+from coprs import helpers
 from coprs import models
 from coprs import whooshee
 from coprs import db
 
 
+# Redis set of IDs of the projects that need to be re-indexed, filled on
+# commit and drained by the search-indexer daemon
+DIRTY_COPRS_KEY = "copr:frontend:search:dirty_coprs"
+
+
 @whooshee.register_whoosheer
 class CoprWhoosheer(AbstractWhoosheer):
     schema = whoosh.fields.Schema(
@@ -53,15 +63,140 @@ class CoprWhoosheer(AbstractWhoosheer):
 
     @classmethod
     def insert_copr(cls, writer, copr):
-        writer.add_document(copr_id=copr.id,
-                            user_id=copr.user.id,
-                            group_id=copr.group.id if copr.group else None,
-                            ownername=copr.owner_name,
-                            coprname=copr.name,
-                            chroots=cls.get_chroot_info(copr),
-                            packages=" ".join(cls.get_package_names(copr)),
-                            description=copr.description,
-                            instructions=copr.instructions)
+        writer.add_document(**cls.document(
+            copr.id, copr.user.id, copr.group.id if copr.group else None,
+            copr.owner_name, copr.name, cls.get_chroot_info(copr),
+            cls.get_package_names(copr), copr.description, copr.instructions))
+
+    @staticmethod
+    def document(copr_id, user_id, group_id, ownername, coprname, chroots,
+                 packages, description, instructions):
+        """
+        Return the index document (dict of fields) for one project
+        """
+        return {
+            "copr_id": copr_id,
+            "user_id": user_id,
+            "group_id": group_id,
+            "ownername": ownername,
+            "coprname": coprname,
+            "chroots": chroots,
+            "packages": " ".join(packages),
+            "description": description,
+            "instructions": instructions,
+        }
+
+    @staticmethod
+    def _grouped_by_copr_id(query):
+        """
+        Group the (copr_id, value...) rows of QUERY (ordered by copr_id) into
+        a dict {copr_id: [(value...), ...]}
+        """
+        return {copr_id: [row[1:] for row in rows]
+                for copr_id, rows in itertools.groupby(query, lambda r: r[0])}
+
+    @classmethod
+    def get_documents(cls, copr_ids, batch_size=1000):
+        """
+        Generate the index documents for the projects with COPR_IDS.  Instead
+        of querying chroots and packages per project (see insert_copr), the
+        projects are processed in batches of BATCH_SIZE, with three queries
+        per batch (projects, chroots and packages grouped by copr_id).
+        """
+        copr_ids = sorted(copr_ids)
+        for start in range(0, len(copr_ids), batch_size):
+            batch = copr_ids[start:start + batch_size]
+
+            chroots = cls._grouped_by_copr_id(
+                db.session.query(models.CoprChroot.copr_id,
+                                 models.MockChroot.os_release,
+                                 models.MockChroot.os_version,
+                                 models.MockChroot.arch)
+                .join(models.MockChroot,
+                      models.MockChroot.id == models.CoprChroot.mock_chroot_id)
+                .filter(models.CoprChroot.copr_id.in_(batch))
+                .order_by(models.CoprChroot.copr_id))
+
+            packages = cls._grouped_by_copr_id(
+                db.session.query(models.Package.copr_id, models.Package.name)
+                .filter(models.Package.copr_id.in_(batch))
+                .order_by(models.Package.copr_id))
+
+            coprs = (
+                db.session.query(models.Copr.id, models.Copr.user_id,
+                                 models.Copr.group_id, models.User.username,
+                                 models.Group.name, models.Copr.name,
+                                 models.Copr.description,
+                                 models.Copr.instructions)
+                .join(models.User, models.User.id == models.Copr.user_id)
+                .outerjoin(models.Group,
+                           models.Group.id == models.Copr.group_id)
+                .filter(models.Copr.id.in_(batch))
+                .order_by(models.Copr.id)
+            )
+
+            for (copr_id, user_id, group_id, username, group_name, name,
+                 description, instructions) in coprs:
+                ownername = username
+                if group_id is not None:
+                    ownername = "@{}".format(group_name)
+                yield cls.document(
+                    copr_id, user_id, group_id, ownername, name,
+                    ["{}-{}-{}".format(*chroot)
+                     for chroot in chroots.get(copr_id, [])],
+                    [package for package, in packages.get(copr_id, [])],
+                    description, instructions)
+
+    @classmethod
+    def bulk_index(cls, writer, copr_ids, update=False, log=None):
+        """
+        Add the documents for COPR_IDS to the index WRITER (replace the
+        existing ones with UPDATE=True).  This thread loads the documents
+        from the database (see get_documents), while another thread feeds
+        them into the WRITER.  With UPDATE=True, the documents of projects
+        that no longer exist are removed.  Return the number of indexed
+        projects.
+        """
+        documents = queue.Queue(maxsize=1000)
+        errors = []
+
+        def _consume():
+            add = writer.update_document if update else writer.add_document
+            try:
+                while True:
+                    document = documents.get()
+                    if document is None:
+                        return
+                    add(**document)
+            except Exception as err:  # pylint: disable=broad-except
+                errors.append(err)
+                # don't block the producer
+                while documents.get() is not None:
+                    pass
+
+        consumer = threading.Thread(target=_consume, daemon=True)
+        consumer.start()
+        count = 0
+        indexed = set()
+        try:
+            for count, document in enumerate(cls.get_documents(copr_ids), 1):
+                indexed.add(document["copr_id"])
+                documents.put(document)
+                if log and count % 1000 == 0:
+                    log.info("Indexing [%s/%s] - %s", count, len(copr_ids),
+                             document["coprname"])
+        finally:
+            documents.put(None)
+            consumer.join()
+
+        if errors:
+            raise errors[0]
+
+        if update:
+            # Projects removed from the database
+            for copr_id in set(copr_ids) - indexed:
+                writer.delete_by_term("copr_id", copr_id)
+        return count
 
     @classmethod
     def insert_package(cls, writer, package):
@@ -103,19 +238,77 @@ class CoprWhoosheer(AbstractWhoosheer):
             ))
         return [row[0] for row in result.fetchall()]
 
+    _redis = None
+
+    @classmethod
+    def _get_redis(cls):
+        if cls._redis is None:
+            cls._redis = helpers.RedisConnectionProvider(
+                config=app.config).get_connection()
+        return cls._redis
+
     @classmethod
     def on_commit(cls, app, changes):
-        """Should be registered with flask.ext.sqlalchemy.models_committed."""
+        """
+        Should be registered with flask.ext.sqlalchemy.models_committed.
+        Queue the changed projects for re-indexing (see index_dirty).
+        """
+        copr_ids = set()
         for change in changes:
             if change[0].__class__ in cls.models:
-                copr_id = change[0].get_search_related_copr_id()
-                with db.engine.connect() as connection:
-                    connection.execute(text(
-                        """
-                        UPDATE copr SET latest_indexed_data_update = {0}
-                        WHERE copr.id = {1}
-                        """.format(int(time.time()), copr_id)
-                    ))
+                copr_ids.add(change[0].get_search_related_copr_id())
+        copr_ids.discard(None)
+        if not copr_ids:
+            return
+
+        try:
+            cls._get_redis().sadd(DIRTY_COPRS_KEY, *copr_ids)
+            return
+        except RedisError as err:
+            app.logger.warning("Can't queue projects for re-indexing: %s",
+                               err)
+
+        # Fallback, update-indexes-quick re-indexes these
+        with db.engine.begin() as connection:
+            connection.execute(
+                text(
+                    """
+                    UPDATE copr SET latest_indexed_data_update = :now
+                    WHERE copr.id IN :copr_ids
+                    """
+                ).bindparams(bindparam("copr_ids", expanding=True)),
+                {"now": int(time.time()), "copr_ids": sorted(copr_ids)},
+            )
+
+    @classmethod
+    def index_dirty(cls, index, batch_size=1000, timeout=60):
+        """
+        Re-index (at most BATCH_SIZE) projects queued by on_commit(), all in
+        one whoosh INDEX commit.  TIMEOUT is the number of seconds to wait for
+        the index lock.  Return the number of processed projects.
+        """
+        redis = cls._get_redis()
+        copr_ids = [int(copr_id) for copr_id in
+                    redis.spop(DIRTY_COPRS_KEY, batch_size) or []]
+        if not copr_ids:
+            return 0
+
+        try:
+            writer = index.writer(timeout=timeout)
+            try:
+                cls.bulk_index(writer, copr_ids, update=True)
+            except Exception:
+                writer.cancel()
+                raise
+            writer.commit()
+        except Exception:
+            # Try again next time
+            redis.sadd(DIRTY_COPRS_KEY, *copr_ids)
+            raise
+        finally:
+            # Don't keep the transaction open
+            db.session.rollback()
+        return len(copr_ids)
 
 
 class WhoosheeStamp(object):
@@ -28,11 +28,13 @@ import commands.dump_user
 import commands.update_indexes
 import commands.update_indexes_quick
 import commands.update_indexes_required
+import commands.search_indexer
 import commands.get_admins
 import commands.fail_build
 import commands.rawhide_to_release
 import commands.update_graphs
 import commands.vacuum_graphs
+import commands.flush_counters
 import commands.notify_outdated_chroots
 import commands.delete_outdated_chroots
 import commands.eol_lifeless_rolling_chroots
@@ -82,6 +84,7 @@ commands_list =	[
     "update_indexes",
     "update_indexes_quick",
     "update_indexes_required",
+    "search_indexer",
 
     # Other
     "get_admins",
@@ -89,6 +92,7 @@ commands_list =	[
     "rawhide_to_release",
     "update_graphs",
     "vacuum_graphs",
+    "flush_counters",
     "notify_outdated_chroots",
     "delete_outdated_chroots",
     "eol_lifeless_rolling_chroots",
@@ -4,11 +4,14 @@ Test all kind of build request via v3 API
 
 import copy
 import json
+import threading
+from unittest import mock
 
 import pytest
 
 from bs4 import BeautifulSoup
-from copr_common.enums import BuildSourceEnum
+from copr_common.enums import BuildSourceEnum, StatusEnum
+from coprs import models
 from coprs.logic.builds_logic import BuildChrootResultsLogic
 
 from tests.coprs_test_case import CoprsTestCase, TransactionDecorator
@@ -271,3 +274,104 @@ class TestAPIv3BuildsResults(CoprsTestCase):
         result = self.tc.get(endpoint)
         assert result.is_json
         assert result.json["fedora-18-x86_64"] == built_packages
+
+
+class TestAPIv3WatchBuilds(CoprsTestCase):
+    """
+    Tests for the /build/watch endpoint
+    """
+
+    def _watch(self, builds, timeout=0):
+        return self.tc.post("/api_3/build/watch",
+                            json={"builds": builds, "timeout": timeout})
+
+    @pytest.mark.usefixtures("f_users", "f_coprs", "f_mock_chroots",
+                             "f_builds", "f_db")
+    def test_watch_builds(self):
+        r = self._watch([{"id": self.b1.id, "state": None},
+                         {"id": self.b2.id, "state": None}])
+        assert r.status_code == 200
+        items = {item["id"]: item for item in r.json["items"]}
+        assert set(items) == {self.b1.id, self.b2.id}
+        assert items[self.b1.id]["state"] == self.b1.state
+
+        # nothing changed
+        r = self._watch([{"id": self.b1.id, "state": self.b1.state},
+                         {"id": self.b2.id, "state": self.b2.state}])
+        assert r.json["items"] == []
+
+        r = self._watch([{"id": self.b1.id, "state": "pending"},
+                         {"id": self.b2.id, "state": self.b2.state}])
+        assert [item["id"] for item in r.json["items"]] == [self.b1.id]
+
+    @pytest.mark.usefixtures("f_users", "f_coprs", "f_mock_chroots",
+                             "f_builds", "f_db")
+    @mock.patch("coprs.logic.builds_logic.BuildsLogic._wait_for_published")
+    def test_watch_builds_no_free_slot(self, wait_for_published):
+        slots = threading.BoundedSemaphore(1)
+        assert slots.acquire(blocking=False)
+        with mock.patch("coprs.logic.builds_logic.BuildsLogic._watch_slots",
+                        slots):
+            r = self._watch([{"id": self.b1.id, "state": self.b1.state}],
+                            timeout=30)
+        assert r.status_code == 200
+        assert r.json["items"] == []
+        assert not wait_for_published.called
+        # the slot is still taken by the other watcher
+        assert not slots.acquire(blocking=False)
+
+    @pytest.mark.usefixtures("f_users", "f_coprs", "f_mock_chroots",
+                             "f_builds", "f_db")
+    def test_watch_builds_invalid(self):
+        assert self._watch([{"state": None}]).status_code == 400
+        assert self._watch([{"id": 9999, "state": None}]).status_code == 404
+
+    @pytest.mark.usefixtures("f_users", "f_coprs", "f_mock_chroots",
+                             "f_builds", "f_db")
+    @mock.patch("coprs.logic.builds_logic.BuildsLogic.publish_state_changes")
+    def test_build_state_published(self, publish):
+        self.b1.build_chroots[0].status = StatusEnum("running")
+        self.db.session.commit()
+        publish.assert_called_once_with({self.b1.id})
+
+        publish.reset_mock()
+        self.b1.build_chroots[0].git_hash = "deadbeef"
+        self.db.session.commit()
+        assert not publish.called
+
+
+class TestAPIv3BuildStates(CoprsTestCase):
+    """
+    Tests for the /build/states endpoint
+    """
+
+    def _states(self, builds):
+        return self.tc.post("/api_3/build/states", json={"builds": builds})
+
+    @pytest.mark.usefixtures("f_users", "f_coprs", "f_mock_chroots",
+                             "f_builds", "f_db")
+    def test_build_states(self):
+        self.b1.canceled = True
+        self.db.session.commit()
+
+        r = self._states([self.b2.id, self.b1.id, 9999])
+        assert r.status_code == 200
+        items = r.json["items"]
+        assert [item["id"] for item in items] == sorted([self.b1.id,
+                                                         self.b2.id])
+        for item in items:
+            build = models.Build.query.get(item["id"])
+            assert item["state"] == build.state
+            assert item["chroots"] == {chroot.name: chroot.state
+                                       for chroot in build.build_chroots}
+        assert {item["id"]: item["state"] for item in items}[self.b1.id] \
+            == "canceled"
+
+    @pytest.mark.usefixtures("f_users", "f_coprs", "f_mock_chroots",
+                             "f_builds", "f_db")
+    def test_build_states_invalid(self):
+        assert self._states(["foo"]).status_code == 400
+        assert self._states(None).status_code == 400
+        with mock.patch("coprs.logic.builds_logic.BuildsLogic"
+                        ".STATES_MAX_BUILDS", 1):
+            assert self._states([self.b1.id, self.b2.id]).status_code == 400
@@ -31,6 +31,31 @@ class TestApiv3Projects(CoprsTestCase):
         assert [p["id"] for p in projects3] == [3, 1, 2]
         assert projects3 == list(reversed(projects2))
 
+    @pytest.mark.parametrize("order, order_type, expected", [
+        ("id", "ASC", [[1, 2], [3]]),
+        ("id", "DESC", [[3, 2], [1]]),
+        ("name", "DESC", [[2, 1], [3]]),
+    ])
+    def test_get_project_list_cursor(self, order, order_type, expected,
+                                     f_users, f_coprs, f_mock_chroots, f_db):
+        url = "/api_3/project/list?limit=2&order={}&order_type={}".format(
+            order, order_type)
+        response = self.tc.get(url)
+        assert [p["id"] for p in response.json["items"]] == expected[0]
+        cursor = response.json["meta"]["next_cursor"]
+        assert cursor
+
+        response = self.tc.get(url + "&offset=100&cursor=" + cursor)
+        assert [p["id"] for p in response.json["items"]] == expected[1]
+        assert response.json["meta"]["cursor"] == cursor
+        assert response.json["meta"]["next_cursor"] is None
+
+        # cursor generated for a different ordering
+        order_type = "ASC" if order_type == "DESC" else "DESC"
+        url = "/api_3/project/list?limit=2&order={}&order_type={}&cursor={}"
+        response = self.tc.get(url.format(order, order_type, cursor))
+        assert response.status_code == 400
+
     @TransactionDecorator("u1")
     @pytest.mark.usefixtures("f_users", "f_users_api", "f_mock_chroots", "f_db")
     @pytest.mark.parametrize("store, read", [(True, "on"), (False, "off")])
@@ -0,0 +1,30 @@
+"""
+Tests for 'search-indexer'
+"""
+
+from unittest import mock
+
+import pytest
+from redis.exceptions import RedisError
+
+from tests.coprs_test_case import CoprsTestCase
+from commands.search_indexer import search_indexer
+
+
+@mock.patch("commands.search_indexer.time.sleep")
+@mock.patch("commands.search_indexer.Whooshee.get_or_create_index")
+@mock.patch("commands.search_indexer.CoprWhoosheer.index_dirty")
+class TestSearchIndexerCommand(CoprsTestCase):
+    def test_keeps_running_on_errors(self, index_dirty, _index, sleep):
+        index_dirty.side_effect = [RedisError("down"), RuntimeError("db"),
+                                   3, SystemExit]
+        with pytest.raises(SystemExit):
+            search_indexer.callback(interval=2, once=False)
+        assert len(index_dirty.call_args_list) == 4
+        assert sleep.call_args_list == [mock.call(2), mock.call(2)]
+
+    def test_once(self, index_dirty, _index, sleep):
+        index_dirty.side_effect = [3, 1, 0]
+        search_indexer.callback(interval=2, once=True)
+        assert len(index_dirty.call_args_list) == 3
+        assert not sleep.called
@@ -4,12 +4,14 @@ Tests for working with Batches
 
 import json
 import time
+from unittest import mock
 import pytest
 from flask_sqlalchemy.record_queries import get_recorded_queries
 from copr_common.enums import StatusEnum
 from coprs import app, models
 from coprs.exceptions import BadRequest
 from coprs.logic.batches_logic import BatchesLogic
+from coprs.logic.builds_logic import BuildsLogic
 from tests.coprs_test_case import CoprsTestCase
 
 
@@ -71,6 +73,8 @@ class TestBatchesLogic(CoprsTestCase):
             for chroot in build.build_chroots:
                 chroot.state = StatusEnum("succeeded")
             assert build.finished
+        # we changed the states directly, not through update_state_from_dict()
+        BatchesLogic.update_state(self.batches[0])
         assert self.batches[0].finished
         self.db.session.commit()
 
@@ -79,6 +83,71 @@ class TestBatchesLogic(CoprsTestCase):
         assert resp.status_code == status
         return resp.data.decode("utf-8")
 
+    def test_update_state_reloads_locked_batch(self):
+        self._prepare_project_with_batches()
+        batch = self.batches[0]
+        for build in batch.builds:
+            build.source_status = StatusEnum("succeeded")
+            for chroot in build.build_chroots:
+                chroot.state = StatusEnum("succeeded")
+        self.db.session.commit()
+        assert not batch.is_finished
+
+        # other transaction finished the batch, our object is stale
+        self.db.session.execute(
+            models.Batch.__table__.update()
+            .where(models.Batch.id == batch.id)
+            .values(is_finished=True))
+        with mock.patch.object(BatchesLogic, "_propagate_blocked") as propagate:
+            BatchesLogic.update_state(batch)
+        assert not propagate.called
+        assert batch.is_finished
+
+    def test_new_batch_for_finished_build(self):
+        self.web_ui.new_project("test", ["fedora-rawhide-i386"])
+        self.api3.submit_url_build("test")
+        build = self.db.session.get(models.Build, 1)
+        build.source_status = StatusEnum("failed")
+        self.db.session.commit()
+
+        # the build finished after the batching checks
+        with mock.patch.object(models.Build, "batching_user_error",
+                               return_value=None):
+            batch = BuildsLogic.setup_batch(1, None, self.transaction_user)
+        self.db.session.commit()
+        assert build.batch.finished
+        assert batch.blocked_by == build.batch
+        assert not batch.blocked
+
+    def test_delete_builds_finishes_batch(self):
+        self._prepare_project_with_batches()
+        first, second = self.batches
+        user = self.db.session.get(models.User, 1)
+
+        # the states changed directly, not through update_state_from_dict()
+        builds = first.builds
+        for build in builds:
+            build.source_status = StatusEnum("failed")
+        self.db.session.commit()
+        assert not first.finished
+        assert second.blocked
+
+        BuildsLogic.delete_build(user, builds[0])
+        self.db.session.commit()
+        assert first.finished
+        assert not second.blocked
+
+        # a batch with all the builds deleted is finished, too
+        self.db.session.execute(
+            models.Batch.__table__.update()
+            .where(models.Batch.id == first.id)
+            .values(is_finished=False))
+        self.db.session.expire_all()
+        BuildsLogic.delete_builds(user, [build.id for build in first.builds])
+        self.db.session.commit()
+        assert first.finished
+        assert not first.builds
+
     def test_normal_batch_operation_failures(self):
         self._prepare_project_with_batches()
         self._succeed_first_batch()
@@ -137,6 +206,38 @@ class TestBatchesLogic(CoprsTestCase):
         assert "Build 1 is not yet in any batch" in str(error)
         assert "'user2' doesn't have the build permissions" in str(error)
 
+    def test_materialized_batch_state(self):
+        self._prepare_project_with_batches(more=1)
+        first, second, third = self.batches
+        assert not first.blocked
+        assert second.blocked
+        assert third.blocked
+
+        # fail the source builds in the first batch, one by one
+        for build in first.builds:
+            assert not first.finished
+            BuildsLogic.update_state_from_dict(build, {
+                "task_id": build.task_id,
+                "status": StatusEnum("failed"),
+            })
+        self.db.session.commit()
+
+        assert first.finished
+        assert not second.finished
+        assert not second.blocked
+        # still blocked by the second batch
+        assert third.blocked
+        assert third.state == "blocked"
+
+        # cancel the second batch
+        for build in second.builds:
+            build.canceled = True
+            BuildsLogic.update_batch_state(build)
+        self.db.session.commit()
+        assert second.finished
+        assert not third.blocked
+        assert third.state == "processing"
+
     def test_batched_build_queue_sql_performance(self):
         more_bchs = 5
         self._prepare_project_with_batches(more=more_bchs)
@@ -152,27 +253,15 @@ class TestBatchesLogic(CoprsTestCase):
         #
         # 1. Get user1 info (for self.test_client).
         # 2. Large query for Source builds (get_pending_srpm_build_tasks).
-        # 3. Get info about Batch 1 - *expected* (even though it's in "finished"
-        #    state and is cached in Redis), this is triggered by lazy-loads from
-        #    accessing objects from query 1 => the source builds in the query
-        #    are from other batches (e.g. 3), but to check if Batch 3 is blocked
-        #    (already loaded) we have to check if Batch 2 is blocked (loaded)
-        #    and thus also if Batch 1 is blocked.  Because we ask for
-        #    'batch_1.blocked' it needs to be loaded **now** because it is not
-        #    yet (it is not loaded because all builds there are already
-        #    finished).
-        # 4. Read all builds (lazy) from Batch 2 to get Build statuses.  This is
-        #    the only Batch where we need to iterate through Builds (as there's
-        #    only one tree of batches).
-        # 5. Read BuildChroots (lazy) from ^^ to get statuses.
-        # 6. Large query for BuildChroots (get_pending_build_tasks).
+        # 3. Large query for BuildChroots (get_pending_build_tasks).
         #
-        # The last batch (ID=2+more_bchs) contains one "ready" BuildChroot task
-        # (the srpm upload emulation, see _prepare_project_with_batches()) which
-        # is only blocked by parent batch.  But because we cache Batch objects
-        # in pending_jobs() method - they are preloaded and we can be sure that
-        # we don't have to re-load the batch data to check if that is finished.
-        expected = 6
+        # The blocked builds are filtered out by the queries (per the
+        # materialized Batch.is_blocked state), so no batch or build is lazily
+        # loaded.  The last batch (ID=2+more_bchs) contains one "ready"
+        # BuildChroot task (the srpm upload emulation, see
+        # _prepare_project_with_batches()) which is only blocked by parent
+        # batch.
+        expected = 3
         if expected != len(dq):
             print()
             for n, query in enumerate(dq):
@@ -299,13 +388,11 @@ class TestBatchesLogic(CoprsTestCase):
         asserts = [
             sql_alchemy_time < fill_time/3*2,
             query_time < fill_time/20,
-            # - for each project two queries (for batch => one build +batch_build)
             # - two large queries (srpm + rpms)
             # - one query for self.tc initialization
-            # Note that we only lazily load first Build in each unblocked batch,
-            # because even that first Build in batch is not yet finished -
-            # meaning that the whole batch is not yet finished as well.
-            len(dq) == len(projects)*2 + 2 + 1,
+            # Note that the blocked batches are filtered out in SQL, no
+            # additional (per-batch) queries are needed.
+            len(dq) == 2 + 1,
         ]
 
         if not all(asserts):
@@ -266,6 +266,53 @@ class TestProjectForking(CoprsTestCase):
         assert len(build_config["repos"]) == 2
         assert build_config["repos"][1]["id"] == "copr_non_existing"
 
+    @pytest.mark.usefixtures("f_users", "f_coprs", "f_mock_chroots", "f_builds",
+                             "f_db")
+    def test_generate_build_config_cached(self):
+        bcl = BuildConfigLogic
+        self.c1.repos = "copr://user2/barcopr copr://non/existing"
+        self.db.session.commit()
+
+        config = bcl.generate_build_config(self.c1.main_dir, "fedora-18-x86_64")
+        assert [repo["id"] for repo in config["repos"]] == [
+            "copr_base", "copr_user2_barcopr", "copr_non_existing"]
+        assert "module_hotfixes" not in config["repos"][1]
+
+        # the second call is served from cache
+        with mock.patch.object(bcl, "_generate_build_config") as generate:
+            assert bcl.generate_build_config(
+                self.c1.main_dir, "fedora-18-x86_64") == config
+            assert not generate.called
+
+        # change in the referenced project invalidates the cache
+        self.c3.module_hotfixes = True
+        self.db.session.commit()
+        config = bcl.generate_build_config(self.c1.main_dir, "fedora-18-x86_64")
+        assert config["repos"][1]["module_hotfixes"]
+
+        # change in the project chroot, too
+        copr_chroot = [cch for cch in self.c1.copr_chroots
+                       if cch.name == "fedora-18-x86_64"][0]
+        copr_chroot.buildroot_pkgs = "foo bar"
+        # not yet committed, but we see it
+        config = bcl.generate_build_config(self.c1.main_dir, "fedora-18-x86_64")
+        assert config["additional_packages"] == ["foo", "bar"]
+        self.db.session.commit()
+        config = bcl.generate_build_config(self.c1.main_dir, "fedora-18-x86_64")
+        assert config["additional_packages"] == ["foo", "bar"]
+
+    @pytest.mark.usefixtures("f_users", "f_coprs", "f_db")
+    def test_get_coprs_by_repos(self):
+        repos = ["copr://user2/barcopr", "copr://user1/foocopr",
+                 "copr://non/existing", "copr://too/many/slashes",
+                 "https://example.com/repo"]
+        coprs = ComplexLogic.get_coprs_by_repos(repos)
+        assert coprs == {
+            "copr://user2/barcopr": self.c3,
+            "copr://user1/foocopr": self.c1,
+        }
+
+
 class FooModel(object):
     """
     Mocks SqlAlchemy db.Model
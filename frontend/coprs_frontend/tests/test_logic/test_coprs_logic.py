@@ -1,5 +1,6 @@
 import json
 import pytest
+from unittest import mock
 import flask
 
 from datetime import datetime, timedelta, date
@@ -17,7 +18,7 @@ from coprs.logic.users_logic import UsersLogic
 from coprs.logic.complex_logic import ComplexLogic
 
 from coprs import models
-from coprs.whoosheers import CoprWhoosheer
+from coprs.whoosheers import CoprWhoosheer, DIRTY_COPRS_KEY
 from tests.coprs_test_case import CoprsTestCase
 from coprs.exceptions import (
     AccessRestricted,
@@ -81,6 +82,79 @@ class TestCoprsLogic(CoprsTestCase):
 
         assert obtained == expected
 
+    @pytest.mark.usefixtures("f_users", "f_coprs", "f_mock_chroots",
+                             "f_group_copr", "f_builds", "f_db")
+    def test_whoosh_bulk_index(self):
+        coprs = [self.c1, self.c2, self.c3, self.gc1]
+        expected = {}
+        for copr in coprs:
+            expected[copr.id] = CoprWhoosheer.document(
+                copr.id, copr.user.id, copr.group.id if copr.group else None,
+                copr.owner_name, copr.name,
+                CoprWhoosheer.get_chroot_info(copr),
+                CoprWhoosheer.get_package_names(copr),
+                copr.description, copr.instructions)
+
+        documents = CoprWhoosheer.get_documents(
+            [copr.id for copr in coprs], batch_size=3)
+        documents = {document["copr_id"]: document for document in documents}
+        assert set(documents) == set(expected)
+        for copr_id, document in documents.items():
+            assert sorted(document.pop("chroots")) == \
+                sorted(expected[copr_id].pop("chroots"))
+            assert sorted(document.pop("packages").split()) == \
+                sorted(expected[copr_id].pop("packages").split())
+            assert document == expected[copr_id]
+        assert documents[self.gc1.id]["ownername"] == "@" + self.g1.name
+
+        index = Whooshee.get_or_create_index(app, CoprWhoosheer)
+        writer = index.writer()
+        assert CoprWhoosheer.bulk_index(
+            writer, [copr.id for copr in coprs], update=True) == len(coprs)
+        writer.commit()
+        found = (models.Copr.query
+                 .whooshee_search(self.gc1.name, whoosheer=CoprWhoosheer)
+                 .all())
+        assert self.gc1 in found
+
+    @pytest.mark.usefixtures("f_users", "f_db")
+    def test_whoosh_dirty_coprs(self):
+        redis = CoprWhoosheer._get_redis()
+        redis.delete(DIRTY_COPRS_KEY)
+
+        copr = models.Copr(name="dirtyproject", user=self.u1)
+        self.db.session.add(copr)
+        self.db.session.commit()
+        assert redis.smembers(DIRTY_COPRS_KEY) == {str(copr.id).encode()}
+
+        # a deleted project is removed from the index
+        redis.sadd(DIRTY_COPRS_KEY, 99999)
+
+        index = Whooshee.get_or_create_index(app, CoprWhoosheer)
+        assert CoprWhoosheer.index_dirty(index) == 2
+        assert not redis.exists(DIRTY_COPRS_KEY)
+        assert CoprWhoosheer.index_dirty(index) == 0
+
+        found = (models.Copr.query
+                 .whooshee_search("dirtyproject", whoosheer=CoprWhoosheer)
+                 .all())
+        assert found == [copr]
+
+    @pytest.mark.usefixtures("f_users", "f_db")
+    @mock.patch("coprs.whoosheers.CoprWhoosheer.bulk_index")
+    def test_whoosh_dirty_coprs_failure(self, bulk_index):
+        redis = CoprWhoosheer._get_redis()
+        redis.delete(DIRTY_COPRS_KEY)
+        redis.sadd(DIRTY_COPRS_KEY, 1, 2)
+        bulk_index.side_effect = RuntimeError("index broken")
+
+        index = Whooshee.get_or_create_index(app, CoprWhoosheer)
+        with pytest.raises(RuntimeError):
+            CoprWhoosheer.index_dirty(index)
+        # queued again
+        assert redis.smembers(DIRTY_COPRS_KEY) == {b"1", b"2"}
+        redis.delete(DIRTY_COPRS_KEY)
+
     def test_raise_if_cant_delete(self, f_users, f_fas_groups, f_coprs):
         # Project owner should be able to delete his project
         CoprsLogic.raise_if_cant_delete(self.u2, self.c2)
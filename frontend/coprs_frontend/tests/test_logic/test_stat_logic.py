@@ -1,7 +1,17 @@
 # coding: utf-8
+import gzip
+import json
+from unittest import mock
+
 import pytest
+from redis.exceptions import RedisError
 
-from coprs.logic.stat_logic import CounterStatLogic
+from coprs.logic.stat_logic import (
+    BUFFER_KEY,
+    FLUSHING_KEY,
+    CounterStatLogic,
+)
+from coprs import models
 from coprs.helpers  import CounterStatType
 from tests.coprs_test_case import CoprsTestCase
 
@@ -14,6 +24,12 @@ class TestStatLogic(CoprsTestCase):
         self.counter_type = CounterStatType.REPO_DL
         self.counter_name = "{}:user/copr".format(CounterStatType.REPO_DL)
 
+        redis = CounterStatLogic._get_redis()
+        for key in redis.scan_iter(match=BUFFER_KEY.format("*")):
+            redis.delete(key)
+        for key in redis.scan_iter(match=FLUSHING_KEY.format("*")):
+            redis.delete(key)
+
     def test_counter_basic(self):
         CounterStatLogic.add(self.counter_name, self.counter_type)
         self.db.session.commit()
@@ -30,3 +46,121 @@ class TestStatLogic(CoprsTestCase):
         self.db.session.commit()
         csl = CounterStatLogic.get(self.counter_name).one()
         assert csl.counter == 1
+
+    def test_bulk_incr(self):
+        CounterStatLogic.incr(self.counter_name, self.counter_type)
+        self.db.session.commit()
+
+        other = "{}:user/other".format(CounterStatType.REPO_DL)
+        CounterStatLogic.bulk_incr([
+            (self.counter_name, self.counter_type, 5),
+            (other, self.counter_type, 2),
+            (other, self.counter_type, 3),
+        ])
+        self.db.session.commit()
+
+        assert CounterStatLogic.get(self.counter_name).one().counter == 6
+        csl = CounterStatLogic.get(other).one()
+        assert csl.counter == 5
+        assert csl.counter_type == self.counter_type
+
+        CounterStatLogic.bulk_incr([])
+        self.db.session.commit()
+        assert CounterStatLogic.get(other).one().counter == 5
+
+    def test_buffered_counters(self):
+        CounterStatLogic.incr(self.counter_name, self.counter_type, 3)
+        self.db.session.commit()
+
+        other = "{}:user/other".format(CounterStatType.REPO_DL)
+        CounterStatLogic.incr_buffered(self.counter_name, self.counter_type)
+        CounterStatLogic.incr_buffered(other, self.counter_type, 5)
+        CounterStatLogic.incr_buffered(other, self.counter_type)
+
+        # not in the database yet
+        assert CounterStatLogic.get(self.counter_name).one().counter == 3
+        assert CounterStatLogic.get(other).count() == 0
+
+        # .. but the reads include the buffered increments
+        assert CounterStatLogic.get_buffered(self.counter_type) == {
+            self.counter_name: 1, other: 6}
+        assert CounterStatLogic.get_buffered(self.counter_type, [other]) == {
+            other: 6}
+        popular = CounterStatLogic.get_popular(self.counter_type)
+        assert [(stat.name, stat.counter) for stat in popular] == [
+            (other, 6), (self.counter_name, 4)]
+
+        assert CounterStatLogic.flush_buffered() == 2
+        assert CounterStatLogic.get(self.counter_name).one().counter == 4
+        assert CounterStatLogic.get(other).one().counter == 6
+        assert CounterStatLogic.get_buffered(self.counter_type) == {}
+        assert CounterStatLogic.flush_buffered() == 0
+
+    def test_flush_buffered_crash_after_commit(self):
+        CounterStatLogic.incr_buffered(self.counter_name, self.counter_type, 2)
+        redis = CounterStatLogic._get_redis()
+
+        # the process dies after commit, the flushing buffer is left behind
+        with mock.patch.object(redis, "delete", side_effect=SystemExit):
+            with pytest.raises(SystemExit):
+                CounterStatLogic.flush_buffered()
+        assert CounterStatLogic.get(self.counter_name).one().counter == 2
+        assert redis.exists(FLUSHING_KEY.format(self.counter_type))
+        # the flush ID is not stored among the user-facing stats
+        assert models.CounterStat.query.count() == 1
+        flush = models.CounterStatFlush.query.one()
+        assert flush.counter_type == self.counter_type
+        assert CounterStatLogic.get_buffered(self.counter_type) == {
+            self.counter_name: 2}
+
+        # the re-try doesn't apply the increments again
+        CounterStatLogic.incr_buffered(self.counter_name, self.counter_type)
+        assert CounterStatLogic.flush_buffered() == 0
+        assert CounterStatLogic.get(self.counter_name).one().counter == 2
+        assert CounterStatLogic.flush_buffered() == 1
+        assert CounterStatLogic.get(self.counter_name).one().counter == 3
+        assert CounterStatLogic.get_buffered(self.counter_type) == {}
+
+    @mock.patch("coprs.logic.stat_logic.CounterStatLogic._get_redis")
+    def test_buffered_counters_no_redis(self, get_redis):
+        get_redis.return_value.hincrby.side_effect = RedisError("down")
+        get_redis.return_value.hgetall.side_effect = RedisError("down")
+        CounterStatLogic.incr_buffered(self.counter_name, self.counter_type)
+        assert CounterStatLogic.get(self.counter_name).one().counter == 1
+        assert CounterStatLogic.get_buffered(self.counter_type) == {}
+
+    def test_stats_rcv_increment(self):
+        url = "/stats_rcv/{}/{}/".format(self.counter_type, self.counter_name)
+        r = self.tc.post(url, headers=self.auth_header)
+        assert r.status_code == 201
+        assert CounterStatLogic.get(self.counter_name).count() == 0
+        CounterStatLogic.flush_buffered()
+        assert CounterStatLogic.get(self.counter_name).one().counter == 1
+
+    @pytest.mark.parametrize("compress", [True, False])
+    def test_hits_from_backend(self, compress):
+        data = json.dumps({
+            "ts_from": 1700000000,
+            "ts_to": 1700003599,
+            "hits": {
+                "project_rpms_dl_stat|user|copr": 10,
+                "chroot_rpms_dl_stat|user|copr|fedora-18-x86_64": 7,
+            },
+        }).encode("utf-8")
+        headers = dict(self.auth_header)
+        headers["Content-Type"] = "application/json"
+        if compress:
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+        r = self.tc.post("/stats_rcv/from_backend", data=data, headers=headers)
+        assert r.status_code == 201
+
+        name = "project_rpms_dl_stat:hset::user@copr"
+        assert CounterStatLogic.get(name).one().counter == 10
+        name = "chroot_rpms_dl_stat:hset::user@copr:fedora-18-x86_64"
+        assert CounterStatLogic.get(name).one().counter == 7
+
+        # the counters are incremented by the next payload
+        r = self.tc.post("/stats_rcv/from_backend", data=data, headers=headers)
+        assert r.status_code == 201
+        assert CounterStatLogic.get(name).one().counter == 14
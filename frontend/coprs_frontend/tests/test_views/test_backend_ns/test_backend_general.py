@@ -1,4 +1,5 @@
 import json
+import time
 
 from unittest import mock, skip
 import pytest
@@ -7,8 +8,9 @@ from flask_sqlalchemy.record_queries import get_recorded_queries
 
 from copr_common.enums import BackendResultEnum, StatusEnum, DefaultActionPriorityEnum
 from tests.coprs_test_case import CoprsTestCase
+from coprs.logic.batches_logic import BatchesLogic
 from coprs.logic.builds_logic import BuildsLogic
-from coprs import app
+from coprs import app, models
 
 
 # pylint: disable=unused-argument
@@ -45,6 +47,32 @@ class TestGetBuildTask(CoprsTestCase):
         data = json.loads(r.decode("utf-8"))
         assert data['modules']['toggle'] == [{'disable': 'XXX'}, {'enable': 'YYY'}, {'enable': 'ZZZ'}]
 
+    def test_get_build_tasks_bulk(self, f_users, f_coprs, f_mock_chroots, f_builds, f_db):
+        task_id = "{}-fedora-18-x86_64".format(self.b2.id)
+        single = self.tc.get("/backend/get-build-task/" + task_id).json
+        task_ids = [task_id, str(self.b2.id), "{}-non-existing-chroot".format(self.b2.id),
+                    "99999-fedora-18-x86_64", "invalid"]
+        r = self.tc.post("/backend/get-build-tasks/", json=task_ids,
+                         headers=self.auth_header)
+        data = json.loads(r.data.decode("utf-8"))
+        assert [record["task_id"] for record in data] == [str(self.b2.id), task_id]
+        assert data[0]["source_type"] == self.b2.source_type
+        assert data[1] == single
+
+    def test_get_build_tasks_bulk_invalid(self, f_users, f_coprs, f_mock_chroots, f_builds, f_db):
+        r = self.tc.post("/backend/get-build-tasks/", json={"task_id": "1"},
+                         headers=self.auth_header)
+        assert r.status_code == 400
+
+        r = self.tc.post("/backend/get-build-tasks/",
+                         json=[str(i) for i in range(101)],
+                         headers=self.auth_header)
+        assert r.status_code == 400
+
+        # only Backend can ask
+        r = self.tc.post("/backend/get-build-tasks/", json=["1"])
+        assert r.status_code == 401
+
 class TestWaitingBuilds(CoprsTestCase):
 
     def test_no_pending_builds(self):
@@ -93,7 +121,7 @@ class TestWaitingBuilds(CoprsTestCase):
 
         self.b2.batch = self.batch2
         self.b3.batch = self.batch3
-        self.batch3.blocked_by = self.batch2
+        BatchesLogic.set_blocked_by(self.batch3, self.batch2)
         self.db.session.commit()
 
         r = self.tc.get("/backend/pending-jobs/")
@@ -103,6 +131,49 @@ class TestWaitingBuilds(CoprsTestCase):
         assert self.b3.id not in ids
         assert {self.b2.id, self.b4.id}.issubset(ids)
 
+    @pytest.mark.usefixtures("f_users", "f_coprs", "f_mock_chroots", "f_builds", "f_db")
+    def test_pending_jobs_delta(self):
+        for bch in self.b3_bc:
+            bch.status = StatusEnum("running")
+        self.db.session.commit()
+
+        def _get_delta(cursor=None):
+            url = "/backend/pending-jobs/delta/"
+            if cursor:
+                url += cursor + "/"
+            r = self.tc.get(url)
+            return json.loads(r.data.decode("utf-8"))
+
+        # first call returns everything
+        data = _get_delta()
+        assert data["full"]
+        assert data["removed"] == []
+        b3_tasks = {bch.task_id for bch in self.b3_bc}
+        assert b3_tasks.issubset({job["task_id"] for job in data["added"]})
+
+        # nothing changed
+        data = _get_delta(data["cursor"])
+        assert not data["full"]
+        assert data["added"] == []
+        assert data["removed"] == []
+
+        self.b3_bc[0].status = StatusEnum("succeeded")
+        for bch in self.b4_bc:
+            bch.status = StatusEnum("pending")
+        self.db.session.commit()
+
+        data = _get_delta(data["cursor"])
+        assert not data["full"]
+        assert data["removed"] == [self.b3_bc[0].task_id]
+        assert {job["task_id"] for job in data["added"]} == \
+            {bch.task_id for bch in self.b4_bc}
+
+        # unknown cursor means full re-sync
+        data = _get_delta("unknown")
+        assert data["full"]
+        assert self.b3_bc[0].task_id not in \
+            {job["task_id"] for job in data["added"]}
+
     @pytest.mark.usefixtures("f_users", "f_coprs", "f_mock_chroots", "f_builds", "f_db")
     def test_build_jobs_performance(self):
         self.b2.source_status = StatusEnum("pending")
@@ -598,5 +669,61 @@ class TestImportingBuilds(CoprsTestCase):
         assert data[0]["srpm_url"] == "http://foo"
         assert data[1]["srpm_url"] == "http://bar"
 
+    def test_importing_lease(self, f_users, f_coprs, f_mock_chroots, f_db):
+        for url in ["foo", "bar", "baz"]:
+            BuildsLogic.create_new_from_url(self.u1, self.c1, url)
+
+        self.tc.post("/backend/update/",
+                         content_type="application/json",
+                         headers=self.auth_header,
+                         data=self.data)
+
+        def _lease(holder, limit):
+            r = self.tc.post("/backend/importing/lease/",
+                             headers=self.auth_header,
+                             json={"holder": holder, "limit": limit,
+                                   "expire": 600})
+            assert r.status_code == 200
+            return [task["srpm_url"] for task in r.json]
+
+        assert _lease("distgit1", 2) == ["http://foo", "http://bar"]
+        # leased to somebody else
+        assert _lease("distgit2", 2) == ["baz"]
+        # the lease is prolonged for the same holder
+        assert _lease("distgit1", 3) == ["http://foo", "http://bar"]
+
+        build = models.Build.query.filter_by(srpm_url="http://foo").one()
+        build.import_lease_expires = int(time.time()) - 1
+        self.db.session.commit()
+        assert _lease("distgit2", 3) == ["http://foo", "baz"]
+
+    def test_importing_lease_owner_limit(self, f_users, f_coprs,
+                                         f_mock_chroots, f_db):
+        for url in ["foo", "bar", "baz"]:
+            BuildsLogic.create_new_from_url(self.u1, self.c1, url)
+        BuildsLogic.create_new_from_url(self.u2, self.c2, "qux")
+        for build in models.Build.query.all():
+            build.source_status = StatusEnum("importing")
+        self.db.session.commit()
+
+        def _lease(holder, limit):
+            r = self.tc.post("/backend/importing/lease/",
+                             headers=self.auth_header,
+                             json={"holder": holder, "limit": limit,
+                                   "expire": 600, "owner_limit": 2})
+            assert r.status_code == 200
+            return [task["build_id"] for task in r.json]
+
+        # the mass rebuild by user1 doesn't starve user2
+        assert _lease("distgit1", 3) == [1, 2, 4]
+        # the held builds are counted into the limit first
+        assert _lease("distgit1", 10) == [1, 2, 4]
+        assert _lease("distgit2", 10) == [3]
+
+    def test_importing_lease_invalid(self, f_users, f_coprs, f_mock_chroots, f_db):
+        r = self.tc.post("/backend/importing/lease/", headers=self.auth_header,
+                         json={"limit": 1})
+        assert r.status_code == 400
+
 
 # pylint: enable=unused-argument
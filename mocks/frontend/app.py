@@ -86,6 +86,16 @@ def backend_pending_jobs():
     debug_output(sorted_build_tasks, 'SENDING:')
     return flask.jsonify(sorted_build_tasks)
 
+@app.route('/backend/pending-jobs/delta/', methods=['GET'])
+@app.route('/backend/pending-jobs/delta/<cursor>/', methods=['GET'])
+def backend_pending_jobs_delta(cursor=None):
+    # we don't remember the snapshots, always send the full queue
+    sorted_build_tasks = sorted(build_task_dict.values(), key=lambda x: x['task_id'])
+    response = {'cursor': None, 'full': True,
+                'added': sorted_build_tasks, 'removed': []}
+    debug_output(response, 'SENDING:')
+    return flask.jsonify(response)
+
 @app.route('/backend/starting_build/', methods=['POST', 'PUT'])
 def backend_starting_build():
     debug_output(flask.request.json, 'RECEIVED:')
@@ -19,6 +19,25 @@ class TestBuildProxy(object):
         assert build.id == 1
         assert build.foo == "bar"
 
+    @mock.patch("copr.v3.proxies.build.STATES_CHUNK", 2)
+    def test_get_states(self, send):
+        def _response(endpoint, data, method):
+            response = mock.Mock(spec=Response)
+            response.json.return_value = {
+                "items": [{"id": build_id, "state": "running", "chroots": {}}
+                          for build_id in data["builds"]],
+                "meta": {},
+            }
+            return response
+        send.side_effect = _response
+
+        build_proxy = BuildProxy(self.config)
+        states = build_proxy.get_states([1, 2, 3])
+        assert [record.id for record in states] == [1, 2, 3]
+        assert states[0].state == "running"
+        assert [call[1]["data"] for call in send.call_args_list] == [
+            {"builds": [1, 2]}, {"builds": [3]}]
+
 
 @mock.patch('copr.v3.proxies.Request.send')
 def test_build_distgit(send):
@@ -2,7 +2,8 @@ import pytest
 from munch import Munch
 from copr.test import mock
 from copr.v3.helpers import wait, succeeded, List
-from copr.v3 import BuildProxy, CoprException
+from copr.v3 import (BuildProxy, CoprException, CoprNoResultException,
+                     CoprRequestException)
 
 
 class TestHelpers(object):
@@ -19,6 +20,18 @@ class TestHelpers(object):
 
 
 class TestWait(object):
+    """
+    Waiting with a frontend that doesn't support watching the builds
+    """
+    @pytest.fixture(autouse=True)
+    def mock_watch(self):
+        with mock.patch("copr.v3.proxies.build.BuildProxy.watch") as watch, \
+                mock.patch("copr.v3.proxies.build.BuildProxy.get_states") \
+                as get_states:
+            watch.side_effect = CoprNoResultException("Page Not Found")
+            get_states.side_effect = CoprNoResultException("Page Not Found")
+            yield watch
+
     @mock.patch("copr.v3.proxies.build.BuildProxy.get")
     def test_wait(self, mock_get):
         build = MunchMock(id=1, state="importing")
@@ -65,5 +78,84 @@ class TestWait(object):
         assert callback.called
 
 
+class TestWaitWatch(object):
+    @mock.patch("time.sleep")
+    @mock.patch("copr.v3.proxies.build.BuildProxy.get")
+    @mock.patch("copr.v3.proxies.build.BuildProxy.watch")
+    def test_wait(self, mock_watch, mock_get, mock_sleep):
+        builds = [MunchMock(id=1, state="importing"),
+                  MunchMock(id=2, state="importing")]
+        mock_watch.side_effect = [
+            [Munch(id=1, state="running"), Munch(id=2, state="pending")],
+            [Munch(id=2, state="failed")],
+            [],
+            [Munch(id=1, state="succeeded")],
+        ]
+        callback = mock.Mock()
+        result = wait(builds, interval=20, callback=callback)
+        assert [build.state for build in result] == ["succeeded", "failed"]
+        assert not mock_get.called
+        assert callback.call_count == 4
+
+        calls = [call[0] for call in mock_watch.call_args_list]
+        assert calls[0][0] == [{"id": 1, "state": None},
+                               {"id": 2, "state": None}]
+        assert calls[1][0] == [{"id": 1, "state": "running"},
+                               {"id": 2, "state": "pending"}]
+        assert calls[2][0] == [{"id": 1, "state": "running"}]
+        assert all(call[1] == {"timeout": 20}
+                   for call in mock_watch.call_args_list)
+        # frontend answered immediately with nothing changed, we sleep instead
+        assert mock_sleep.call_count == 1
+        assert 19 < mock_sleep.call_args[0][0] <= 20
+
+    @mock.patch("copr.v3.proxies.build.BuildProxy.watch")
+    def test_wait_unknown(self, mock_watch):
+        mock_watch.return_value = [Munch(id=1, state="unknown")]
+        with pytest.raises(CoprException) as ex:
+            wait(MunchMock(id=1, state="importing"))
+        assert "Unknown status" in str(ex)
+
+
+class TestWaitStates(object):
+    """
+    Watching is refused (e.g. too many builds), the states are polled
+    """
+    @pytest.fixture(autouse=True)
+    def mock_watch(self):
+        with mock.patch("copr.v3.proxies.build.BuildProxy.watch") as watch:
+            watch.side_effect = CoprRequestException("Too many builds")
+            yield watch
+
+    @mock.patch("time.sleep")
+    @mock.patch("copr.v3.proxies.build.BuildProxy.get")
+    @mock.patch("copr.v3.proxies.build.BuildProxy.get_states")
+    def test_wait(self, mock_get_states, mock_get, mock_sleep):
+        builds = [MunchMock(id=1, state="succeeded", foo="bar"),
+                  MunchMock(id=2, state="importing")]
+        mock_get_states.side_effect = [
+            [Munch(id=1, state="running"), Munch(id=2, state="pending")],
+            [Munch(id=1, state="running"), Munch(id=2, state="failed")],
+            [Munch(id=1, state="succeeded")],
+        ]
+        callback = mock.Mock()
+        result = wait(builds, interval=20, callback=callback)
+        assert [build.state for build in result] == ["succeeded", "failed"]
+        assert result[0].foo == "bar"
+        assert not mock_get.called
+        assert callback.call_count == 3
+        assert mock_sleep.call_count == 2
+
+        calls = [call[0][0] for call in mock_get_states.call_args_list]
+        assert calls == [[1, 2], [1, 2], [1]]
+
+    @mock.patch("copr.v3.proxies.build.BuildProxy.get_states")
+    def test_wait_missing(self, mock_get_states):
+        mock_get_states.return_value = []
+        with pytest.raises(CoprException) as ex:
+            wait(MunchMock(id=1, state="importing"))
+        assert "Builds 1 don't exist" in str(ex)
+
+
 class MunchMock(Munch):
     __proxy__ = BuildProxy({"copr_url": "http://copr", "login": "test", "token": "test"})
@@ -0,0 +1,103 @@
+import pytest
+from requests import Response
+
+from copr.test import mock
+from copr.v3.pagination import all_pages, iterate, next_page, unlimited
+from copr.v3.requests import munchify
+
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+
+OBJECTS = [{"id": i} for i in range(1, 8)]
+LIMIT = 3
+
+
+def _response(request, cursor_support=True):
+    url = urlparse.urlparse(request.url)
+    query = dict(urlparse.parse_qsl(url.query))
+    cursor = query.get("cursor")
+    offset = int(query.get("offset", 0))
+    start = int(cursor) if cursor else offset
+    items = OBJECTS[start:start + LIMIT]
+
+    meta = {"limit": LIMIT, "offset": offset, "order": "id",
+            "order_type": "ASC"}
+    if cursor_support:
+        meta["cursor"] = cursor
+        meta["next_cursor"] = None
+        if len(items) == LIMIT:
+            meta["next_cursor"] = str(start + LIMIT)
+
+    response = mock.Mock(spec=Response)
+    response.json.return_value = {"items": items, "meta": meta}
+    response.request = request
+    return response
+
+
+class FakeSession(object):
+    def __init__(self, cursor_support=True):
+        self.cursor_support = cursor_support
+        self.urls = []
+
+    def send(self, request):
+        self.urls.append(request.url)
+        return _response(request, self.cursor_support)
+
+
+def _first_page(cursor_support=True):
+    request = mock.Mock()
+    request.url = "http://copr/api_3/package/list?ownername=foo&limit=3"
+    return munchify(_response(request, cursor_support))
+
+
+@pytest.mark.parametrize("cursor_support", [True, False])
+def test_next_page(cursor_support):
+    session = FakeSession(cursor_support)
+    page = _first_page(cursor_support)
+    ids = []
+    while page:
+        ids.extend(obj.id for obj in page)
+        page = next_page(page, session)
+    assert ids == list(range(1, 8))
+    if cursor_support:
+        # no request for the empty page, the last one is not full
+        assert len(session.urls) == 2
+        assert "cursor=6" in session.urls[-1]
+        assert "offset" not in session.urls[-1]
+    else:
+        assert len(session.urls) == 3
+        assert "offset=9" in session.urls[-1]
+
+
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_iterate(prefetch):
+    session = FakeSession()
+    with mock.patch("copr.v3.pagination.requests.Session",
+                    return_value=session) as session_cls:
+        ids = [obj.id for obj in iterate(_first_page(), prefetch=prefetch)]
+    assert ids == list(range(1, 8))
+    session_cls.assert_called_once_with()
+    assert len(session.urls) == 2
+
+
+def test_iterate_error():
+    session = mock.Mock()
+    session.send.side_effect = RuntimeError("connection failed")
+    with mock.patch("copr.v3.pagination.requests.Session",
+                    return_value=session):
+        objects = iterate(_first_page())
+        assert [next(objects).id for _ in range(3)] == [1, 2, 3]
+        with pytest.raises(RuntimeError):
+            next(objects)
+
+
+def test_all_pages_and_unlimited():
+    with mock.patch("copr.v3.pagination.requests.Session",
+                    return_value=FakeSession()):
+        assert [obj.id for obj in all_pages(_first_page())] == \
+            list(range(1, 8))
+        assert sorted(obj.id for obj in unlimited(_first_page())) == \
+            list(range(1, 8))
@@ -5,7 +5,8 @@ import os
 import time
 import configparser
 from munch import Munch
-from .exceptions import CoprConfigException, CoprException
+from .exceptions import (CoprConfigException, CoprException,
+                         CoprNoResultException, CoprRequestException)
 
 
 class List(list):
@@ -78,12 +79,39 @@ def bind_proxy(func):
     return wrapper
 
 
+def _get_changed_states(proxy, build_ids, munches, known_states):
+    """
+    Get the states of BUILD_IDS by one request, and return copies of the
+    MUNCHES (dict {build_id: build}) with a state different from KNOWN_STATES
+    """
+    states = proxy.get_states(sorted(build_ids))
+    missing = set(build_ids) - set(record.id for record in states)
+    if missing:
+        raise CoprException("Builds {0} don't exist".format(
+            ", ".join(str(build_id) for build_id in sorted(missing))))
+
+    changed = []
+    for record in states:
+        if known_states[record.id] == record.state:
+            continue
+        build = Munch(munches[record.id])
+        build.state = record.state
+        changed.append(build)
+    return changed
+
+
 def wait(waitable, interval=30, callback=None, timeout=0):
     """
     Wait for a waitable thing to finish. At this point, it is possible to wait only
     for builds, but this function should be enhanced to wait for
     e.g. modules or images, etc in the future
 
+    The build states are watched by one request for all the builds, the
+    frontend answers as soon as some of the builds changes its state (or after
+    `interval` seconds).  If watching isn't possible (older frontend, or too
+    many builds), the states of all the builds are polled by one request per
+    `interval`, and the oldest frontends are polled build by build.
+
     :param Munch/list waitable: A Munch result or list of munches
     :param int interval: How many seconds wait before requesting updated Munches from frontend
     :param callable callback: Callable taking one argument (list of build Munches).
@@ -101,21 +129,57 @@ def wait(waitable, interval=30, callback=None, timeout=0):
     builds = waitable if isinstance(waitable, list) else [waitable]
     watched = set([build.id for build in builds])
     munches = dict((build.id, build) for build in builds)
+    proxies = {}
+    for build in builds:
+        if hasattr(build, "__proxy__"):
+            proxies[build.id] = build.__proxy__
+        else:
+            proxies[build.id] = waitable.__proxy__
+    # We don't trust the states of the given munches, get them all first
+    known_states = dict((build_id, None) for build_id in watched)
+    proxy = proxies[builds[0].id]
+    mode = "watch"
     failed = []
     terminate = time.time() + timeout
 
     while True:
-        for build_id in watched.copy():
-            if hasattr(munches[build_id], "__proxy__"):
-                proxy = munches[build_id].__proxy__
-            else:
-                proxy = waitable.__proxy__
-            build = munches[build_id] = proxy.get(build_id)
+        changed = None
+        if mode == "watch":
+            wait_for = interval
+            if timeout:
+                wait_for = max(0, min(interval, int(terminate - time.time())))
+            started = time.time()
+            try:
+                changed = proxy.watch(
+                    [{"id": build_id, "state": known_states[build_id]}
+                     for build_id in watched],
+                    timeout=wait_for)
+                if not changed:
+                    # Frontend may answer sooner when it is too busy to wait
+                    time.sleep(max(0, wait_for - (time.time() - started)))
+            except (CoprNoResultException, CoprRequestException):
+                # Frontend doesn't support watching (these) builds, poll them
+                mode = "states"
+
+        if mode == "states":
+            try:
+                changed = _get_changed_states(proxy, watched, munches,
+                                              known_states)
+            except CoprNoResultException:
+                mode = "get"
+
+        if changed is None:
+            changed = [proxies[build_id].get(build_id) for build_id in watched]
+
+        for build in changed:
+            build.__proxy__ = proxies[build.id]
+            munches[build.id] = build
+            known_states[build.id] = build.state
 
             if build.state in ["failed"]:
-                failed.append(build_id)
+                failed.append(build.id)
             if build.state in ["succeeded", "skipped", "failed", "canceled"]:
-                watched.remove(build_id)
+                watched.discard(build.id)
             if build.state == "unknown":
                 raise CoprException("Unknown status.")
 
@@ -125,7 +189,8 @@ def wait(waitable, interval=30, callback=None, timeout=0):
             break
         if timeout and time.time() >= terminate:
             raise CoprException("Timeouted")
-        time.sleep(interval)
+        if mode != "watch":
+            time.sleep(interval)
     return list(munches.values())
 
 
@@ -1,6 +1,9 @@
 from __future__ import absolute_import
 
+import threading
+
 import requests
+from .helpers import List
 from .requests import munchify
 
 try:
@@ -11,17 +14,31 @@ except ImportError:
     from urllib.parse import urlencode
 
 
-def next_page(objects):
+def next_page(objects, session=None):
+    """
+    Return the page following the ``objects`` page (an empty list if there is
+    no next page).  If Frontend provides the ``next_cursor``, the next page is
+    selected by cursor, otherwise by offset.  Pass the ``session``
+    (requests.Session) to re-use the connection for multiple pages.
+    """
     request = objects.__response__.request
+    meta = objects.meta
 
-    # Add offset to the previous request URL
     url_parts = list(urlparse.urlparse(request.url))
     query = dict(urlparse.parse_qsl(url_parts[4]))
-    query.update({"offset": objects.meta.offset + objects.meta.limit})
+    if meta.get("next_cursor"):
+        query.pop("offset", None)
+        query.update({"cursor": meta.next_cursor})
+    elif meta.get("cursor"):
+        # We are paginating by cursor, and there's no next page
+        return List(items=[], meta=meta, response=objects.__response__)
+    else:
+        # Add offset to the previous request URL
+        query.update({"offset": meta.offset + meta.limit})
     url_parts[4] = urlencode(query)
     request.url = urlparse.urlunparse(url_parts)
 
-    session = requests.Session()
+    session = session or requests.Session()
     response = session.send(request)
     return munchify(response)
 
@@ -29,19 +46,69 @@ def next_page(objects):
 # @TODO remove all_pages function if unlimited generator is preferred over it
 def all_pages(objects):
     all_objects = []
+    session = requests.Session()
     while objects:
         all_objects.extend(objects)
-        objects = next_page(objects)
+        objects = next_page(objects, session)
     return all_objects
 
 
 def unlimited(objects):
-    if not objects:
-        objects = next_page(objects)
+    session = requests.Session()
+    while True:
+        if not objects:
+            objects = next_page(objects, session)
+
+        if not objects:
+            return
+
+        yield objects.pop()
+
+
+class _PageFetcher(threading.Thread):
+    """
+    Download the page following ``objects`` on background
+    """
+    def __init__(self, objects, session):
+        super(_PageFetcher, self).__init__()
+        self.daemon = True
+        self.objects = objects
+        self.session = session
+        self.page = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.page = next_page(self.objects, self.session)
+        except Exception as ex:  # pylint: disable=broad-except
+            self.error = ex
+
+    def result(self):
+        """ Wait for the page, and return it """
+        self.join()
+        if self.error:
+            raise self.error
+        return self.page
+
+
+def iterate(objects, prefetch=True):
+    """
+    Generate all the objects from the ``objects`` page, and from all the pages
+    following it.  One HTTP session is used for all the requests.  With
+    ``prefetch=True``, the next page is downloaded on background while the
+    objects from the current page are being processed.
+    """
+    session = requests.Session()
+    while objects:
+        fetcher = None
+        if prefetch:
+            fetcher = _PageFetcher(objects, session)
+            fetcher.start()
 
-    if not objects:
-        return
+        for obj in objects:
+            yield obj
 
-    yield objects.pop()
-    for item in unlimited(objects):
-        yield item
+        if fetcher:
+            objects = fetcher.result()
+        else:
+            objects = next_page(objects, session)
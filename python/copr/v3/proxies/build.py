@@ -1,10 +1,15 @@
 from __future__ import absolute_import
 
 import os
+from munch import Munch
 from . import BaseProxy
 from ..requests import FileRequest, munchify, POST
 from ..exceptions import CoprValidationException
-from ..helpers import for_all_methods, bind_proxy
+from ..helpers import List, for_all_methods, bind_proxy
+
+
+# Maximum number of build IDs sent in one get_states() request
+STATES_CHUNK = 5000
 
 
 @for_all_methods(bind_proxy)
@@ -20,6 +25,48 @@ class BuildProxy(BaseProxy):
         response = self.request.send(endpoint=endpoint)
         return munchify(response)
 
+    def watch(self, builds, timeout=30):
+        """
+        Wait (at most `timeout` seconds) until some of the builds changes its
+        state, and return the changed builds.  One request replaces polling
+        of each build separately.
+
+        :param list builds: build Munches (or dicts with the "id" and "state"
+            keys), the state is the last one known to the caller (or None)
+        :param int timeout: how many seconds the frontend should wait for a
+            change, 0 returns the builds with a changed state immediately
+        :return: Munch (list of the changed builds, may be empty)
+        """
+        endpoint = "/build/watch"
+        data = {
+            "builds": [{"id": build["id"], "state": build.get("state")}
+                       for build in builds],
+            "timeout": timeout,
+        }
+        response = self.request.send(endpoint=endpoint, data=data, method=POST)
+        return munchify(response)
+
+    def get_states(self, build_ids):
+        """
+        Return the states of many builds (and their build chroots) at once.
+        One request is sent per `STATES_CHUNK` builds, instead of one
+        request per build.  Non-existing builds are omitted from the result.
+
+        :param list build_ids: list of int
+        :return: Munch (list of compact records with the "id", "state" and
+            "chroots" keys, "chroots" maps the chroot names to their states)
+        """
+        endpoint = "/build/states"
+        build_ids = list(build_ids)
+        items = []
+        response = None
+        for start in range(0, len(build_ids), STATES_CHUNK):
+            data = {"builds": build_ids[start:start + STATES_CHUNK]}
+            response = self.request.send(endpoint=endpoint, data=data,
+                                         method=POST)
+            items.extend(munchify(response))
+        return List(items=items, meta=Munch(), response=response)
+
     def get_source_chroot(self, build_id):
         """
         Return a source build